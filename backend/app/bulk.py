@@ -0,0 +1,135 @@
+"""Streaming CSV and JSONL readers and writers for bulk endpoints.
+
+Uploads are decoded and parsed chunk by chunk, so a file of any size is
+handled with memory proportional to one line. Each record comes back with
+the line it starts on and, instead of failing the whole upload, a per-row
+error message when it cannot be parsed.
+"""
+import codecs
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Iterable, Optional, Sequence
+
+from fastapi import HTTPException, UploadFile
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson"}
+CHUNK_SIZE = 64 * 1024
+
+
+def upload_format(file: UploadFile) -> str:
+    """csv or jsonl, from the uploaded file's extension."""
+    name = (file.filename or "").lower()
+    for extension, fmt in FORMATS.items():
+        if name.endswith(extension):
+            return fmt
+    raise HTTPException(
+        status_code=400,
+        detail=f"Tipo de archivo no permitido. Use: {', '.join(FORMATS)}"
+    )
+
+
+async def _lines(file: UploadFile) -> AsyncIterator[str]:
+    # utf-8-sig drops the BOM spreadsheets put in front of CSV exports
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                yield line.removesuffix("\r")
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8")
+    if pending:
+        yield pending.removesuffix("\r")
+
+
+async def _csv_records(file: UploadFile, columns: Sequence[str]):
+    header = None
+    text, start, quotes = "", 0, 0
+    line_number = 0
+    async for line in _lines(file):
+        line_number += 1
+        if not text:
+            start = line_number
+        text += line + "\n"
+        # A record spans several lines while a quoted field is open
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        record, text, quotes = text, "", 0
+        if not record.strip():
+            continue
+        try:
+            values = next(csv.reader([record]))
+        except csv.Error as exc:
+            yield start, None, f"CSV invalido: {exc}"
+            continue
+        if header is None:
+            header = [value.strip() for value in values]
+            unknown = [name for name in header if name not in columns]
+            if unknown:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Columnas desconocidas: {', '.join(unknown)}. Use: {', '.join(columns)}"
+                )
+            continue
+        if len(values) != len(header):
+            yield start, None, f"Se esperaban {len(header)} columnas y hay {len(values)}"
+            continue
+        # Empty cells leave the field unset
+        yield start, {name: value for name, value in zip(header, values) if value != ""}, None
+    if text:
+        yield start, None, "CSV invalido: comillas sin cerrar"
+
+
+async def _jsonl_records(file: UploadFile, columns: Sequence[str]):
+    line_number = 0
+    async for line in _lines(file):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, f"JSON invalido: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Cada linea debe ser un objeto JSON"
+            continue
+        unknown = [name for name in record if name not in columns]
+        if unknown:
+            yield line_number, None, f"Campos desconocidos: {', '.join(unknown)}"
+            continue
+        yield line_number, record, None
+
+
+def read_records(
+    file: UploadFile, fmt: str, columns: Sequence[str]
+) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Yield ``(line, record, error)`` for every row of an upload.
+
+    CSV files need a header row naming a subset of ``columns``; JSONL files
+    hold one object per line. Exactly one of ``record`` and ``error`` is set.
+    """
+    if fmt == "csv":
+        return _csv_records(file, columns)
+    return _jsonl_records(file, columns)
+
+
+def write_records(fmt: str, columns: Sequence[str], rows: Iterable[Sequence[Any]], header: bool = False) -> str:
+    """Serialize ``rows`` (values in ``columns`` order) as CSV or JSONL text."""
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        if header:
+            writer.writerow(columns)
+        writer.writerows(rows)
+        return out.getvalue()
+    return "".join(
+        json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(",", ":")) + "\n"
+        for row in rows
+    )
@@ -0,0 +1,185 @@
+"""In-process cache for catalog listings.
+
+``GET /products`` and ``GET /categories`` are cached by their query
+parameters. Every catalog mutation calls ``invalidate`` (through
+``app.database.refresh_catalog``), which drops all entries and bumps the
+cache version; a listing computed under an older version is never stored,
+so a read that raced a mutation cannot put stale data back.
+
+Product prices depend on which promotions are running, so the cache also
+expires on its own at the next promotion ``start_date`` or ``end_date``.
+Dates are compared as strings, exactly like the ``BETWEEN`` in the product
+queries, against the current UTC time in SQLite's ``datetime('now')`` format.
+``CATALOG_CACHE_SIZE=0`` disables the cache.
+
+The same two inputs, the database's catalog version counter and the next
+promotion boundary, make up the catalog ETag. Every worker derives the same
+ETag for the same catalog, and ``catalog_etag`` answers a matching
+``If-None-Match`` with 304 before the handler runs or any connection is
+checked out. ``GET /catalog/bootstrap`` keeps its compressed variants
+outside the LRU, labelled with those two inputs (``catalog_key``), so
+listing traffic cannot evict it.
+"""
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Hashable, Optional
+
+from fastapi import HTTPException, Request, Response
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "512"))
+# Sent with every catalog GET; e.g. "public, max-age=60" to let a CDN or the
+# browser reuse responses without revalidating for a minute
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "no-cache")
+
+
+def sqlite_now() -> str:
+    """Current UTC time formatted like SQLite's ``datetime('now')``."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class CatalogCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.version = 0
+        # catalog_version row the current entries were read after
+        self.catalog_version: Optional[int] = None
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        # Next promotion boundary; only meaningful while _expiry_known
+        self._expires_at: Optional[str] = None
+        self._expiry_known = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def expiry_known(self) -> bool:
+        return self._expiry_known
+
+    def _clear(self):
+        self._entries.clear()
+        self.version += 1
+        self._expires_at = None
+        self._expiry_known = False
+
+    def _check_expiry(self):
+        if self._expires_at is not None and sqlite_now() >= self._expires_at:
+            self.expirations += 1
+            self._clear()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        self._check_expiry()
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, version: int, expires_at: Optional[str] = None):
+        """Store ``value`` if nothing was invalidated since ``version`` was read.
+
+        ``expires_at`` is the next promotion boundary as seen by the read
+        that produced ``value``; pass it whenever ``expiry_known`` is false.
+        """
+        if version != self.version:
+            return
+        self.set_expiry(expires_at, version)
+        if not self.enabled:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set_expiry(self, expires_at: Optional[str], version: int):
+        """Record the next promotion boundary read under cache ``version``."""
+        if version == self.version and not self._expiry_known:
+            self._expires_at = expires_at
+            self._expiry_known = True
+
+    def invalidate(self, catalog_version: int, expires_at: Optional[str]):
+        """Drop every entry after a catalog change.
+
+        ``catalog_version`` and ``expires_at`` must have been read after the
+        change committed and before the data that will be cached next.
+        """
+        self.invalidations += 1
+        self._clear()
+        self.catalog_version = catalog_version
+        self.set_expiry(expires_at, self.version)
+
+    def catalog_key(self) -> Optional[tuple[int, Optional[str]]]:
+        """Catalog version and next promotion boundary, or None while they
+        cannot be known without a query (after a change or once a promotion
+        boundary passed)."""
+        self._check_expiry()
+        if self.catalog_version is None or not self._expiry_known:
+            return None
+        return self.catalog_version, self._expires_at
+
+    def etag(self) -> Optional[str]:
+        """ETag of the current catalog, or None while it cannot be known
+        without a query."""
+        key = self.catalog_key()
+        if key is None:
+            return None
+        catalog_version, expires_at = key
+        window = re.sub(r"\D", "", expires_at or "") or "0"
+        return f'W/"catalog-{catalog_version}-{window}"'
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "version": self.version,
+            "catalog_version": self.catalog_version,
+            "expires_at": self._expires_at,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "expirations": self.expirations,
+        }
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip() == "*" or candidate.strip().removeprefix("W/") == opaque
+        for candidate in header.split(",")
+    )
+
+
+async def catalog_etag(request: Request, response: Response):
+    """Conditional GET for catalog endpoints.
+
+    Declare it in the route's ``dependencies`` so it runs before any
+    dependency that checks out a connection.
+    """
+    response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
+    etag = catalog_cache.etag()
+    if etag is None:
+        return
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        raise HTTPException(
+            status_code=304,
+            headers={"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL},
+        )
+    response.headers["ETag"] = etag
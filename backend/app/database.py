@@ -1,205 +1,393 @@
 import os
+import time
+import asyncio
+import logging
 import aiosqlite
-from typing import AsyncGenerator
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, AsyncIterator, Sequence
+from fastapi import HTTPException, status
+from app.pool import ConnectionPool, PoolTimeout
+from app.migrations import migrate
+from app.instrumentation import instrument
+from app.group_commit import GroupCommitter
+from app.snapshot import CatalogSnapshot
+from app.catalog import catalog_cache, sqlite_now
+from app.statements import CATALOG_STATE, EFFECTIVE_PRICE_REFRESH, EFFECTIVE_PRICE_STALE, PROMOTION_NEXT_BOUNDARY
 
 DATABASE_PATH = os.getenv("DATABASE_PATH", "/data/app.db")
 
 if not os.path.exists(os.path.dirname(DATABASE_PATH)) and DATABASE_PATH.startswith("/data"):
     DATABASE_PATH = "app.db"
 
-async def get_db() -> AsyncGenerator[aiosqlite.Connection, None]:
-    db = await aiosqlite.connect(DATABASE_PATH)
+# DATABASE_PATH=":memory:" runs on an ephemeral database that lives only as
+# long as the process: a named database on SQLite's memdb VFS, so that every
+# pooled connection sees the same data, kept alive by an anchor connection
+# that init_db opens and close_pool closes. memdb locks the whole database
+# like a file does: readers never see uncommitted data and wait out a write
+# on busy_timeout. (A shared-cache database locks per table and fails at
+# once instead.)
+DB_IN_MEMORY = DATABASE_PATH == ":memory:"
+if DB_IN_MEMORY:
+    DATABASE_PATH = f"file:/{os.getenv('DB_MEMORY_NAME', 'tutti')}?vfs=memdb"
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+DB_WRITE_TIMEOUT = float(os.getenv("DB_WRITE_TIMEOUT", "30"))
+DB_GROUP_COMMIT_WINDOW_MS = float(os.getenv("DB_GROUP_COMMIT_WINDOW_MS", "2"))
+DB_GROUP_COMMIT_MAX_BATCH = int(os.getenv("DB_GROUP_COMMIT_MAX_BATCH", "64"))
+DB_MIGRATION_LOCK_TIMEOUT = int(os.getenv("DB_MIGRATION_LOCK_TIMEOUT", "120000"))
+# Serve catalog GETs from an in-memory copy of the catalog tables
+DB_CATALOG_SNAPSHOT = os.getenv("DB_CATALOG_SNAPSHOT", "0").lower() in ("1", "true", "yes")
+# How often each worker checks catalog_version for changes made by other
+# workers; 0 disables the check
+DB_CATALOG_POLL_MS = float(os.getenv("DB_CATALOG_POLL_MS", "1000"))
+
+# Connection tuning. journal_mode is persistent and set once by init_db, the
+# rest are per-connection and applied whenever a pooled connection is opened.
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL").upper()
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-20000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+
+if DB_JOURNAL_MODE not in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"):
+    raise ValueError(f"DB_JOURNAL_MODE invalido: {DB_JOURNAL_MODE}")
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"DB_SYNCHRONOUS invalido: {DB_SYNCHRONOUS}")
+
+logger = logging.getLogger(__name__)
+
+_read_pool: ConnectionPool | None = None
+_writer: ConnectionPool | None = None
+_committer: GroupCommitter | None = None
+_catalog: CatalogSnapshot | None = None
+_anchor: aiosqlite.Connection | None = None
+_catalog_watcher: asyncio.Task | None = None
+_price_scheduler: asyncio.Task | None = None
+# Set whenever the catalog is reloaded, so the price scheduler re-reads the
+# next promotion boundary
+_catalog_reloaded = asyncio.Event()
+# How long the price scheduler waits when a boundary cannot be turned into a
+# point in time, or after a failed recompute
+_PRICE_RETRY_SECONDS = 60.0
+
+def _connect() -> aiosqlite.Connection:
+    return aiosqlite.connect(DATABASE_PATH, uri=DB_IN_MEMORY)
+
+async def _apply_pragmas(db: aiosqlite.Connection):
+    await db.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}")
+    await db.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    await db.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+    await db.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+
+async def _connect_reader() -> aiosqlite.Connection:
+    db = await _connect()
     db.row_factory = aiosqlite.Row
-    try:
-        yield db
-    finally:
-        await db.close()
+    await _apply_pragmas(db)
+    await db.execute("PRAGMA query_only = ON")
+    return db
 
-async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                name TEXT NOT NULL,
-                phone TEXT,
-                address TEXT,
-                city TEXT,
-                purchase_volume TEXT,
-                role TEXT NOT NULL DEFAULT 'buyer',
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Add new columns if they don't exist (for existing databases)
-        try:
-            await db.execute("ALTER TABLE users ADD COLUMN city TEXT")
-        except:
-            pass
-        try:
-            await db.execute("ALTER TABLE users ADD COLUMN purchase_volume TEXT")
-        except:
-            pass
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                description TEXT,
-                image_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                price REAL NOT NULL,
-                unit TEXT NOT NULL DEFAULT 'kg',
-                category_id INTEGER,
-                image_url TEXT,
-                image_url_2 TEXT,
-                stock REAL DEFAULT 0,
-                min_order REAL DEFAULT 1,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (category_id) REFERENCES categories(id)
-            )
-        """)
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS promotions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                discount_percent REAL NOT NULL,
-                product_id INTEGER,
-                category_id INTEGER,
-                start_date TIMESTAMP NOT NULL,
-                end_date TIMESTAMP NOT NULL,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (product_id) REFERENCES products(id),
-                FOREIGN KEY (category_id) REFERENCES categories(id)
-            )
-        """)
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                guest_name TEXT,
-                guest_phone TEXT,
-                guest_address TEXT,
-                payment_method TEXT,
-                status TEXT DEFAULT 'pending',
-                total REAL NOT NULL,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        
-        # Add guest columns if they don't exist (for existing databases)
-        try:
-            await db.execute("ALTER TABLE orders ADD COLUMN guest_name TEXT")
-        except:
-            pass
-        try:
-            await db.execute("ALTER TABLE orders ADD COLUMN guest_phone TEXT")
-        except:
-            pass
+async def _connect_writer() -> aiosqlite.Connection:
+    db = await _connect()
+    db.row_factory = aiosqlite.Row
+    await _apply_pragmas(db)
+    return db
+
+def get_read_pool() -> ConnectionPool:
+    global _read_pool
+    if _read_pool is None:
+        _read_pool = ConnectionPool(
+            _connect_reader,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+            name="read",
+        )
+    return _read_pool
+
+def get_writer() -> ConnectionPool:
+    # A single connection owns every write. Requests that need it queue up on
+    # the pool in arrival order instead of fighting over the SQLite lock.
+    global _writer
+    if _writer is None:
+        _writer = ConnectionPool(
+            _connect_writer,
+            min_size=1,
+            max_size=1,
+            acquire_timeout=DB_WRITE_TIMEOUT,
+            name="write",
+        )
+    return _writer
+
+def get_catalog_snapshot() -> CatalogSnapshot | None:
+    global _catalog
+    # An in-memory database gains nothing from a second in-memory copy
+    if _catalog is None and DB_CATALOG_SNAPSHOT and not DB_IN_MEMORY:
+        _catalog = CatalogSnapshot(
+            DATABASE_PATH,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+        )
+    return _catalog
+
+async def open_pool():
+    await get_read_pool().open()
+    await get_writer().open()
+    await refresh_catalog()
+    global _catalog_watcher, _price_scheduler
+    if DB_CATALOG_POLL_MS > 0 and _catalog_watcher is None:
+        _catalog_watcher = asyncio.create_task(watch_catalog())
+    if _price_scheduler is None:
+        _price_scheduler = asyncio.create_task(schedule_prices())
+
+async def _stop(task: asyncio.Task | None):
+    if task is not None:
+        task.cancel()
         try:
-            await db.execute("ALTER TABLE orders ADD COLUMN guest_address TEXT")
-        except:
+            await task
+        except asyncio.CancelledError:
             pass
+
+async def close_pool():
+    global _read_pool, _writer, _committer, _catalog, _anchor, _catalog_watcher, _price_scheduler
+    await _stop(_catalog_watcher)
+    await _stop(_price_scheduler)
+    _catalog_watcher = _price_scheduler = None
+    if _committer is not None:
+        await _committer.close()
+        _committer = None
+    if _catalog is not None:
+        await _catalog.close()
+        _catalog = None
+    if _read_pool is not None:
+        await _read_pool.close()
+        _read_pool = None
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+    if _anchor is not None:
+        await _anchor.close()
+        _anchor = None
+
+def pool_stats() -> dict:
+    return {
+        "journal_mode": "MEMORY" if DB_IN_MEMORY else DB_JOURNAL_MODE,
+        "read": get_read_pool().stats(),
+        "write": get_writer().stats(),
+        "group_commit": get_committer().stats(),
+        "catalog_snapshot": _catalog.stats() if _catalog is not None else None,
+    }
+
+@asynccontextmanager
+async def _checkout(pool: ConnectionPool) -> AsyncIterator[aiosqlite.Connection]:
+    try:
+        db = await pool.acquire()
+    except PoolTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio ocupado, intente de nuevo"
+        )
+    try:
+        yield instrument(db)
+    finally:
+        await pool.release(db)
+
+def read_connection():
+    """Check out a reader outside of FastAPI's dependency injection."""
+    return _checkout(get_read_pool())
+
+def write_connection():
+    """Check out the writer outside of FastAPI's dependency injection."""
+    return _checkout(get_writer())
+
+def get_committer() -> GroupCommitter:
+    global _committer
+    if _committer is None:
+        _committer = GroupCommitter(
+            write_connection,
+            window=DB_GROUP_COMMIT_WINDOW_MS / 1000,
+            max_batch=DB_GROUP_COMMIT_MAX_BATCH,
+        )
+    return _committer
+
+async def submit_write(work):
+    """Run ``work(db)`` on the writer inside a group-committed transaction.
+
+    ``work`` must not commit or roll back; its result is returned once the
+    transaction it was batched into has been committed.
+    """
+    return await get_committer().submit(work)
+
+async def submit_statement(sql: str, params: Sequence[Any] = ()) -> int:
+    """Run a single write statement through ``submit_write``.
+
+    Returns the number of rows it changed, so callers can tell a missing
+    row from a change.
+    """
+    async def work(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute(sql, params)
+        return cursor.rowcount
+    return await submit_write(work)
+
+async def get_read_db() -> AsyncGenerator[aiosqlite.Connection, None]:
+    """Read-only connection from the reader pool."""
+    async with read_connection() as db:
+        yield db
+
+def catalog_connection():
+    """Reader for catalog queries: the in-memory snapshot when it is enabled
+    and built, the reader pool otherwise."""
+    snapshot = get_catalog_snapshot()
+    pool = snapshot.pool if snapshot is not None else None
+    return _checkout(pool or get_read_pool())
+
+async def get_catalog_db() -> AsyncGenerator[aiosqlite.Connection, None]:
+    async with catalog_connection() as db:
+        yield db
+
+async def _catalog_state(db: aiosqlite.Connection | None = None) -> aiosqlite.Row:
+    if db is not None:
+        return await CATALOG_STATE.fetch_one(db)
+    async with read_connection() as db:
+        return await CATALOG_STATE.fetch_one(db)
+
+async def _reload_catalog(state: aiosqlite.Row):
+    snapshot = get_catalog_snapshot()
+    if snapshot is not None:
+        await snapshot.refresh()
+    # Only after the snapshot swap, or a miss could re-cache the old data
+    catalog_cache.invalidate(state['version'], state['boundary'])
+    _catalog_reloaded.set()
+
+async def refresh_catalog(db: aiosqlite.Connection | None = None):
+    """Call after committing a change to categories, products or promotions.
+
+    A handler already holding a connection, reader or writer, passes it as
+    ``db``; checking out a reader while holding another can exhaust the
+    pool under load.
+    """
+    # The version is read before the data is reloaded, so the caches can
+    # only ever be newer than the version they are labelled with
+    await _reload_catalog(await _catalog_state(db))
+
+async def watch_catalog():
+    """Reload the catalog caches when another worker changed the catalog."""
+    while True:
+        await asyncio.sleep(DB_CATALOG_POLL_MS / 1000)
         try:
-            await db.execute("ALTER TABLE orders ADD COLUMN payment_method TEXT")
-        except:
-            pass
-        
-        # Migration: Make user_id nullable for guest orders
-        # Check if user_id column has NOT NULL constraint and fix it
+            version = catalog_cache.version
+            state = await _catalog_state()
+            if state['version'] != catalog_cache.catalog_version:
+                await _reload_catalog(state)
+            elif not catalog_cache.expiry_known:
+                # A promotion boundary passed; learn the next one
+                catalog_cache.set_expiry(state['boundary'], version)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Catalog version check failed")
+
+async def refresh_prices() -> int:
+    """Bring product_effective_price up to date with the running promotions.
+
+    Returns the number of products whose price changed.
+    """
+    async def work(db: aiosqlite.Connection) -> int:
+        cursor = await EFFECTIVE_PRICE_REFRESH.execute(db)
+        return cursor.rowcount
+
+    return await submit_write(work)
+
+async def refresh_stale_prices() -> bool:
+    """Recompute effective prices only if they no longer match the running
+    promotions, e.g. after a restart. Checking is a read; returns whether
+    any price changed.
+    """
+    async with read_connection() as db:
+        stale = (await EFFECTIVE_PRICE_STALE.fetch_one(db))['stale']
+    if not stale or not await refresh_prices():
+        return False
+    await refresh_catalog()
+    return True
+
+def _seconds_until(boundary: str) -> float:
+    try:
+        at = datetime.fromisoformat(boundary)
+    except ValueError:
+        return _PRICE_RETRY_SECONDS
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    seconds = (at - datetime.now(timezone.utc)).total_seconds()
+    # Dates are compared as strings; a boundary that has passed on the clock
+    # but not as a string (e.g. written with a "T") is rechecked later
+    return seconds if seconds > 0 else _PRICE_RETRY_SECONDS
+
+async def schedule_prices():
+    """Recompute effective prices when a promotion starts or ends.
+
+    Sleeps until the next promotion boundary, or until the catalog is
+    reloaded since that may have moved it. Every worker runs one; the
+    recompute only writes rows whose price changed, so the first worker to
+    get there does the work and its catalog_version bump reaches the others
+    through watch_catalog. It starts with ``refresh_stale_prices`` for
+    the boundaries that passed while no worker was running.
+    """
+    try:
+        await refresh_stale_prices()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Effective price check failed")
+    while True:
         try:
-            cursor = await db.execute("PRAGMA table_info(orders)")
-            columns = await cursor.fetchall()
-            for col in columns:
-                if col[1] == 'user_id' and col[3] == 1:  # col[3] is notnull flag
-                    # Need to recreate table to remove NOT NULL constraint
-                    await db.execute("""
-                        CREATE TABLE IF NOT EXISTS orders_new (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            user_id INTEGER,
-                            guest_name TEXT,
-                            guest_phone TEXT,
-                            guest_address TEXT,
-                            payment_method TEXT,
-                            status TEXT DEFAULT 'pending',
-                            total REAL NOT NULL,
-                            notes TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            FOREIGN KEY (user_id) REFERENCES users(id)
-                        )
-                    """)
-                    await db.execute("""
-                        INSERT INTO orders_new (id, user_id, guest_name, guest_phone, guest_address, payment_method, status, total, notes, created_at, updated_at)
-                        SELECT id, user_id, guest_name, guest_phone, guest_address, payment_method, status, total, notes, created_at, updated_at FROM orders
-                    """)
-                    await db.execute("DROP TABLE orders")
-                    await db.execute("ALTER TABLE orders_new RENAME TO orders")
-                    await db.commit()
-                    break
-        except Exception as e:
-            print(f"Migration error (non-critical): {e}")
-            pass
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS order_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                quantity REAL NOT NULL,
-                price REAL NOT NULL,
-                discount REAL DEFAULT 0,
-                FOREIGN KEY (order_id) REFERENCES orders(id),
-                FOREIGN KEY (product_id) REFERENCES products(id)
-            )
-        """)
-        
-        await db.commit()
-        
-        cursor = await db.execute("SELECT COUNT(*) as count FROM users WHERE role = 'admin'")
-        row = await cursor.fetchone()
-        if row['count'] == 0:
-            import bcrypt
-            admin_password = bcrypt.hashpw("admin123".encode(), bcrypt.gensalt()).decode()
-            await db.execute(
-                "INSERT INTO users (email, password_hash, name, role) VALUES (?, ?, ?, ?)",
-                ("admin@tutti.com", admin_password, "Administrador", "admin")
-            )
-            await db.commit()
-        
-        cursor = await db.execute("SELECT COUNT(*) as count FROM categories")
-        row = await cursor.fetchone()
-        if row['count'] == 0:
-            initial_categories = [
-                ("Frutas", "Frutas frescas de la mejor calidad", ""),
-                ("Verduras", "Verduras frescas y saludables", ""),
-                ("Pulpas", "Pulpas de frutas naturales", ""),
-                ("Otros", "Otros productos disponibles", "")
-            ]
-            for name, description, image_url in initial_categories:
-                await db.execute(
-                    "INSERT INTO categories (name, description, image_url) VALUES (?, ?, ?)",
-                    (name, description, image_url)
-                )
-            await db.commit()
+            _catalog_reloaded.clear()
+            async with read_connection() as db:
+                boundary = (await PROMOTION_NEXT_BOUNDARY.fetch_one(db))['boundary']
+            if boundary is None or sqlite_now() < boundary:
+                timeout = _seconds_until(boundary) if boundary is not None else None
+                try:
+                    async with asyncio.timeout(timeout):
+                        await _catalog_reloaded.wait()
+                except TimeoutError:
+                    pass
+                # Woken early by a reload: read the boundary again. Once it
+                # is reached it is not re-read, since a start_date stops
+                # being the next boundary the moment it is reached.
+                if boundary is None or sqlite_now() < boundary:
+                    continue
+            # A promotion is running through its end_date second and stops
+            # the second after, so recompute again once that has passed
+            for attempt in range(2):
+                if attempt:
+                    await asyncio.sleep(1)
+                if await refresh_prices():
+                    await refresh_catalog()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Effective price recompute failed")
+            await asyncio.sleep(_PRICE_RETRY_SECONDS)
+
+async def init_db():
+    """Bring the database schema up to date.
+
+    On an initialized database this is a single SELECT on schema_version;
+    DDL and seeding only run when a migration is pending.
+    """
+    global _anchor
+    started = time.perf_counter()
+    if DB_IN_MEMORY and _anchor is None:
+        _anchor = await _connect()
+    async with _connect() as db:
+        # Other workers may be migrating; wait for them rather than fail
+        await db.execute(f"PRAGMA busy_timeout = {max(DB_BUSY_TIMEOUT, DB_MIGRATION_LOCK_TIMEOUT)}")
+        if not DB_IN_MEMORY:
+            await db.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+        version = await migrate(db)
+    logger.info(
+        "Database %s ready at schema version %s in %.1f ms",
+        DATABASE_PATH, version, (time.perf_counter() - started) * 1000
+    )
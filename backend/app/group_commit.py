@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import logging
+from typing import Any, AsyncContextManager, Awaitable, Callable, TypeVar
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Work = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+def _fail(units: list):
+    """Resume callers whose units will never run."""
+    for _, future in units:
+        if not future.done():
+            future.set_exception(RuntimeError("Group committer closed"))
+
+
+class GroupCommitter:
+    """Merges write transactions from concurrent requests into one commit.
+
+    Callers submit a unit of work, a coroutine function that receives the
+    writer connection and runs its statements without committing. Units that
+    arrive within ``window`` seconds of each other (up to ``max_batch``) run
+    back to back inside a single transaction, each under its own SAVEPOINT,
+    and are made durable by one COMMIT. A unit that raises is rolled back to
+    its savepoint without affecting the others; its caller gets the
+    exception. Callers are only resumed after the COMMIT succeeded.
+    """
+
+    def __init__(
+        self,
+        connection: Callable[[], AsyncContextManager[aiosqlite.Connection]],
+        window: float = 0.002,
+        max_batch: int = 64,
+    ):
+        self._connection = connection
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._batches = 0
+        self._units = 0
+        self._largest_batch = 0
+
+    async def submit(self, work: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            # Start from an empty context so the background task does not keep
+            # the request-scoped state of whichever request happened to start it
+            self._task = asyncio.get_running_loop().create_task(
+                self._run(), context=contextvars.Context()
+            )
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((work, future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                async with asyncio.timeout(timeout):
+                    batch.append(await self._queue.get())
+            except TimeoutError:
+                break
+            except BaseException:
+                _fail(batch)
+                raise
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._commit_batch(batch)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            except BaseException:
+                _fail(batch)
+                raise
+
+    async def _commit_batch(self, batch: list):
+        results = []
+        async with self._connection() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                for work, future in batch:
+                    if future.cancelled():
+                        continue
+                    await db.execute("SAVEPOINT unit")
+                    try:
+                        result = await work(db)
+                    except Exception as exc:
+                        await db.execute("ROLLBACK TO unit")
+                        await db.execute("RELEASE unit")
+                        future.set_exception(exc)
+                        continue
+                    await db.execute("RELEASE unit")
+                    results.append((future, result))
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+
+        self._batches += 1
+        self._units += len(batch)
+        self._largest_batch = max(self._largest_batch, len(batch))
+        for future, result in results:
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self._batches,
+            "units": self._units,
+            "avg_batch": round(self._units / self._batches, 2) if self._batches else 0.0,
+            "largest_batch": self._largest_batch,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue is not None:
+            _fail([self._queue.get_nowait() for _ in range(self._queue.qsize())])
@@ -0,0 +1,138 @@
+"""Idempotency keys for requests that create orders.
+
+A client that may retry a request sends an ``Idempotency-Key`` header,
+the same on every attempt. The first request with a key stores its
+response and a hash of its body in the same transaction that creates the
+order, so either both are committed or neither. A retry with the same key
+within ``IDEMPOTENCY_TTL_SECONDS`` gets the stored response back, found by
+primary key, without the order being priced or inserted again. Reusing a
+key for a different body is a 422.
+
+Keys are scoped: per buyer for ``POST /orders``, and one shared scope for
+guests. A request carrying a key that is already running in this process
+waits for it and then replays its response. Across workers the primary
+key on (scope, key) lets only one of them commit; the others roll their
+order back and replay the stored response.
+
+Only successful responses are stored. A request that failed, say for a
+product out of stock, runs again when retried.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Optional
+
+import aiosqlite
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.database import read_connection
+from app.serialization import JSON_MEDIA_TYPE, dumps
+from app.statements import IDEMPOTENCY_LOOKUP
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+MAX_KEY_LENGTH = 255
+# Set on responses that were replayed rather than produced by the request
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Expired rows deleted by each insert
+PURGE_BATCH = 16
+
+Remember = Callable[[aiosqlite.Connection, dict], Awaitable[None]]
+
+# Keys whose first request is running in this process
+_in_flight: dict[tuple[str, str], asyncio.Event] = {}
+
+
+class KeyTaken(Exception):
+    """Another worker committed a response for the key first."""
+
+
+def request_hash(body: Any) -> str:
+    return hashlib.sha256(dumps(body)).hexdigest()
+
+
+def _check_key(key: str):
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isascii() or not key.isprintable():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key invalida. Use hasta {MAX_KEY_LENGTH} caracteres ASCII"
+        )
+
+
+async def _lookup(db: aiosqlite.Connection | None, scope: str, key: str):
+    if db is not None:
+        return await IDEMPOTENCY_LOOKUP.fetch_one(db, (scope, key))
+    async with read_connection() as db:
+        return await IDEMPOTENCY_LOOKUP.fetch_one(db, (scope, key))
+
+
+def _replay(stored, digest: str) -> Response:
+    if stored['request_hash'] != digest:
+        raise HTTPException(
+            status_code=422,
+            detail="La Idempotency-Key ya se uso con otra solicitud"
+        )
+    return Response(stored['response'], media_type=JSON_MEDIA_TYPE, headers={REPLAYED_HEADER: "true"})
+
+
+def _remember(scope: str, key: str, digest: str) -> Remember:
+    async def remember(db: aiosqlite.Connection, body: dict):
+        await db.execute(
+            """DELETE FROM idempotency_keys WHERE rowid IN (
+                   SELECT rowid FROM idempotency_keys WHERE expires_at <= datetime('now') LIMIT ?
+               )""",
+            (PURGE_BATCH,)
+        )
+        # An expired row for the key is taken over, a live one is left alone
+        cursor = await db.execute(
+            """INSERT INTO idempotency_keys (scope, key, request_hash, response, expires_at)
+               VALUES (?, ?, ?, ?, datetime('now', ?))
+               ON CONFLICT (scope, key) DO UPDATE SET
+                   request_hash = excluded.request_hash,
+                   response = excluded.response,
+                   created_at = CURRENT_TIMESTAMP,
+                   expires_at = excluded.expires_at
+               WHERE idempotency_keys.expires_at <= datetime('now')""",
+            (scope, key, digest, dumps(body), f"+{IDEMPOTENCY_TTL_SECONDS} seconds")
+        )
+        if cursor.rowcount == 0:
+            # Rolls back the unit, and with it the order
+            raise KeyTaken(key)
+    return remember
+
+
+async def idempotent(
+    key: Optional[str],
+    scope: str,
+    body: Any,
+    execute: Callable[[Optional[Remember]], Awaitable[dict]],
+    db: aiosqlite.Connection | None = None,
+) -> Response:
+    """Run ``execute`` at most once for ``key`` and return its JSON response.
+
+    ``execute(remember)`` performs the request in a write unit and, when
+    ``remember`` is not None, must await ``remember(db, response)`` in that
+    same unit. ``body`` is what identifies the request, usually the parsed
+    request body. A handler holding a reader passes it as ``db``.
+    """
+    if key is None:
+        return Response(dumps(await execute(None)), media_type=JSON_MEDIA_TYPE)
+    _check_key(key)
+    digest = request_hash(body)
+
+    while (running := _in_flight.get((scope, key))) is not None:
+        await running.wait()
+    # Registered before the first await, so later duplicates queue up behind
+    _in_flight[(scope, key)] = done = asyncio.Event()
+    try:
+        stored = await _lookup(db, scope, key)
+        if stored is not None:
+            return _replay(stored, digest)
+        try:
+            response = await execute(_remember(scope, key, digest))
+        except KeyTaken:
+            return _replay(await _lookup(db, scope, key), digest)
+        return Response(dumps(response), media_type=JSON_MEDIA_TYPE)
+    finally:
+        del _in_flight[(scope, key)]
+        done.set()
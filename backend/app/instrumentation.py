@@ -0,0 +1,195 @@
+"""Opt-in per-request SQL instrumentation.
+
+With ``DB_INSTRUMENT=1`` every connection checked out of the pools, reader
+or writer, is wrapped so that each statement is counted and timed against
+the current request. Statements slower than ``DB_SLOW_QUERY_MS``
+are logged with their parameters redacted, a request that runs the same
+statement shape more than ``DB_N_PLUS_ONE_THRESHOLD`` times is flagged as a
+likely N+1, and a summary is returned in the ``Server-Timing`` header.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Iterable, Optional
+
+import aiosqlite
+
+DB_INSTRUMENT = os.getenv("DB_INSTRUMENT", "0").lower() in ("1", "true", "yes")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+DB_N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "10"))
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def statement_shape(sql: str) -> str:
+    """Normalize a statement so that calls differing only in values compare equal."""
+    shape = _WHITESPACE.sub(" ", sql).strip()
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    return _PLACEHOLDER_LIST.sub("(?...)", shape)
+
+
+def _redact(params: Any) -> str:
+    if not params:
+        return "[]"
+    return f"[{len(params)} redacted]"
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, sql: str, params: Any, elapsed: float, count: bool = True):
+        self.duration += elapsed
+        if count:
+            self.queries += 1
+            self.shapes[statement_shape(sql)] += 1
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            logger.warning(
+                "Slow query (%.1f ms): %s params=%s",
+                elapsed * 1000, statement_shape(sql), _redact(params)
+            )
+
+    def repeated(self) -> list[tuple[str, int]]:
+        return [
+            (shape, times) for shape, times in self.shapes.most_common()
+            if times > DB_N_PLUS_ONE_THRESHOLD
+        ]
+
+    def server_timing(self) -> str:
+        value = f'db;dur={self.duration * 1000:.2f};desc="{self.queries} queries"'
+        repeated = self.repeated()
+        if repeated:
+            value += f', db-n1;desc="{repeated[0][1]}x same statement"'
+        return value
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("sql_request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor: aiosqlite.Cursor, sql: str, stats: RequestStats):
+        self._cursor = cursor
+        self._sql = sql
+        self._stats = stats
+
+    async def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return await method(*args)
+        finally:
+            self._stats.record(self._sql, None, time.perf_counter() - started, count=False)
+
+    async def fetchone(self):
+        return await self._timed(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await self._timed(self._cursor.fetchall)
+
+    async def fetchmany(self, size: Optional[int] = None):
+        if size is None:
+            return await self._timed(self._cursor.fetchmany)
+        return await self._timed(self._cursor.fetchmany, size)
+
+    async def __aiter__(self):
+        async for row in self._cursor:
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Wraps an aiosqlite connection and reports every statement to ``stats``."""
+
+    def __init__(self, conn: aiosqlite.Connection, stats: RequestStats):
+        self._conn = conn
+        self._stats = stats
+
+    async def execute(self, sql: str, parameters: Optional[Iterable[Any]] = None):
+        started = time.perf_counter()
+        try:
+            cursor = await self._conn.execute(sql, parameters)
+        finally:
+            self._stats.record(sql, parameters, time.perf_counter() - started)
+        return InstrumentedCursor(cursor, sql, self._stats)
+
+    async def executemany(self, sql: str, parameters: Iterable[Iterable[Any]]):
+        parameters = list(parameters)
+        started = time.perf_counter()
+        try:
+            cursor = await self._conn.executemany(sql, parameters)
+        finally:
+            self._stats.record(sql, parameters, time.perf_counter() - started)
+        return InstrumentedCursor(cursor, sql, self._stats)
+
+    async def commit(self):
+        started = time.perf_counter()
+        try:
+            await self._conn.commit()
+        finally:
+            self._stats.record("COMMIT", None, time.perf_counter() - started)
+
+    async def rollback(self):
+        started = time.perf_counter()
+        try:
+            await self._conn.rollback()
+        finally:
+            self._stats.record("ROLLBACK", None, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrument(conn: aiosqlite.Connection):
+    """Wrap ``conn`` when instrumentation is on and a request is being tracked."""
+    stats = _current.get()
+    if stats is None:
+        return conn
+    return InstrumentedConnection(conn, stats)
+
+
+class SQLInstrumentationMiddleware:
+    """ASGI middleware that tracks SQL per request and adds ``Server-Timing``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not DB_INSTRUMENT:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            for shape, times in stats.repeated():
+                logger.warning(
+                    "Possible N+1 in %s %s: %d executions of %s",
+                    scope.get("method"), scope.get("path"), times, shape
+                )
@@ -1,14 +1,30 @@
+import os
+import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.database import init_db
-from app.routers import auth, categories, products, promotions, orders, users, uploads
+from app.database import init_db, open_pool, close_pool, pool_stats
+from app.instrumentation import SQLInstrumentationMiddleware
+from app.statements import statement_stats
+from app.catalog import catalog_cache
+from app.pagination import NEXT_CURSOR_HEADER
+from app.utils.auth import get_admin_user
+from app.routers import auth, catalog, categories, products, promotions, orders, users, uploads
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(levelname)s:     %(name)s - %(message)s"
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
-    yield
+    await open_pool()
+    try:
+        yield
+    finally:
+        await close_pool()
 
 app = FastAPI(
     title="Tutti Services API",
@@ -24,9 +40,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=[NEXT_CURSOR_HEADER],  # Lets browsers read the pagination cursor
 )
 
+app.add_middleware(SQLInstrumentationMiddleware)
+
 app.include_router(auth.router)
+app.include_router(catalog.router)
 app.include_router(categories.router)
 app.include_router(products.router)
 app.include_router(promotions.router)
@@ -38,6 +58,15 @@ app.include_router(uploads.router)
 async def healthz():
     return {"status": "ok"}
 
+@app.get("/healthz/db")
+async def healthz_db(current_user: dict = Depends(get_admin_user)):
+    return {
+        "status": "ok",
+        "pool": pool_stats(),
+        "statements": statement_stats(),
+        "catalog_cache": catalog_cache.stats(),
+    }
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,462 @@
+import asyncio
+import logging
+import sqlite3
+from typing import Awaitable, Callable, Union
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+Step = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+
+async def _add_column(db: aiosqlite.Connection, table: str, column: str, definition: str):
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def _legacy_columns(db: aiosqlite.Connection):
+    # Databases created before these columns existed
+    await _add_column(db, "users", "city", "TEXT")
+    await _add_column(db, "users", "purchase_volume", "TEXT")
+    await _add_column(db, "orders", "guest_name", "TEXT")
+    await _add_column(db, "orders", "guest_phone", "TEXT")
+    await _add_column(db, "orders", "guest_address", "TEXT")
+    await _add_column(db, "orders", "payment_method", "TEXT")
+
+
+async def _nullable_order_user(db: aiosqlite.Connection):
+    # Guest orders need orders.user_id to be nullable. Old databases declared
+    # it NOT NULL, which SQLite can only drop by rebuilding the table.
+    cursor = await db.execute("PRAGMA table_info(orders)")
+    columns = await cursor.fetchall()
+    if not any(col[1] == 'user_id' and col[3] == 1 for col in columns):
+        return
+    await db.execute("""
+        CREATE TABLE orders_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            guest_name TEXT,
+            guest_phone TEXT,
+            guest_address TEXT,
+            payment_method TEXT,
+            status TEXT DEFAULT 'pending',
+            total REAL NOT NULL,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    await db.execute("""
+        INSERT INTO orders_new (id, user_id, guest_name, guest_phone, guest_address, payment_method, status, total, notes, created_at, updated_at)
+        SELECT id, user_id, guest_name, guest_phone, guest_address, payment_method, status, total, notes, created_at, updated_at FROM orders
+    """)
+    await db.execute("DROP TABLE orders")
+    await db.execute("ALTER TABLE orders_new RENAME TO orders")
+
+
+INITIAL_SCHEMA: list[Step] = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        name TEXT NOT NULL,
+        phone TEXT,
+        address TEXT,
+        city TEXT,
+        purchase_volume TEXT,
+        role TEXT NOT NULL DEFAULT 'buyer',
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        description TEXT,
+        image_url TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        price REAL NOT NULL,
+        unit TEXT NOT NULL DEFAULT 'kg',
+        category_id INTEGER,
+        image_url TEXT,
+        image_url_2 TEXT,
+        stock REAL DEFAULT 0,
+        min_order REAL DEFAULT 1,
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES categories(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS promotions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        discount_percent REAL NOT NULL,
+        product_id INTEGER,
+        category_id INTEGER,
+        start_date TIMESTAMP NOT NULL,
+        end_date TIMESTAMP NOT NULL,
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES products(id),
+        FOREIGN KEY (category_id) REFERENCES categories(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        guest_name TEXT,
+        guest_phone TEXT,
+        guest_address TEXT,
+        payment_method TEXT,
+        status TEXT DEFAULT 'pending',
+        total REAL NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity REAL NOT NULL,
+        price REAL NOT NULL,
+        discount REAL DEFAULT 0,
+        FOREIGN KEY (order_id) REFERENCES orders(id),
+        FOREIGN KEY (product_id) REFERENCES products(id)
+    )
+    """,
+    _legacy_columns,
+    _nullable_order_user,
+]
+
+QUERY_INDEXES: list[Step] = [
+    "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_products_category_active_name ON products(category_id, is_active, name)",
+    "CREATE INDEX IF NOT EXISTS idx_promotions_product ON promotions(product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_promotions_category ON promotions(category_id)",
+]
+
+
+# Full-text index over product name and description. External content keeps
+# a single copy of the text in products; the triggers keep the index in step.
+# remove_diacritics makes "limon" match "limón", and the prefix indexes keep
+# type-ahead queries ("pla*") off the full term list.
+PRODUCT_SEARCH: list[Step] = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+]
+
+# Indexes behind the whitelisted sort keys of the paginated lists. SQLite
+# appends the rowid to every index entry, so (filter columns, sort column)
+# also covers the id tiebreaker of the keyset.
+KEYSET_INDEXES: list[Step] = [
+    "CREATE INDEX IF NOT EXISTS idx_products_active_name ON products(is_active, name)",
+    "CREATE INDEX IF NOT EXISTS idx_products_active_price ON products(is_active, price)",
+    "CREATE INDEX IF NOT EXISTS idx_products_active_created ON products(is_active, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_products_category_active_price ON products(category_id, is_active, price)",
+    "CREATE INDEX IF NOT EXISTS idx_products_category_active_created ON products(category_id, is_active, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_user_status_created ON orders(user_id, status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_users_name ON users(name)",
+    "CREATE INDEX IF NOT EXISTS idx_users_role_name ON users(role, name)",
+    "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
+]
+
+
+async def _catalog_version(db: aiosqlite.Connection):
+    # One row counting catalog changes. Every worker compares it with the
+    # version its caches were built from, see app.database.watch_catalog.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    await db.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+    for table in ("categories", "products", "promotions"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            await db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_catalog_version
+                AFTER {event} ON {table} BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+
+
+_RUNNING_PROMOTION = "is_active = 1 AND datetime('now') BETWEEN start_date AND end_date"
+
+# Best running discount of one product, for triggers that touch a single row
+_PRODUCT_DISCOUNT = f"""
+    SELECT p.id, p.price,
+           (SELECT MAX(discount_percent) FROM promotions
+            WHERE (product_id = p.id OR category_id = p.category_id) AND {_RUNNING_PROMOTION}) AS discount_percent
+    FROM products p
+"""
+
+# Same for many products at once: the best product and category discounts
+# are aggregated once and joined, instead of searching promotions per product.
+# app.statements builds its price queries on this text too, so the rule
+# lives in one place.
+CATALOG_DISCOUNTS = f"""
+    SELECT p.id, p.price, MAX(COALESCE(bp.d, bc.d), COALESCE(bc.d, bp.d)) AS discount_percent
+    FROM products p
+    LEFT JOIN (SELECT product_id, MAX(discount_percent) AS d FROM promotions
+               WHERE {_RUNNING_PROMOTION} GROUP BY product_id) bp ON bp.product_id = p.id
+    LEFT JOIN (SELECT category_id, MAX(discount_percent) AS d FROM promotions
+               WHERE {_RUNNING_PROMOTION} GROUP BY category_id) bc ON bc.category_id = p.category_id
+"""
+
+
+def _effective_price_upsert(discounts: str, scope: str) -> str:
+    # Rows are only written when the values actually changed
+    return f"""
+        INSERT INTO product_effective_price (product_id, discount_percent, final_price)
+        SELECT id, discount_percent,
+               CASE WHEN discount_percent THEN price * (1 - discount_percent / 100) ELSE price END
+        FROM ({discounts} WHERE {scope}) WHERE 1
+        ON CONFLICT (product_id) DO UPDATE SET
+            discount_percent = excluded.discount_percent,
+            final_price = excluded.final_price
+        WHERE discount_percent IS NOT excluded.discount_percent
+           OR final_price IS NOT excluded.final_price
+    """
+
+
+# Recomputes every product's effective price, writing only the rows whose
+# discount changed. Migration 7 fills the table with it and
+# app.statements.EFFECTIVE_PRICE_REFRESH reruns it when a promotion starts
+# or ends.
+EFFECTIVE_PRICE_REFRESH_SQL = _effective_price_upsert(CATALOG_DISCOUNTS, "1")
+
+
+# Each product's running discount and final price, so reads join on the
+# primary key instead of evaluating the promotions subquery per row.
+# Triggers keep it current when products or promotions change; the passage
+# of time (a promotion starting or ending) is handled by
+# app.database.schedule_prices.
+EFFECTIVE_PRICES: list[Step] = [
+    """
+    CREATE TABLE IF NOT EXISTS product_effective_price (
+        product_id INTEGER PRIMARY KEY REFERENCES products(id),
+        discount_percent REAL,
+        final_price REAL NOT NULL
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_insert_effective_price AFTER INSERT ON products BEGIN
+        {_effective_price_upsert(_PRODUCT_DISCOUNT, "p.id = new.id")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_update_effective_price
+    AFTER UPDATE OF price, category_id ON products BEGIN
+        {_effective_price_upsert(_PRODUCT_DISCOUNT, "p.id = new.id")};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_delete_effective_price AFTER DELETE ON products BEGIN
+        DELETE FROM product_effective_price WHERE product_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS promotions_insert_effective_price AFTER INSERT ON promotions BEGIN
+        {_effective_price_upsert(CATALOG_DISCOUNTS, "p.id = new.product_id OR p.category_id = new.category_id")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS promotions_update_effective_price AFTER UPDATE ON promotions BEGIN
+        {_effective_price_upsert(
+            CATALOG_DISCOUNTS,
+            "p.id IN (old.product_id, new.product_id) OR p.category_id IN (old.category_id, new.category_id)"
+        )};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS promotions_delete_effective_price AFTER DELETE ON promotions BEGIN
+        {_effective_price_upsert(CATALOG_DISCOUNTS, "p.id = old.product_id OR p.category_id = old.category_id")};
+    END
+    """,
+    EFFECTIVE_PRICE_REFRESH_SQL,
+    # Prices that change because a promotion started or ended are catalog
+    # changes too
+    *(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS product_effective_price_{event.lower()}_catalog_version
+        AFTER {event} ON product_effective_price BEGIN
+            UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+        END
+        """
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ),
+]
+
+
+# Filters of GET /orders; created_at ranges on their own, by user and by
+# status use the indexes of migrations 2 and 5
+ORDER_FILTER_INDEXES: list[Step] = [
+    "CREATE INDEX IF NOT EXISTS idx_orders_payment_created ON orders(payment_method, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_status_payment_created ON orders(status, payment_method, created_at)",
+]
+
+
+# Stored responses of requests sent with an Idempotency-Key, see
+# app/idempotency.py. Expired rows are deleted a few at a time on insert.
+IDEMPOTENCY_KEYS: list[Step] = [
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        response BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (scope, key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at)",
+]
+
+
+async def _seed_defaults(db: aiosqlite.Connection):
+    cursor = await db.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+    if (await cursor.fetchone())[0] == 0:
+        import bcrypt
+        # bcrypt is deliberately slow; keep it off the event loop
+        admin_password = await asyncio.to_thread(
+            lambda: bcrypt.hashpw("admin123".encode(), bcrypt.gensalt()).decode()
+        )
+        await db.execute(
+            "INSERT INTO users (email, password_hash, name, role) VALUES (?, ?, ?, ?)",
+            ("admin@tutti.com", admin_password, "Administrador", "admin")
+        )
+
+    cursor = await db.execute("SELECT COUNT(*) FROM categories")
+    if (await cursor.fetchone())[0] == 0:
+        await db.executemany(
+            "INSERT INTO categories (name, description, image_url) VALUES (?, ?, ?)",
+            [
+                ("Frutas", "Frutas frescas de la mejor calidad", ""),
+                ("Verduras", "Verduras frescas y saludables", ""),
+                ("Pulpas", "Pulpas de frutas naturales", ""),
+                ("Otros", "Otros productos disponibles", ""),
+            ]
+        )
+
+
+# Ordered list of (version, description, steps). Append new entries at the
+# end; never edit a migration that has already shipped. Every step must be
+# safe to run against a database that already has the change.
+MIGRATIONS: list[tuple[int, str, list[Step]]] = [
+    (1, "initial schema", INITIAL_SCHEMA),
+    (2, "indexes for hot queries", QUERY_INDEXES),
+    (3, "default admin and categories", [_seed_defaults]),
+    (4, "full-text product search", PRODUCT_SEARCH),
+    (5, "indexes for paginated lists", KEYSET_INDEXES),
+    (6, "catalog version counter", [_catalog_version]),
+    (7, "materialized effective prices", EFFECTIVE_PRICES),
+    (8, "indexes for order filters", ORDER_FILTER_INDEXES),
+    (9, "idempotency keys", IDEMPOTENCY_KEYS),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    try:
+        cursor = await db.execute("SELECT MAX(version) FROM schema_version")
+    except sqlite3.OperationalError:
+        return 0
+    row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def migrate(db: aiosqlite.Connection) -> int:
+    """Apply pending migrations and return the schema version.
+
+    Each migration runs in its own BEGIN IMMEDIATE transaction and re-reads
+    the version after taking the write lock, so several workers booting at
+    once apply every migration exactly once; the others wait on busy_timeout
+    and then find nothing left to do.
+    """
+    version = await get_schema_version(db)
+    while version < LATEST_VERSION:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            version = await get_schema_version(db)
+            pending = [m for m in MIGRATIONS if m[0] > version]
+            if not pending:
+                await db.commit()
+                break
+            number, description, steps = pending[0]
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+            await db.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (number, description)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception("Migration after version %s failed", version)
+            raise
+        logger.info("Applied migration %s: %s", number, description)
+        version = number
+
+    return version
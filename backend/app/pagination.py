@@ -0,0 +1,60 @@
+"""Keyset pagination helpers for the list endpoints.
+
+List endpoints accept ``limit``, an opaque ``cursor`` and a ``sort`` key
+from a per-endpoint whitelist (``-`` in front sorts descending). A page is
+read with ``WHERE (sort columns, id) > (last row's values)`` instead of an
+OFFSET, so every page costs the same index seek however deep it is. When
+there are more rows the response carries the cursor for the next page in
+the ``X-Next-Cursor`` header; without ``limit`` and ``cursor`` the endpoints
+return the full list as before.
+"""
+import base64
+import json
+from typing import Any, Optional
+
+from fastapi import HTTPException, Response
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def parse_sort(value: Optional[str], allowed, default: str) -> tuple[str, bool]:
+    """Validate ``sort`` against ``allowed`` and return (key, descending)."""
+    value = value or default
+    key = value[1:] if value.startswith("-") else value
+    if key not in allowed:
+        options = ", ".join(name for key in allowed for name in (key, f"-{key}"))
+        raise HTTPException(status_code=400, detail=f"Orden invalido. Opciones: {options}")
+    return key, value.startswith("-")
+
+
+def page_size(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """Rows per page, or None for the unpaged list."""
+    if limit is None and cursor is None:
+        return None
+    return limit or DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(sort: str, values: list) -> str:
+    raw = json.dumps([sort, values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], sort: str, size: int) -> Optional[list]:
+    """Key values stored in ``cursor``; it must come from the same sort."""
+    if cursor is None:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor invalido")
+    if cursor_sort != sort or not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor invalido para este orden")
+    return values
+
+
+def set_next_cursor(response: Response, sort: str, next_key: Optional[list[Any]]):
+    if next_key is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, next_key)
@@ -0,0 +1,170 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+import aiosqlite
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the acquire timeout."""
+
+
+class PoolClosed(Exception):
+    """Raised when acquiring from a pool that has been shut down."""
+
+
+class ConnectionPool:
+    """Async pool of long-lived aiosqlite connections.
+
+    Each aiosqlite connection owns a worker thread, so opening one per request
+    is expensive. The pool keeps up to ``max_size`` connections open, creates
+    them lazily above ``min_size`` and validates each one on checkout.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Awaitable[aiosqlite.Connection]],
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 10.0,
+        name: str = "db",
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect
+        self._idle: list[aiosqlite.Connection] = []
+        self._in_use: set[aiosqlite.Connection] = set()
+        self._slots = asyncio.Semaphore(max_size)
+        self._closed = False
+        self._opened = False
+        self._lock = asyncio.Lock()
+        self._acquired_total = 0
+        self._created_total = 0
+        self._discarded_total = 0
+        self._timeouts_total = 0
+        self._wait_time_total = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use)
+
+    async def open(self) -> None:
+        async with self._lock:
+            if self._opened:
+                return
+            for _ in range(self.min_size - len(self._idle)):
+                self._idle.append(await self._new_connection())
+            self._opened = True
+
+    async def _new_connection(self) -> aiosqlite.Connection:
+        conn = await self._connect()
+        self._created_total += 1
+        return conn
+
+    async def _discard(self, conn: aiosqlite.Connection, count: bool = True) -> None:
+        if count:
+            self._discarded_total += 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def _is_healthy(self, conn: aiosqlite.Connection) -> bool:
+        try:
+            cursor = await conn.execute("SELECT 1")
+            await cursor.close()
+            return True
+        except (sqlite3.Error, ValueError):
+            return False
+
+    async def acquire(self) -> aiosqlite.Connection:
+        if self._closed:
+            raise PoolClosed(f"Pool '{self.name}' is closed")
+        if not self._opened:
+            await self.open()
+
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.acquire_timeout):
+                await self._slots.acquire()
+        except TimeoutError:
+            self._timeouts_total += 1
+            raise PoolTimeout(
+                f"Timed out after {self.acquire_timeout}s waiting for a '{self.name}' connection"
+            ) from None
+        self._wait_time_total += time.perf_counter() - started
+
+        try:
+            conn = None
+            while self._idle:
+                candidate = self._idle.pop()
+                if await self._is_healthy(candidate):
+                    conn = candidate
+                    break
+                await self._discard(candidate)
+            if conn is None:
+                conn = await self._new_connection()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        self._in_use.add(conn)
+        self._acquired_total += 1
+        return conn
+
+    async def release(self, conn: aiosqlite.Connection) -> None:
+        if conn not in self._in_use:
+            return
+        self._in_use.discard(conn)
+        try:
+            if self._closed:
+                await self._discard(conn, count=False)
+                return
+            try:
+                # Never hand out a connection with a half-finished transaction
+                if conn.in_transaction:
+                    await conn.rollback()
+            except (sqlite3.Error, ValueError):
+                await self._discard(conn)
+                return
+            self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": len(self._in_use),
+            "closed": self._closed,
+            "acquired_total": self._acquired_total,
+            "created_total": self._created_total,
+            "discarded_total": self._discarded_total,
+            "timeouts_total": self._timeouts_total,
+            "avg_wait_ms": round(self._wait_time_total / self._acquired_total * 1000, 3)
+            if self._acquired_total else 0.0,
+        }
+
+    async def close(self) -> None:
+        """Close idle connections now; connections still checked out are closed on release."""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn, count=False)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
 import aiosqlite
-from app.database import get_db
+from app.database import get_read_db, submit_statement, submit_write
 from app.utils.auth import (
     verify_password, 
     get_password_hash, 
@@ -46,7 +46,7 @@ class ChangePasswordRequest(BaseModel):
     new_password: str
 
 @router.post("/login", response_model=TokenResponse)
-async def login(request: LoginRequest, db: aiosqlite.Connection = Depends(get_db)):
+async def login(request: LoginRequest, db: aiosqlite.Connection = Depends(get_read_db)):
     cursor = await db.execute(
         "SELECT id, email, password_hash, name, phone, address, role, is_active FROM users WHERE email = ?",
         (request.email,)
@@ -87,25 +87,28 @@ async def login(request: LoginRequest, db: aiosqlite.Connection = Depends(get_db
     )
 
 @router.post("/register", response_model=TokenResponse)
-async def register(request: RegisterRequest, db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("SELECT id FROM users WHERE email = ?", (request.email,))
-    existing = await cursor.fetchone()
+async def register(request: RegisterRequest):
+    # Hashed before the write, which only takes the writer for the insert
+    password_hash = get_password_hash(request.password)
     
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El email ya esta registrado"
+    async def write(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute("SELECT id FROM users WHERE email = ?", (request.email,))
+        existing = await cursor.fetchone()
+        
+        if existing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El email ya esta registrado"
+            )
+        
+        cursor = await db.execute(
+            """INSERT INTO users (email, password_hash, name, phone, address, role) 
+               VALUES (?, ?, ?, ?, ?, 'buyer')""",
+            (request.email, password_hash, request.name, request.phone, request.address)
         )
+        return cursor.lastrowid
     
-    password_hash = get_password_hash(request.password)
-    
-    cursor = await db.execute(
-        """INSERT INTO users (email, password_hash, name, phone, address, role) 
-           VALUES (?, ?, ?, ?, ?, 'buyer')""",
-        (request.email, password_hash, request.name, request.phone, request.address)
-    )
-    await db.commit()
-    user_id = cursor.lastrowid
+    user_id = await submit_write(write)
     
     access_token = create_access_token(data={"user_id": user_id, "role": "buyer"})
     
@@ -137,7 +140,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 async def update_profile(
     request: UpdateProfileRequest,
     current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
     updates = []
     values = []
@@ -154,12 +157,9 @@ async def update_profile(
     
     if updates:
         values.append(current_user['id'])
-        await db.execute(
-            f"UPDATE users SET {', '.join(updates)} WHERE id = ?",
-            values
-        )
-        await db.commit()
+        await submit_statement(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", values)
     
+    # The reader the auth dependency already holds
     cursor = await db.execute(
         "SELECT id, email, name, phone, address, role FROM users WHERE id = ?",
         (current_user['id'],)
@@ -179,7 +179,7 @@ async def update_profile(
 async def change_password(
     request: ChangePasswordRequest,
     current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
     cursor = await db.execute(
         "SELECT password_hash FROM users WHERE id = ?",
@@ -194,10 +194,9 @@ async def change_password(
         )
     
     new_hash = get_password_hash(request.new_password)
-    await db.execute(
+    await submit_statement(
         "UPDATE users SET password_hash = ? WHERE id = ?",
         (new_hash, current_user['id'])
     )
-    await db.commit()
     
     return {"message": "Contrasena actualizada exitosamente"}
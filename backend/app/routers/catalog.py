@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, Request, Response
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+from app.database import catalog_connection
+from app.catalog import catalog_cache, catalog_etag
+from app.statements import CATEGORY_LIST, PROMOTION_LIST_ACTIVE, PROMOTION_NEXT_BOUNDARY, product_list
+from app.serialization import compressed_response, dumps, precompress
+from app.routers.categories import CategoryResponse
+from app.routers.products import ProductResponse
+from app.routers.promotions import PromotionResponse
+
+router = APIRouter(prefix="/catalog", tags=["Catalogo"])
+
+# Latest bootstrap as (catalog_key, compressed variants). Kept out of the
+# catalog_cache LRU so that listing traffic cannot evict it
+_bootstrap: Optional[tuple[tuple, dict[str, bytes]]] = None
+# One build at a time; requests arriving meanwhile wait for its result
+_bootstrap_lock = asyncio.Lock()
+
+class CatalogBootstrap(BaseModel):
+    categories: List[CategoryResponse]
+    products: List[ProductResponse]
+    promotions: List[PromotionResponse]
+
+async def _build_bootstrap() -> dict[str, bytes]:
+    global _bootstrap
+    version = catalog_cache.version
+    boundary = None
+    async with catalog_connection() as db:
+        statement, params = product_list(None, None, True)
+        document = {
+            "categories": await CATEGORY_LIST.fetch_all(db),
+            "products": await statement.fetch_all(db, params),
+            "promotions": await PROMOTION_LIST_ACTIVE.fetch_all(db),
+        }
+        if not catalog_cache.expiry_known:
+            boundary = (await PROMOTION_NEXT_BOUNDARY.fetch_one(db))['boundary']
+
+    body = dumps(document)
+    if not catalog_cache.enabled:
+        # Nowhere to keep it, so compressing would be wasted
+        return {"identity": body}
+    variants = await asyncio.to_thread(precompress, body)
+    # Like catalog_cache.put: not kept if the catalog changed while it was read
+    if version == catalog_cache.version:
+        catalog_cache.set_expiry(boundary, version)
+        key = catalog_cache.catalog_key()
+        if key is not None:
+            _bootstrap = (key, variants)
+    return variants
+
+def _cached_bootstrap() -> Optional[dict[str, bytes]]:
+    if _bootstrap is None or not catalog_cache.enabled:
+        return None
+    key, variants = _bootstrap
+    return variants if key == catalog_cache.catalog_key() else None
+
+@router.get("/bootstrap", response_model=CatalogBootstrap, dependencies=[Depends(catalog_etag)])
+async def get_catalog_bootstrap(request: Request, response: Response):
+    """Categories, active products and running promotions in one document.
+
+    Built and compressed once per catalog version, and served as stored.
+    """
+    variants = _cached_bootstrap()
+    if variants is None and not catalog_cache.enabled:
+        variants = await _build_bootstrap()
+    elif variants is None:
+        async with _bootstrap_lock:
+            variants = _cached_bootstrap() or await _build_bootstrap()
+    return compressed_response(variants, request, response)
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from pydantic import BaseModel
 from typing import List
 import aiosqlite
-from app.database import get_db
+from app.database import (
+    get_read_db, get_catalog_db, catalog_connection, refresh_catalog, submit_statement, submit_write
+)
+from app.catalog import catalog_cache, catalog_etag
 from app.utils.auth import get_current_user, get_admin_user
+from app.statements import CATEGORY_LIST, CATEGORY_BY_ID, PROMOTION_NEXT_BOUNDARY
+from app.serialization import dumps, json_response
 
 router = APIRouter(prefix="/categories", tags=["Categorias"])
 
@@ -23,45 +28,45 @@ class CategoryResponse(BaseModel):
     description: str | None
     image_url: str | None
 
-@router.get("", response_model=List[CategoryResponse])
-async def get_categories(db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("SELECT id, name, description, image_url FROM categories ORDER BY name")
-    rows = await cursor.fetchall()
-    return [CategoryResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        image_url=row['image_url']
-    ) for row in rows]
+@router.get("", response_model=List[CategoryResponse], dependencies=[Depends(catalog_etag)])
+async def get_categories(response: Response):
+    body = catalog_cache.get(("categories",))
+    if body is not None:
+        return json_response(body, response)
+    
+    version = catalog_cache.version
+    boundary = None
+    async with catalog_connection() as db:
+        body = dumps(await CATEGORY_LIST.fetch_all(db))
+        if not catalog_cache.expiry_known:
+            boundary = (await PROMOTION_NEXT_BOUNDARY.fetch_one(db))['boundary']
+    
+    catalog_cache.put(("categories",), body, version, boundary)
+    return json_response(body, response)
 
-@router.get("/{category_id}", response_model=CategoryResponse)
-async def get_category(category_id: int, db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute(
-        "SELECT id, name, description, image_url FROM categories WHERE id = ?",
-        (category_id,)
-    )
-    row = await cursor.fetchone()
+@router.get("/{category_id}", response_model=CategoryResponse, dependencies=[Depends(catalog_etag)])
+async def get_category(category_id: int, db: aiosqlite.Connection = Depends(get_catalog_db)):
+    row = await CATEGORY_BY_ID.fetch_one(db, (category_id,))
     if not row:
         raise HTTPException(status_code=404, detail="Categoria no encontrada")
-    return CategoryResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        image_url=row['image_url']
-    )
+    return CategoryResponse(**row)
 
 @router.post("", response_model=CategoryResponse)
 async def create_category(
     category: CategoryCreate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute(
-        "INSERT INTO categories (name, description, image_url) VALUES (?, ?, ?)",
-        (category.name, category.description, category.image_url)
-    )
-    await db.commit()
-    category_id = cursor.lastrowid
+    async def write(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute(
+            "INSERT INTO categories (name, description, image_url) VALUES (?, ?, ?)",
+            (category.name, category.description, category.image_url)
+        )
+        return cursor.lastrowid
+    
+    category_id = await submit_write(write)
+    # The reader the auth dependency already holds
+    await refresh_catalog(db)
     
     return CategoryResponse(
         id=category_id,
@@ -75,12 +80,8 @@ async def update_category(
     category_id: int,
     category: CategoryUpdate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM categories WHERE id = ?", (category_id,))
-    if not await cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Categoria no encontrada")
-    
     updates = []
     values = []
     
@@ -96,36 +97,29 @@ async def update_category(
     
     if updates:
         values.append(category_id)
-        await db.execute(
-            f"UPDATE categories SET {', '.join(updates)} WHERE id = ?",
-            values
-        )
-        await db.commit()
+        if not await submit_statement(f"UPDATE categories SET {', '.join(updates)} WHERE id = ?", values):
+            raise HTTPException(status_code=404, detail="Categoria no encontrada")
+        await refresh_catalog(db)
     
-    cursor = await db.execute(
-        "SELECT id, name, description, image_url FROM categories WHERE id = ?",
-        (category_id,)
-    )
-    row = await cursor.fetchone()
-    return CategoryResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        image_url=row['image_url']
-    )
+    row = await CATEGORY_BY_ID.fetch_one(db, (category_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Categoria no encontrada")
+    
+    return CategoryResponse(**row)
 
 @router.delete("/{category_id}")
 async def delete_category(
     category_id: int,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM categories WHERE id = ?", (category_id,))
-    if not await cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Categoria no encontrada")
+    async def write(db: aiosqlite.Connection) -> int:
+        await db.execute("UPDATE products SET category_id = NULL WHERE category_id = ?", (category_id,))
+        cursor = await db.execute("DELETE FROM categories WHERE id = ?", (category_id,))
+        return cursor.rowcount
     
-    await db.execute("UPDATE products SET category_id = NULL WHERE category_id = ?", (category_id,))
-    await db.execute("DELETE FROM categories WHERE id = ?", (category_id,))
-    await db.commit()
+    if not await submit_write(write):
+        raise HTTPException(status_code=404, detail="Categoria no encontrada")
+    await refresh_catalog(db)
     
     return {"message": "Categoria eliminada exitosamente"}
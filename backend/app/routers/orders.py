@@ -1,12 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, List, Optional
+from datetime import date, datetime, timedelta, timezone
+import json
 import aiosqlite
-from app.database import get_db
+from app.database import get_read_db, refresh_catalog, submit_write
+from app.idempotency import Remember, idempotent
 from app.utils.auth import get_current_user, get_admin_user
+from app.statements import (
+    ORDER_BY_ID,
+    ORDER_ITEMS_BY_ORDER,
+    ORDER_ITEMS_BY_ORDERS,
+    ORDER_SORTS,
+    ORDER_STATUSES_BY_IDS,
+    ORDER_STOCK_RELEASE,
+    ORDER_STOCK_RESERVE,
+    ORDER_STOCK_SHORTAGES,
+    PRODUCTS_FOR_ORDER,
+    item_subtotal,
+    map_order_item,
+    order_list,
+)
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, page_size, parse_sort, set_next_cursor
+from app.serialization import json_response
+from app.streaming import check_stream, stream_json_array
 
 router = APIRouter(prefix="/orders", tags=["Pedidos"])
 
+ORDER_STATUSES = ['pending', 'confirmed', 'preparing', 'ready', 'delivered', 'cancelled']
+# Items per INSERT; five parameters each stays under SQLite's old limit of 999
+ORDER_ITEM_BATCH = 100
+
 class OrderItemCreate(BaseModel):
     product_id: int
     quantity: float
@@ -67,97 +91,319 @@ class OrderResponse(BaseModel):
 class OrderStatusUpdate(BaseModel):
     status: str
 
+class BulkOrderStatusUpdate(BaseModel):
+    order_ids: List[int]
+    status: str
+
+class OrderStatusResult(BaseModel):
+    order_id: int
+    success: bool
+    error: str | None = None
+
+class BulkOrderStatusResult(BaseModel):
+    status: str
+    updated: int
+    results: List[OrderStatusResult]
+
+async def _load_order(db: aiosqlite.Connection, order_id: int) -> dict | None:
+    order = await ORDER_BY_ID.fetch_one(db, (order_id,))
+    if order is not None:
+        order['items'] = await ORDER_ITEMS_BY_ORDER.fetch_all(db, (order_id,))
+    return order
+
+def _created_bound(value: Optional[str], name: str, inclusive_end: bool = False) -> Optional[str]:
+    """A date or date-time filter as a ``created_at`` value (UTC, SQLite format).
+
+    For the end of a range the next day or second is returned, so that
+    ``created_at < bound`` includes the whole day or second given.
+    """
+    if value is None:
+        return None
+    try:
+        moment, step = datetime.combine(date.fromisoformat(value), datetime.min.time()), timedelta(days=1)
+    except ValueError:
+        try:
+            moment, step = datetime.fromisoformat(value).replace(microsecond=0), timedelta(seconds=1)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{name} invalido. Use AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS"
+            )
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    if inclusive_end:
+        moment += step
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+async def _attach_items(db: aiosqlite.Connection, orders: list):
+    """Set ``items`` on each of ``orders`` with a single query."""
+    if not orders:
+        return
+    items = {order['id']: [] for order in orders}
+    for row in await ORDER_ITEMS_BY_ORDERS.fetch_all(db, (json.dumps(list(items)),)):
+        items[row['order_id']].append(map_order_item(row))
+    for order in orders:
+        order['items'] = items[order['id']]
+
+async def _place_order(
+    items: List[OrderItemCreate],
+    notes: str,
+    respond: Callable[[dict], BaseModel],
+    user_id: int | None = None,
+    guest: tuple | None = None,
+    check_min_order: bool = False,
+    remember: Remember | None = None,
+) -> dict:
+    """Price, validate and insert an order in one group-committed unit.
+
+    All requested products are read with a single query inside the write
+    transaction, so the order is stored with exactly the prices it was
+    validated against. ``guest`` is (name, phone, address, payment_method).
+    ``respond`` builds the response from the order's id, status, total,
+    created_at and items; it is returned as a dict and, when ``remember``
+    is given, stored with the order for idempotent retries.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="El pedido debe tener al menos un producto")
+    product_ids = json.dumps(sorted({item.product_id for item in items}))
+    
+    async def work(db: aiosqlite.Connection):
+        products = {row['id']: row for row in await PRODUCTS_FOR_ORDER.fetch_all(db, (product_ids,))}
+        total = 0
+        lines = []
+        for item in items:
+            product = products.get(item.product_id)
+            
+            if not product:
+                raise HTTPException(status_code=400, detail=f"Producto {item.product_id} no encontrado")
+            
+            if not product['is_active']:
+                raise HTTPException(status_code=400, detail=f"Producto {product['name']} no esta disponible")
+            
+            if check_min_order and item.quantity < product['min_order']:
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"La cantidad minima para {product['name']} es {product['min_order']}"
+                )
+            
+            discount = product['discount_percent'] or 0
+            price = product['price']
+            total += item.quantity * price * (1 - discount / 100)
+            lines.append((item.product_id, product['name'], item.quantity, price, discount))
+        
+        cursor = await db.execute(
+            """INSERT INTO orders (user_id, guest_name, guest_phone, guest_address, payment_method, total, notes)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               RETURNING id, status, created_at""",
+            (user_id, *(guest or (None,) * 4), round(total, 2), notes)
+        )
+        order = dict(await cursor.fetchone())
+        await cursor.close()
+        order['total'] = round(total, 2)
+        order['items'] = []
+        for start in range(0, len(lines), ORDER_ITEM_BATCH):
+            batch = lines[start:start + ORDER_ITEM_BATCH]
+            cursor = await db.execute(
+                "INSERT INTO order_items (order_id, product_id, quantity, price, discount) VALUES "
+                + ", ".join(["(?, ?, ?, ?, ?)"] * len(batch)) + " RETURNING id",
+                [value for product_id, _, quantity, price, discount in batch
+                 for value in (order['id'], product_id, quantity, price, discount)]
+            )
+            # RETURNING gives no particular order, but AUTOINCREMENT ids grow
+            # with each inserted row, so sorted they follow the lines
+            item_ids = sorted(row[0] for row in await cursor.fetchall())
+            await cursor.close()
+            order['items'] += [{
+                "id": item_id,
+                "product_id": product_id,
+                "product_name": name,
+                "quantity": quantity,
+                "price": price,
+                "discount": discount,
+                "subtotal": item_subtotal(quantity, price, discount),
+            } for item_id, (product_id, name, quantity, price, discount) in zip(item_ids, batch)]
+        response = respond(order).model_dump()
+        if remember is not None:
+            await remember(db, response)
+        return response
+    
+    return await submit_write(work)
+
+def _check_status(value: str):
+    if value not in ORDER_STATUSES:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Estado invalido. Estados validos: {', '.join(ORDER_STATUSES)}"
+        )
+
+def _shortage_detail(short: list) -> str:
+    """Message naming each short product, from rows with name, stock and quantity."""
+    return "Stock insuficiente para: " + ", ".join(
+        f"{row['name']} (disponible: {row['stock']}, solicitado: {row['quantity']})" for row in short
+    )
+
+async def _try_reserve(db: aiosqlite.Connection, order_ids: List[int]) -> tuple[list, bool]:
+    """Take the summed quantities of ``order_ids`` off stock, all or none.
+
+    One conditional update does the reservation; when it leaves a product
+    out it is rolled back to a savepoint. Returns the short products, empty
+    when the reservation stands, and whether stock changed.
+    """
+    ids = json.dumps(order_ids)
+    await db.execute("SAVEPOINT reserve")
+    try:
+        reserved = await ORDER_STOCK_RESERVE.fetch_all(db, (ids, ids))
+        if not reserved or len(reserved) < reserved[0]['wanted']:
+            short = await ORDER_STOCK_SHORTAGES.fetch_all(db, (ids, json.dumps([row['id'] for row in reserved])))
+            if short:
+                await db.execute("ROLLBACK TO reserve")
+                return short, False
+    finally:
+        await db.execute("RELEASE reserve")
+    return [], bool(reserved)
+
+async def _reserve_stock(db: aiosqlite.Connection, order_ids: List[int]) -> tuple[dict, bool]:
+    """Take each order's quantities off stock, all of them or none.
+
+    The orders are reserved together first. Only if some product cannot
+    cover all of them are they reserved one at a time, in the order given,
+    so the first ones keep scarce stock. Returns each order's shortage
+    message, None when reserved, and whether stock changed. Must run
+    inside a write unit.
+    """
+    short, changed = await _try_reserve(db, order_ids)
+    if not short:
+        return dict.fromkeys(order_ids), changed
+    if len(order_ids) == 1:
+        return {order_ids[0]: _shortage_detail(short)}, False
+    
+    errors = {}
+    for order_id in order_ids:
+        short, reserved = await _try_reserve(db, [order_id])
+        errors[order_id] = _shortage_detail(short) if short else None
+        changed = changed or reserved
+    return errors, changed
+
+async def _apply_status(db: aiosqlite.Connection, previous: dict, new_status: str) -> tuple[dict, bool]:
+    """Adjust stock for orders moving from their ``previous`` status
+    (by order id) to ``new_status``.
+
+    Confirming reserves the orders' stock and cancelling confirmed orders
+    gives it back, with one statement for all of them. Returns each order's
+    error, None when it can move, and whether stock changed.
+    """
+    errors = dict.fromkeys(previous)
+    # Subtract stock when orders are confirmed (only those not already confirmed)
+    if new_status == 'confirmed':
+        pending = [order_id for order_id, status in previous.items() if status != 'confirmed']
+        if pending:
+            shortages, changed = await _reserve_stock(db, pending)
+            errors.update(shortages)
+            return errors, changed
+    # Restore stock if orders are cancelled (only those previously confirmed)
+    if new_status == 'cancelled':
+        confirmed = [order_id for order_id, status in previous.items() if status == 'confirmed']
+        if confirmed:
+            released = await ORDER_STOCK_RELEASE.execute(db, (json.dumps(confirmed),))
+            return errors, released.rowcount > 0
+    return errors, False
+
+async def _change_status(db: aiosqlite.Connection, order_id: int, new_status: str) -> bool:
+    """Move an order to ``new_status`` in a write unit, adjusting stock.
+
+    The current status is read inside the unit, so two requests can never
+    both act on the same one. Returns whether stock changed.
+    """
+    cursor = await db.execute("SELECT status FROM orders WHERE id = ?", (order_id,))
+    order = await cursor.fetchone()
+    if not order:
+        raise HTTPException(status_code=404, detail="Pedido no encontrado")
+    
+    errors, stock_changed = await _apply_status(db, {order_id: order['status']}, new_status)
+    if errors[order_id]:
+        raise HTTPException(status_code=400, detail=errors[order_id])
+    await db.execute(
+        "UPDATE orders SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (new_status, order_id)
+    )
+    return stock_changed
+
+async def _change_statuses(db: aiosqlite.Connection, order_ids: List[int], new_status: str) -> tuple[dict, bool]:
+    """Move many orders to ``new_status`` in a write unit, adjusting stock.
+
+    Stock is adjusted by ``_apply_status`` for all found orders at once; an
+    order that is missing or short of stock fails on its own. Statuses are
+    read and written once for all orders.
+    Returns each order's error, None on success, and whether stock changed.
+    """
+    previous = {
+        row['id']: row['status']
+        for row in await ORDER_STATUSES_BY_IDS.fetch_all(db, (json.dumps(order_ids),))
+    }
+    # Keep the order given; it decides who gets scarce stock
+    found = {order_id: previous[order_id] for order_id in order_ids if order_id in previous}
+    applied, stock_changed = await _apply_status(db, found, new_status)
+    errors = {order_id: applied.get(order_id, "Pedido no encontrado") for order_id in order_ids}
+    
+    updated = [order_id for order_id, error in errors.items() if error is None]
+    if updated:
+        await db.execute(
+            "UPDATE orders SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id IN (SELECT value FROM json_each(?))",
+            (new_status, json.dumps(updated))
+        )
+    return errors, stock_changed
+
 @router.get("", response_model=List[OrderResponse])
 async def get_orders(
+    response: Response,
     status_filter: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None, description="Solo administradores; otros usuarios ven sus propios pedidos"),
+    payment_method: Optional[str] = Query(None),
+    created_from: Optional[str] = Query(None, description="Fecha (AAAA-MM-DD) o fecha y hora UTC, inclusive"),
+    created_to: Optional[str] = Query(None, description="Fecha (AAAA-MM-DD) o fecha y hora UTC, inclusive"),
+    sort: Optional[str] = Query(None, description="created_at o status; '-' para descendente"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    stream: bool = Query(False, description="Enviar la lista completa en streaming, sin limit ni cursor"),
     current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    if current_user['role'] == 'admin':
-        query = """
-            SELECT o.id, o.user_id, u.name as user_name, u.phone as user_phone,
-                   o.guest_name, o.guest_phone, o.guest_address, o.payment_method,
-                   o.status, o.total, o.notes, o.created_at
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            WHERE 1=1
-        """
-        params = []
-    else:
-        query = """
-            SELECT o.id, o.user_id, u.name as user_name, u.phone as user_phone,
-                   o.guest_name, o.guest_phone, o.guest_address, o.payment_method,
-                   o.status, o.total, o.notes, o.created_at
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            WHERE o.user_id = ?
-        """
-        params = [current_user['id']]
-    
-    if status_filter:
-        query += " AND o.status = ?"
-        params.append(status_filter)
-    
-    query += " ORDER BY o.created_at DESC"
+    sort_key, descending = parse_sort(sort, ORDER_SORTS, "-created_at")
+    sort_label = f"{'-' if descending else ''}{sort_key}"
+    size = page_size(limit, cursor)
+    check_stream(stream, size)
+    after = decode_cursor(cursor, sort_label, len(ORDER_SORTS[sort_key]) + 1)
+    
+    if current_user['role'] != 'admin':
+        if user_id is not None and user_id != current_user['id']:
+            raise HTTPException(status_code=403, detail="No tienes permiso para ver pedidos de otros usuarios")
+        user_id = current_user['id']
+    statement, params = order_list(
+        user_id, status_filter, sort_key, descending, after, size is not None,
+        payment_method=payment_method,
+        created_since=_created_bound(created_from, "created_from"),
+        created_before=_created_bound(created_to, "created_to", inclusive_end=True)
+    )
+    if stream:
+        return stream_json_array(db, statement, params, attach=_attach_items)
     
-    cursor = await db.execute(query, params)
-    orders = await cursor.fetchall()
+    if size is None:
+        orders = await statement.fetch_all(db, params)
+    else:
+        orders, next_key = await statement.fetch_page(db, params, size)
+        set_next_cursor(response, sort_label, next_key)
     
-    result = []
-    for order in orders:
-        cursor = await db.execute("""
-            SELECT oi.id, oi.product_id, p.name as product_name, 
-                   oi.quantity, oi.price, oi.discount
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = ?
-        """, (order['id'],))
-        items = await cursor.fetchall()
-        
-        user_name = order['user_name'] if order['user_name'] else order['guest_name'] or 'Invitado'
-        user_phone = order['user_phone'] if order['user_phone'] else order['guest_phone']
-        
-        result.append(OrderResponse(
-            id=order['id'],
-            user_id=order['user_id'],
-            user_name=user_name,
-            user_phone=user_phone,
-            guest_name=order['guest_name'],
-            guest_phone=order['guest_phone'],
-            guest_address=order['guest_address'],
-            payment_method=order['payment_method'],
-            status=order['status'],
-            total=order['total'],
-            notes=order['notes'],
-            created_at=order['created_at'],
-            items=[OrderItemResponse(
-                id=item['id'],
-                product_id=item['product_id'],
-                product_name=item['product_name'],
-                quantity=item['quantity'],
-                price=item['price'],
-                discount=item['discount'],
-                subtotal=round(item['quantity'] * item['price'] * (1 - item['discount'] / 100), 2)
-            ) for item in items]
-        ))
+    await _attach_items(db, orders)
     
-    return result
+    return json_response(orders, response)
 
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: int,
     current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("""
-        SELECT o.id, o.user_id, u.name as user_name, u.phone as user_phone,
-               o.guest_name, o.guest_phone, o.guest_address, o.payment_method,
-               o.status, o.total, o.notes, o.created_at
-        FROM orders o
-        LEFT JOIN users u ON o.user_id = u.id
-        WHERE o.id = ?
-    """, (order_id,))
-    order = await cursor.fetchone()
+    order = await _load_order(db, order_id)
     
     if not order:
         raise HTTPException(status_code=404, detail="Pedido no encontrado")
@@ -165,133 +411,37 @@ async def get_order(
     if current_user['role'] != 'admin' and order['user_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="No tienes permiso para ver este pedido")
     
-    cursor = await db.execute("""
-        SELECT oi.id, oi.product_id, p.name as product_name, 
-               oi.quantity, oi.price, oi.discount
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        WHERE oi.order_id = ?
-    """, (order_id,))
-    items = await cursor.fetchall()
-    
-    user_name = order['user_name'] if order['user_name'] else order['guest_name'] or 'Invitado'
-    user_phone = order['user_phone'] if order['user_phone'] else order['guest_phone']
-    
-    return OrderResponse(
-        id=order['id'],
-        user_id=order['user_id'],
-        user_name=user_name,
-        user_phone=user_phone,
-        guest_name=order['guest_name'],
-        guest_phone=order['guest_phone'],
-        guest_address=order['guest_address'],
-        payment_method=order['payment_method'],
-        status=order['status'],
-        total=order['total'],
-        notes=order['notes'],
-        created_at=order['created_at'],
-        items=[OrderItemResponse(
-            id=item['id'],
-            product_id=item['product_id'],
-            product_name=item['product_name'],
-            quantity=item['quantity'],
-            price=item['price'],
-            discount=item['discount'],
-            subtotal=round(item['quantity'] * item['price'] * (1 - item['discount'] / 100), 2)
-        ) for item in items]
-    )
+    return OrderResponse(**order)
 
 @router.post("", response_model=OrderResponse)
 async def create_order(
     order: OrderCreate,
     current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    if not order.items:
-        raise HTTPException(status_code=400, detail="El pedido debe tener al menos un producto")
-    
-    total = 0
-    items_data = []
-    
-    for item in order.items:
-        cursor = await db.execute("""
-            SELECT p.id, p.name, p.price, p.stock, p.min_order, p.is_active,
-                   (SELECT MAX(pr.discount_percent) FROM promotions pr 
-                    WHERE (pr.product_id = p.id OR pr.category_id = p.category_id)
-                    AND pr.is_active = 1 
-                    AND datetime('now') BETWEEN pr.start_date AND pr.end_date) as discount_percent
-            FROM products p
-            WHERE p.id = ?
-        """, (item.product_id,))
-        product = await cursor.fetchone()
-        
-        if not product:
-            raise HTTPException(status_code=400, detail=f"Producto {item.product_id} no encontrado")
-        
-        if not product['is_active']:
-            raise HTTPException(status_code=400, detail=f"Producto {product['name']} no esta disponible")
-        
-        if item.quantity < product['min_order']:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"La cantidad minima para {product['name']} es {product['min_order']}"
-            )
-        
-        discount = product['discount_percent'] or 0
-        price = product['price']
-        subtotal = item.quantity * price * (1 - discount / 100)
-        total += subtotal
-        
-        items_data.append({
-            'product_id': item.product_id,
-            'product_name': product['name'],
-            'quantity': item.quantity,
-            'price': price,
-            'discount': discount
-        })
-    
-    cursor = await db.execute(
-        "INSERT INTO orders (user_id, total, notes) VALUES (?, ?, ?)",
-        (current_user['id'], round(total, 2), order.notes)
-    )
-    await db.commit()
-    order_id = cursor.lastrowid
-    
-    order_items_response = []
-    for i, item_data in enumerate(items_data):
-        cursor = await db.execute(
-            "INSERT INTO order_items (order_id, product_id, quantity, price, discount) VALUES (?, ?, ?, ?, ?)",
-            (order_id, item_data['product_id'], item_data['quantity'], item_data['price'], item_data['discount'])
-        )
-        await db.commit()
-        item_id = cursor.lastrowid
-        
-        order_items_response.append(OrderItemResponse(
-            id=item_id,
-            product_id=item_data['product_id'],
-            product_name=item_data['product_name'],
-            quantity=item_data['quantity'],
-            price=item_data['price'],
-            discount=item_data['discount'],
-            subtotal=round(item_data['quantity'] * item_data['price'] * (1 - item_data['discount'] / 100), 2)
-        ))
-    
-    cursor = await db.execute(
-        "SELECT created_at FROM orders WHERE id = ?",
-        (order_id,)
-    )
-    order_row = await cursor.fetchone()
-    
-    return OrderResponse(
-        id=order_id,
+    """Place an order as the current buyer.
+
+    Retries that send the same ``Idempotency-Key`` get the first response
+    back instead of a new order; see ``app.idempotency``.
+    """
+    respond = lambda placed: OrderResponse(
+        **placed,
         user_id=current_user['id'],
         user_name=current_user['name'],
         user_phone=current_user['phone'],
-        status='pending',
-        total=round(total, 2),
-        notes=order.notes,
-        created_at=order_row['created_at'],
-        items=order_items_response
+        notes=order.notes
+    )
+    
+    return await idempotent(
+        idempotency_key,
+        f"user:{current_user['id']}",
+        order.model_dump(),
+        lambda remember: _place_order(
+            order.items, order.notes, respond,
+            user_id=current_user['id'], check_min_order=True, remember=remember
+        ),
+        db
     )
 
 @router.put("/{order_id}/status", response_model=OrderResponse)
@@ -299,119 +449,54 @@ async def update_order_status(
     order_id: int,
     status_update: OrderStatusUpdate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    valid_statuses = ['pending', 'confirmed', 'preparing', 'ready', 'delivered', 'cancelled']
-    if status_update.status not in valid_statuses:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Estado invalido. Estados validos: {', '.join(valid_statuses)}"
-        )
+    _check_status(status_update.status)
     
-    cursor = await db.execute("SELECT id, status FROM orders WHERE id = ?", (order_id,))
-    order_check = await cursor.fetchone()
-    if not order_check:
-        raise HTTPException(status_code=404, detail="Pedido no encontrado")
+    stock_changed = await submit_write(lambda db: _change_status(db, order_id, status_update.status))
+    if stock_changed:
+        # The reader the auth dependency already holds
+        await refresh_catalog(db)
     
-    previous_status = order_check['status']
-    
-    # Subtract stock when order is confirmed (only if it wasn't already confirmed)
-    if status_update.status == 'confirmed' and previous_status != 'confirmed':
-        cursor = await db.execute("""
-            SELECT oi.product_id, oi.quantity, p.stock, p.name
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        items = await cursor.fetchall()
-        
-        for item in items:
-            new_stock = item['stock'] - item['quantity']
-            if new_stock < 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Stock insuficiente para {item['name']}. Disponible: {item['stock']}, Solicitado: {item['quantity']}"
-                )
-        
-        # Update stock for all items
-        for item in items:
-            await db.execute(
-                "UPDATE products SET stock = stock - ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (item['quantity'], item['product_id'])
-            )
-    
-    # Restore stock if order is cancelled (only if it was previously confirmed)
-    if status_update.status == 'cancelled' and previous_status == 'confirmed':
-        cursor = await db.execute("""
-            SELECT oi.product_id, oi.quantity
-            FROM order_items oi
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        items = await cursor.fetchall()
-        
-        for item in items:
-            await db.execute(
-                "UPDATE products SET stock = stock + ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (item['quantity'], item['product_id'])
-            )
-    
-    await db.execute(
-        "UPDATE orders SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-        (status_update.status, order_id)
-    )
-    await db.commit()
-    
-    cursor = await db.execute("""
-        SELECT o.id, o.user_id, u.name as user_name, u.phone as user_phone,
-               o.guest_name, o.guest_phone, o.guest_address, o.payment_method,
-               o.status, o.total, o.notes, o.created_at
-        FROM orders o
-        LEFT JOIN users u ON o.user_id = u.id
-        WHERE o.id = ?
-    """, (order_id,))
-    order = await cursor.fetchone()
-    
-    cursor = await db.execute("""
-        SELECT oi.id, oi.product_id, p.name as product_name, 
-               oi.quantity, oi.price, oi.discount
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        WHERE oi.order_id = ?
-    """, (order_id,))
-    items = await cursor.fetchall()
-    
-    user_name = order['user_name'] if order['user_name'] else order['guest_name'] or 'Invitado'
-    user_phone = order['user_phone'] if order['user_phone'] else order['guest_phone']
-    
-    return OrderResponse(
-        id=order['id'],
-        user_id=order['user_id'],
-        user_name=user_name,
-        user_phone=user_phone,
-        guest_name=order['guest_name'],
-        guest_phone=order['guest_phone'],
-        guest_address=order['guest_address'],
-        payment_method=order['payment_method'],
-        status=order['status'],
-        total=order['total'],
-        notes=order['notes'],
-        created_at=order['created_at'],
-        items=[OrderItemResponse(
-            id=item['id'],
-            product_id=item['product_id'],
-            product_name=item['product_name'],
-            quantity=item['quantity'],
-            price=item['price'],
-            discount=item['discount'],
-            subtotal=round(item['quantity'] * item['price'] * (1 - item['discount'] / 100), 2)
-        ) for item in items]
+    return OrderResponse(**await _load_order(db, order_id))
+
+@router.post("/status/bulk", response_model=BulkOrderStatusResult)
+async def bulk_update_order_status(
+    update: BulkOrderStatusUpdate,
+    admin: dict = Depends(get_admin_user),
+    db: aiosqlite.Connection = Depends(get_read_db)
+):
+    """Move many orders to one status in a single transaction.
+
+    Stock is reserved or given back as for a single order. Orders are taken
+    in the order given, so when a product runs out the first ones keep it.
+    Orders that are not found or lack stock are reported and left as they
+    are; the rest are updated.
+    """
+    _check_status(update.status)
+    order_ids = list(dict.fromkeys(update.order_ids))
+    if not order_ids:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un pedido")
+    
+    errors, stock_changed = await submit_write(lambda db: _change_statuses(db, order_ids, update.status))
+    if stock_changed:
+        await refresh_catalog(db)
+    
+    results = [
+        OrderStatusResult(order_id=order_id, success=errors[order_id] is None, error=errors[order_id])
+        for order_id in order_ids
+    ]
+    return BulkOrderStatusResult(
+        status=update.status,
+        updated=sum(result.success for result in results),
+        results=results
     )
 
 @router.post("/admin", response_model=OrderResponse)
 async def admin_create_order(
     order: AdminOrderCreate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
     """Admin creates an order on behalf of a client"""
     if not order.items:
@@ -423,110 +508,47 @@ async def admin_create_order(
     if not user:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
-    total = 0
-    items_data = []
-    
-    for item in order.items:
-        cursor = await db.execute("""
-            SELECT p.id, p.name, p.price, p.stock, p.is_active,
-                   (SELECT MAX(pr.discount_percent) FROM promotions pr 
-                    WHERE (pr.product_id = p.id OR pr.category_id = p.category_id)
-                    AND pr.is_active = 1 
-                    AND datetime('now') BETWEEN pr.start_date AND pr.end_date) as discount_percent
-            FROM products p
-            WHERE p.id = ?
-        """, (item.product_id,))
-        product = await cursor.fetchone()
-        
-        if not product:
-            raise HTTPException(status_code=400, detail=f"Producto {item.product_id} no encontrado")
-        
-        if not product['is_active']:
-            raise HTTPException(status_code=400, detail=f"Producto {product['name']} no esta disponible")
-        
-        discount = product['discount_percent'] or 0
-        price = product['price']
-        subtotal = item.quantity * price * (1 - discount / 100)
-        total += subtotal
-        
-        items_data.append({
-            'product_id': item.product_id,
-            'product_name': product['name'],
-            'quantity': item.quantity,
-            'price': price,
-            'discount': discount
-        })
-    
-    cursor = await db.execute(
-        "INSERT INTO orders (user_id, total, notes) VALUES (?, ?, ?)",
-        (order.user_id, round(total, 2), order.notes)
-    )
-    await db.commit()
-    order_id = cursor.lastrowid
-    
-    order_items_response = []
-    for item_data in items_data:
-        cursor = await db.execute(
-            "INSERT INTO order_items (order_id, product_id, quantity, price, discount) VALUES (?, ?, ?, ?, ?)",
-            (order_id, item_data['product_id'], item_data['quantity'], item_data['price'], item_data['discount'])
-        )
-        await db.commit()
-        item_id = cursor.lastrowid
-        
-        order_items_response.append(OrderItemResponse(
-            id=item_id,
-            product_id=item_data['product_id'],
-            product_name=item_data['product_name'],
-            quantity=item_data['quantity'],
-            price=item_data['price'],
-            discount=item_data['discount'],
-            subtotal=round(item_data['quantity'] * item_data['price'] * (1 - item_data['discount'] / 100), 2)
-        ))
-    
-    cursor = await db.execute(
-        "SELECT created_at FROM orders WHERE id = ?",
-        (order_id,)
-    )
-    order_row = await cursor.fetchone()
-    
-    return OrderResponse(
-        id=order_id,
-        user_id=order.user_id,
-        user_name=user['name'],
-        user_phone=user['phone'],
-        status='pending',
-        total=round(total, 2),
-        notes=order.notes,
-        created_at=order_row['created_at'],
-        items=order_items_response
+    return await _place_order(
+        order.items,
+        order.notes,
+        lambda placed: OrderResponse(
+            **placed,
+            user_id=order.user_id,
+            user_name=user['name'],
+            user_phone=user['phone'],
+            notes=order.notes
+        ),
+        user_id=order.user_id
     )
 
 @router.delete("/{order_id}")
 async def cancel_order(
     order_id: int,
     current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute(
-        "SELECT id, user_id, status FROM orders WHERE id = ?",
-        (order_id,)
-    )
-    order = await cursor.fetchone()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido no encontrado")
-    
-    if current_user['role'] != 'admin' and order['user_id'] != current_user['id']:
-        raise HTTPException(status_code=403, detail="No tienes permiso para cancelar este pedido")
-    
-    if order['status'] not in ['pending', 'confirmed']:
-        raise HTTPException(status_code=400, detail="Solo se pueden cancelar pedidos pendientes o confirmados")
+    async def work(db: aiosqlite.Connection) -> bool:
+        cursor = await db.execute(
+            "SELECT id, user_id, status FROM orders WHERE id = ?",
+            (order_id,)
+        )
+        order = await cursor.fetchone()
+        
+        if not order:
+            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+        
+        if current_user['role'] != 'admin' and order['user_id'] != current_user['id']:
+            raise HTTPException(status_code=403, detail="No tienes permiso para cancelar este pedido")
+        
+        if order['status'] not in ['pending', 'confirmed']:
+            raise HTTPException(status_code=400, detail="Solo se pueden cancelar pedidos pendientes o confirmados")
+        
+        # Gives a confirmed order's stock back, as a status change would
+        return await _change_status(db, order_id, 'cancelled')
     
-    await db.execute(
-        "UPDATE orders SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-        (order_id,)
-    )
-    await db.commit()
+    if await submit_write(work):
+        # The reader the auth dependency already holds
+        await refresh_catalog(db)
     
     return {"message": "Pedido cancelado exitosamente"}
 
@@ -534,129 +556,64 @@ async def cancel_order(
 async def delete_order_permanent(
     order_id: int,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
     """Permanently delete an order (admin only)"""
-    cursor = await db.execute(
-        "SELECT id, status FROM orders WHERE id = ?",
-        (order_id,)
-    )
-    order = await cursor.fetchone()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido no encontrado")
-    
-    # If order was confirmed, restore stock before deleting
-    if order['status'] == 'confirmed':
-        cursor = await db.execute("""
-            SELECT oi.product_id, oi.quantity
-            FROM order_items oi
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        items = await cursor.fetchall()
+    async def work(db: aiosqlite.Connection) -> bool:
+        cursor = await db.execute(
+            "SELECT id, status FROM orders WHERE id = ?",
+            (order_id,)
+        )
+        order = await cursor.fetchone()
         
-        for item in items:
-            await db.execute(
-                "UPDATE products SET stock = stock + ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (item['quantity'], item['product_id'])
-            )
+        if not order:
+            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+        
+        # If order was confirmed, restore stock before deleting
+        if order['status'] == 'confirmed':
+            await ORDER_STOCK_RELEASE.execute(db, (json.dumps([order_id]),))
+        
+        # Delete order items first (foreign key constraint)
+        await db.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+        # Delete the order
+        await db.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+        return order['status'] == 'confirmed'
     
-    # Delete order items first (foreign key constraint)
-    await db.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
-    # Delete the order
-    await db.execute("DELETE FROM orders WHERE id = ?", (order_id,))
-    await db.commit()
+    if await submit_write(work):
+        # The reader the auth dependency already holds
+        await refresh_catalog(db)
     
     return {"message": "Pedido eliminado permanentemente"}
 
 @router.post("/guest", response_model=GuestOrderResponse)
-async def guest_create_order(
-    order: GuestOrderCreate,
-    db: aiosqlite.Connection = Depends(get_db)
-):
-    """Create an order as a guest (no authentication required)"""
+async def guest_create_order(order: GuestOrderCreate, idempotency_key: Optional[str] = Header(None)):
+    """Create an order as a guest (no authentication required).
+
+    Retries that send the same ``Idempotency-Key`` get the first response
+    back instead of a new order; see ``app.idempotency``.
+    """
     if not order.items:
         raise HTTPException(status_code=400, detail="El pedido debe tener al menos un producto")
     
     if not order.guest_name or not order.guest_phone or not order.guest_address or not order.payment_method:
         raise HTTPException(status_code=400, detail="Todos los campos son requeridos")
     
-    total = 0
-    items_data = []
-    
-    for item in order.items:
-        cursor = await db.execute("""
-            SELECT p.id, p.name, p.price, p.stock, p.is_active,
-                   (SELECT MAX(pr.discount_percent) FROM promotions pr 
-                    WHERE (pr.product_id = p.id OR pr.category_id = p.category_id)
-                    AND pr.is_active = 1 
-                    AND datetime('now') BETWEEN pr.start_date AND pr.end_date) as discount_percent
-            FROM products p
-            WHERE p.id = ?
-        """, (item.product_id,))
-        product = await cursor.fetchone()
-        
-        if not product:
-            raise HTTPException(status_code=400, detail=f"Producto {item.product_id} no encontrado")
-        
-        if not product['is_active']:
-            raise HTTPException(status_code=400, detail=f"Producto {product['name']} no esta disponible")
-        
-        discount = product['discount_percent'] or 0
-        price = product['price']
-        subtotal = item.quantity * price * (1 - discount / 100)
-        total += subtotal
-        
-        items_data.append({
-            'product_id': item.product_id,
-            'product_name': product['name'],
-            'quantity': item.quantity,
-            'price': price,
-            'discount': discount
-        })
-    
-    cursor = await db.execute(
-        """INSERT INTO orders (user_id, guest_name, guest_phone, guest_address, payment_method, total, notes) 
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (None, order.guest_name, order.guest_phone, order.guest_address, order.payment_method, round(total, 2), order.notes)
-    )
-    await db.commit()
-    order_id = cursor.lastrowid
-    
-    order_items_response = []
-    for item_data in items_data:
-        cursor = await db.execute(
-            "INSERT INTO order_items (order_id, product_id, quantity, price, discount) VALUES (?, ?, ?, ?, ?)",
-            (order_id, item_data['product_id'], item_data['quantity'], item_data['price'], item_data['discount'])
-        )
-        await db.commit()
-        item_id = cursor.lastrowid
-        
-        order_items_response.append(OrderItemResponse(
-            id=item_id,
-            product_id=item_data['product_id'],
-            product_name=item_data['product_name'],
-            quantity=item_data['quantity'],
-            price=item_data['price'],
-            discount=item_data['discount'],
-            subtotal=round(item_data['quantity'] * item_data['price'] * (1 - item_data['discount'] / 100), 2)
-        ))
-    
-    cursor = await db.execute(
-        "SELECT created_at FROM orders WHERE id = ?",
-        (order_id,)
-    )
-    order_row = await cursor.fetchone()
-    
-    return GuestOrderResponse(
-        id=order_id,
+    respond = lambda placed: GuestOrderResponse(
+        **placed,
         guest_name=order.guest_name,
         guest_phone=order.guest_phone,
         guest_address=order.guest_address,
         payment_method=order.payment_method,
-        status='pending',
-        total=round(total, 2),
-        notes=order.notes,
-        created_at=order_row['created_at'],
-        items=order_items_response
+        notes=order.notes
+    )
+    
+    return await idempotent(
+        idempotency_key,
+        "guest",
+        order.model_dump(),
+        lambda remember: _place_order(
+            order.items, order.notes, respond,
+            guest=(order.guest_name, order.guest_phone, order.guest_address, order.payment_method),
+            remember=remember
+        )
     )
@@ -1,9 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError, model_validator
 from typing import List, Optional
+import json
 import aiosqlite
-from app.database import get_db
+from app.database import (
+    get_read_db, get_catalog_db, catalog_connection, refresh_catalog, submit_statement, submit_write
+)
+from app.catalog import catalog_cache, catalog_etag
 from app.utils.auth import get_current_user, get_admin_user
+from app.statements import (
+    CATEGORY_LIST, PRODUCT_BY_ID, PRODUCT_BY_IDS, PRODUCT_EXPORT, PRODUCT_FILE_COLUMNS, PRODUCT_IDS_EXISTING,
+    PRODUCT_SORTS, PROMOTION_NEXT_BOUNDARY, product_list
+)
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, page_size, parse_sort, set_next_cursor
+from app.bulk import MEDIA_TYPES, read_records, upload_format, write_records
+from app.serialization import dumps, json_response
+from app.streaming import check_stream, stream_json_array
 
 router = APIRouter(prefix="/products", tags=["Productos"])
 
@@ -46,158 +59,302 @@ class ProductResponse(BaseModel):
     discount_percent: float | None = None
     final_price: float | None = None
 
-@router.get("", response_model=List[ProductResponse])
+class ProductImportRow(ProductUpdate):
+    id: int | None = None
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ProductImportResult(BaseModel):
+    rows: int
+    created: int
+    updated: int
+    errors: List[ImportRowError]
+
+class ProductPatch(BaseModel):
+    id: int
+    price: float | None = None
+    price_delta: float | None = None
+    stock: float | None = None
+    stock_delta: float | None = None
+    min_order: float | None = None
+    is_active: bool | None = None
+
+    @model_validator(mode="after")
+    def _one_of_value_or_delta(self):
+        for field in ("price", "stock"):
+            if getattr(self, field) is not None and getattr(self, f"{field}_delta") is not None:
+                raise ValueError(f"Use {field} o {field}_delta, no ambos")
+        return self
+
+# Columns PATCH /products/bulk can change, and whether they take deltas
+PATCH_FIELDS = {"price": True, "stock": True, "min_order": False, "is_active": False}
+
+# Rows per executemany call during an import, and per chunk of an export
+BULK_BATCH_SIZE = 500
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+@router.get("", response_model=List[ProductResponse], dependencies=[Depends(catalog_etag)])
 async def get_products(
+    response: Response,
     category_id: Optional[int] = Query(None),
     search: Optional[str] = Query(None),
     active_only: bool = Query(True),
-    db: aiosqlite.Connection = Depends(get_db)
+    sort: Optional[str] = Query(None, description="name, price, created_at o relevance (con search); '-' para descendente"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    stream: bool = Query(False, description="Enviar la lista completa en streaming, sin limit ni cursor")
 ):
-    query = """
-        SELECT p.id, p.name, p.description, p.price, p.unit, p.category_id, 
-               c.name as category_name, p.image_url, p.image_url_2, p.stock, p.min_order, p.is_active,
-               (SELECT MAX(pr.discount_percent) FROM promotions pr 
-                WHERE (pr.product_id = p.id OR pr.category_id = p.category_id)
-                AND pr.is_active = 1 
-                AND datetime('now') BETWEEN pr.start_date AND pr.end_date) as discount_percent
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        WHERE 1=1
-    """
-    params = []
-    
-    if active_only:
-        query += " AND p.is_active = 1"
-    
-    if category_id:
-        query += " AND p.category_id = ?"
-        params.append(category_id)
-    
-    if search:
-        query += " AND (LOWER(p.name) LIKE LOWER(?) OR LOWER(p.description) LIKE LOWER(?))"
-        params.extend([f"%{search}%", f"%{search}%"])
+    sort_key, descending = parse_sort(sort, PRODUCT_SORTS, "relevance" if search else "name")
+    if sort_key == "relevance" and not search:
+        raise HTTPException(status_code=400, detail="El orden por relevancia requiere search")
+    sort_label = f"{'-' if descending else ''}{sort_key}"
+    size = page_size(limit, cursor)
+    check_stream(stream, size)
+    if stream:
+        statement, params = product_list(category_id, search, active_only, sort_key, descending)
+        return stream_json_array(catalog_connection, statement, params, response=response)
     
-    query += " ORDER BY p.name"
+    key = ("products", category_id, search, active_only, sort_label, size, cursor)
+    cached = catalog_cache.get(key)
+    if cached is not None:
+        body, next_key = cached
+        set_next_cursor(response, sort_label, next_key)
+        return json_response(body, response)
     
-    cursor = await db.execute(query, params)
-    rows = await cursor.fetchall()
-    
-    products = []
-    for row in rows:
-        discount = row['discount_percent'] or 0
-        final_price = row['price'] * (1 - discount / 100) if discount else row['price']
-        products.append(ProductResponse(
-            id=row['id'],
-            name=row['name'],
-            description=row['description'],
-            price=row['price'],
-            unit=row['unit'],
-            category_id=row['category_id'],
-            category_name=row['category_name'],
-            image_url=row['image_url'],
-            image_url_2=row['image_url_2'],
-            stock=row['stock'],
-            min_order=row['min_order'],
-            is_active=bool(row['is_active']),
-            discount_percent=discount if discount else None,
-            final_price=round(final_price, 2)
-        ))
+    version = catalog_cache.version
+    boundary = None
+    next_key = None
+    async with catalog_connection() as db:
+        statement, params = product_list(
+            category_id, search, active_only, sort_key, descending,
+            decode_cursor(cursor, sort_label, len(PRODUCT_SORTS[sort_key]) + 1), size is not None
+        )
+        if size is None:
+            rows = await statement.fetch_all(db, params)
+        else:
+            rows, next_key = await statement.fetch_page(db, params, size)
+        if not catalog_cache.expiry_known:
+            boundary = (await PROMOTION_NEXT_BOUNDARY.fetch_one(db))['boundary']
     
-    return products
+    # Cached encoded, so a hit is sent without serializing again
+    body = dumps(rows)
+    catalog_cache.put(key, (body, next_key), version, boundary)
+    set_next_cursor(response, sort_label, next_key)
+    return json_response(body, response)
+
+@router.get("/export")
+async def export_products(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|jsonl)$"),
+    admin: dict = Depends(get_admin_user),
+    db: aiosqlite.Connection = Depends(get_read_db)
+):
+    """Every product, active or not, in the format ``/products/import`` reads."""
+    async def body():
+        # The request's reader stays checked out until the last chunk is
+        # sent or the client goes away
+        cursor = await PRODUCT_EXPORT.execute(db)
+        if fmt == "csv":
+            yield write_records(fmt, PRODUCT_FILE_COLUMNS, [], header=True)
+        while rows := await cursor.fetchmany(BULK_BATCH_SIZE):
+            yield write_records(fmt, PRODUCT_FILE_COLUMNS, rows)
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="productos.{fmt}"'}
+    )
 
-@router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("""
-        SELECT p.id, p.name, p.description, p.price, p.unit, p.category_id, 
-               c.name as category_name, p.image_url, p.image_url_2, p.stock, p.min_order, p.is_active,
-               (SELECT MAX(pr.discount_percent) FROM promotions pr 
-                WHERE (pr.product_id = p.id OR pr.category_id = p.category_id)
-                AND pr.is_active = 1 
-                AND datetime('now') BETWEEN pr.start_date AND pr.end_date) as discount_percent
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        WHERE p.id = ?
-    """, (product_id,))
-    row = await cursor.fetchone()
+@router.get("/{product_id}", response_model=ProductResponse, dependencies=[Depends(catalog_etag)])
+async def get_product(product_id: int, db: aiosqlite.Connection = Depends(get_catalog_db)):
+    row = await PRODUCT_BY_ID.fetch_one(db, (product_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    discount = row['discount_percent'] or 0
-    final_price = row['price'] * (1 - discount / 100) if discount else row['price']
-    
-    return ProductResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        price=row['price'],
-        unit=row['unit'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        image_url=row['image_url'],
-        image_url_2=row['image_url_2'],
-        stock=row['stock'],
-        min_order=row['min_order'],
-        is_active=bool(row['is_active']),
-        discount_percent=discount if discount else None,
-        final_price=round(final_price, 2)
-    )
+    return ProductResponse(**row)
 
 @router.post("", response_model=ProductResponse)
 async def create_product(
     product: ProductCreate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    if product.category_id:
-        cursor = await db.execute("SELECT id FROM categories WHERE id = ?", (product.category_id,))
-        if not await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Categoria no encontrada")
-    
-    cursor = await db.execute("""
-        INSERT INTO products (name, description, price, unit, category_id, image_url, image_url_2, stock, min_order)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (product.name, product.description, product.price, product.unit, 
-          product.category_id, product.image_url, product.image_url_2, product.stock, product.min_order))
-    await db.commit()
-    product_id = cursor.lastrowid
+    async def write(db: aiosqlite.Connection) -> int:
+        if product.category_id:
+            cursor = await db.execute("SELECT id FROM categories WHERE id = ?", (product.category_id,))
+            if not await cursor.fetchone():
+                raise HTTPException(status_code=400, detail="Categoria no encontrada")
+        
+        cursor = await db.execute("""
+            INSERT INTO products (name, description, price, unit, category_id, image_url, image_url_2, stock, min_order)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (product.name, product.description, product.price, product.unit, 
+              product.category_id, product.image_url, product.image_url_2, product.stock, product.min_order))
+        return cursor.lastrowid
     
-    cursor = await db.execute("""
-        SELECT p.id, p.name, p.description, p.price, p.unit, p.category_id, 
-               c.name as category_name, p.image_url, p.image_url_2, p.stock, p.min_order, p.is_active
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        WHERE p.id = ?
-    """, (product_id,))
-    row = await cursor.fetchone()
+    product_id = await submit_write(write)
+    # The reader the auth dependency already holds
+    await refresh_catalog(db)
     
-    return ProductResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        price=row['price'],
-        unit=row['unit'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        image_url=row['image_url'],
-        image_url_2=row['image_url_2'],
-        stock=row['stock'],
-        min_order=row['min_order'],
-        is_active=bool(row['is_active']),
-        final_price=row['price']
+    return ProductResponse(**await PRODUCT_BY_ID.fetch_one(db, (product_id,)))
+
+@router.post("/import", response_model=ProductImportResult)
+async def import_products(
+    file: UploadFile = File(...),
+    admin: dict = Depends(get_admin_user),
+    db: aiosqlite.Connection = Depends(get_read_db)
+):
+    """Create or update products from a CSV or JSONL file.
+
+    Rows with an ``id`` update that product, only the fields they carry;
+    rows without one create a product and need ``name`` and ``price``.
+    Rows are validated as the file is read. Invalid rows are reported by
+    line and skipped, the rest are written in a single transaction.
+    """
+    fmt = upload_format(file)
+    category_ids = {category['id'] for category in await CATEGORY_LIST.fetch_all(db)}
+
+    inserts = []
+    updates = []
+    errors = []
+    rows = 0
+    async for line, record, error in read_records(file, fmt, PRODUCT_FILE_COLUMNS):
+        rows += 1
+        if error is None:
+            try:
+                row = ProductImportRow.model_validate(record)
+                if row.category_id is not None and row.category_id not in category_ids:
+                    error = "Categoria no encontrada"
+                elif row.id is None:
+                    if row.name is None or row.price is None:
+                        error = "name y price son obligatorios para productos nuevos"
+                    else:
+                        new = ProductCreate(**row.model_dump(exclude_none=True, exclude={"id", "is_active"}))
+            except ValidationError as exc:
+                error = _validation_message(exc)
+        if error is not None:
+            errors.append(ImportRowError(line=line, error=error))
+        elif row.id is None:
+            inserts.append((
+                new.name, new.description, new.price, new.unit, new.category_id, new.image_url,
+                new.image_url_2, new.stock, new.min_order, 0 if row.is_active is False else 1
+            ))
+        else:
+            updates.append((line, row))
+
+    # Only the columns the file carries are assigned, so a price list does
+    # not fire the search index triggers on name and description. A row
+    # that leaves one of them out keeps the current value.
+    fields = [
+        name for name in PRODUCT_FILE_COLUMNS
+        if name != "id" and any(name in row.model_fields_set for _, row in updates)
+    ]
+    assignments = "".join(f"{name} = COALESCE(?, {name}), " for name in fields)
+    update_sql = f"UPDATE products SET {assignments}updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+
+    async def write(db: aiosqlite.Connection) -> list[int]:
+        missing = []
+        for start in range(0, len(updates), BULK_BATCH_SIZE):
+            batch = updates[start:start + BULK_BATCH_SIZE]
+            found = await PRODUCT_IDS_EXISTING.fetch_all(db, (json.dumps([row.id for _, row in batch]),))
+            existing = {product['id'] for product in found}
+            missing += [line for line, row in batch if row.id not in existing]
+            await db.executemany(update_sql, [
+                [getattr(row, name) for name in fields] + [row.id]
+                for _, row in batch if row.id in existing
+            ])
+        for start in range(0, len(inserts), BULK_BATCH_SIZE):
+            await db.executemany("""
+                INSERT INTO products (name, description, price, unit, category_id, image_url, image_url_2,
+                                      stock, min_order, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, inserts[start:start + BULK_BATCH_SIZE])
+        return missing
+
+    missing = await submit_write(write) if inserts or updates else []
+    if len(missing) < len(updates) or inserts:
+        await refresh_catalog(db)
+    errors += [ImportRowError(line=line, error="Producto no encontrado") for line in missing]
+    errors.sort(key=lambda error: error.line)
+
+    return ProductImportResult(
+        rows=rows,
+        created=len(inserts),
+        updated=len(updates) - len(missing),
+        errors=errors
     )
 
+@router.patch("/bulk", response_model=List[ProductResponse])
+async def patch_products(
+    patches: List[ProductPatch],
+    admin: dict = Depends(get_admin_user),
+    db: aiosqlite.Connection = Depends(get_read_db)
+):
+    """Change price, stock, minimum order or visibility of many products.
+
+    ``price`` and ``stock`` set the value, ``price_delta`` and
+    ``stock_delta`` add to it. All patches are applied in one transaction,
+    in order, or none if a product does not exist or would end up with a
+    negative price or stock.
+    """
+    if not patches:
+        return []
+    ids = json.dumps(sorted({patch.id for patch in patches}))
+
+    fields = [
+        name for name in PATCH_FIELDS
+        if any(name in patch.model_fields_set or f"{name}_delta" in patch.model_fields_set for patch in patches)
+    ]
+    assignments = "".join(
+        f"{name} = COALESCE(?, {name} + ?, {name}), " if PATCH_FIELDS[name] else f"{name} = COALESCE(?, {name}), "
+        for name in fields
+    )
+    update_sql = f"UPDATE products SET {assignments}updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+    params = []
+    for patch in patches:
+        values = []
+        for name in fields:
+            values.append(getattr(patch, name))
+            if PATCH_FIELDS[name]:
+                values.append(getattr(patch, f"{name}_delta"))
+        params.append(values + [patch.id])
+
+    async def write(db: aiosqlite.Connection) -> list:
+        found = {product['id'] for product in await PRODUCT_IDS_EXISTING.fetch_all(db, (ids,))}
+        missing = sorted({patch.id for patch in patches} - found)
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Productos no encontrados: {', '.join(map(str, missing))}"
+            )
+        await db.executemany(update_sql, params)
+        products = await PRODUCT_BY_IDS.fetch_all(db, (ids,))
+        invalid = [str(product['id']) for product in products if product['price'] < 0 or (product['stock'] or 0) < 0]
+        if invalid:
+            # Rolls the whole batch back
+            raise HTTPException(
+                status_code=400,
+                detail=f"Precio o stock negativo para los productos: {', '.join(invalid)}"
+            )
+        return products
+
+    products = await submit_write(write)
+    await refresh_catalog(db)
+    return [ProductResponse(**product) for product in products]
+
 @router.put("/{product_id}", response_model=ProductResponse)
 async def update_product(
     product_id: int,
     product: ProductUpdate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM products WHERE id = ?", (product_id,))
-    if not await cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    
     updates = []
     values = []
     
@@ -235,56 +392,24 @@ async def update_product(
     if updates:
         updates.append("updated_at = CURRENT_TIMESTAMP")
         values.append(product_id)
-        await db.execute(
-            f"UPDATE products SET {', '.join(updates)} WHERE id = ?",
-            values
-        )
-        await db.commit()
+        if not await submit_statement(f"UPDATE products SET {', '.join(updates)} WHERE id = ?", values):
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        await refresh_catalog(db)
     
-    cursor = await db.execute("""
-        SELECT p.id, p.name, p.description, p.price, p.unit, p.category_id, 
-               c.name as category_name, p.image_url, p.image_url_2, p.stock, p.min_order, p.is_active,
-               (SELECT MAX(pr.discount_percent) FROM promotions pr 
-                WHERE (pr.product_id = p.id OR pr.category_id = p.category_id)
-                AND pr.is_active = 1 
-                AND datetime('now') BETWEEN pr.start_date AND pr.end_date) as discount_percent
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        WHERE p.id = ?
-    """, (product_id,))
-    row = await cursor.fetchone()
-    
-    discount = row['discount_percent'] or 0
-    final_price = row['price'] * (1 - discount / 100) if discount else row['price']
+    row = await PRODUCT_BY_ID.fetch_one(db, (product_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    return ProductResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        price=row['price'],
-        unit=row['unit'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        image_url=row['image_url'],
-        image_url_2=row['image_url_2'],
-        stock=row['stock'],
-        min_order=row['min_order'],
-        is_active=bool(row['is_active']),
-        discount_percent=discount if discount else None,
-        final_price=round(final_price, 2)
-    )
+    return ProductResponse(**row)
 
 @router.delete("/{product_id}")
 async def delete_product(
     product_id: int,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM products WHERE id = ?", (product_id,))
-    if not await cursor.fetchone():
+    if not await submit_statement("UPDATE products SET is_active = 0 WHERE id = ?", (product_id,)):
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    
-    await db.execute("UPDATE products SET is_active = 0 WHERE id = ?", (product_id,))
-    await db.commit()
+    await refresh_catalog(db)
     
     return {"message": "Producto desactivado exitosamente"}
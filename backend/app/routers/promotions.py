@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import aiosqlite
-from app.database import get_db
+from app.database import get_read_db, get_catalog_db, refresh_catalog, submit_statement, submit_write
+from app.serialization import json_response
+from app.streaming import stream_json_array
+from app.catalog import catalog_etag
 from app.utils.auth import get_current_user, get_admin_user
+from app.statements import PROMOTION_BY_ID, PROMOTION_LIST_ACTIVE, PROMOTION_LIST_ALL
 
 router = APIRouter(prefix="/promotions", tags=["Promociones"])
 
@@ -40,167 +44,71 @@ class PromotionResponse(BaseModel):
     end_date: str
     is_active: bool
 
-@router.get("", response_model=List[PromotionResponse])
+@router.get("", response_model=List[PromotionResponse], dependencies=[Depends(catalog_etag)])
 async def get_promotions(
+    response: Response,
     active_only: bool = True,
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_catalog_db)
 ):
-    query = """
-        SELECT pr.id, pr.name, pr.description, pr.discount_percent, 
-               pr.product_id, p.name as product_name,
-               pr.category_id, c.name as category_name,
-               pr.start_date, pr.end_date, pr.is_active
-        FROM promotions pr
-        LEFT JOIN products p ON pr.product_id = p.id
-        LEFT JOIN categories c ON pr.category_id = c.id
-        WHERE 1=1
-    """
-    
-    if active_only:
-        query += " AND pr.is_active = 1 AND datetime('now') BETWEEN pr.start_date AND pr.end_date"
-    
-    query += " ORDER BY pr.created_at DESC"
-    
-    cursor = await db.execute(query)
-    rows = await cursor.fetchall()
-    
-    return [PromotionResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        discount_percent=row['discount_percent'],
-        product_id=row['product_id'],
-        product_name=row['product_name'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        start_date=row['start_date'],
-        end_date=row['end_date'],
-        is_active=bool(row['is_active'])
-    ) for row in rows]
+    statement = PROMOTION_LIST_ACTIVE if active_only else PROMOTION_LIST_ALL
+    return json_response(await statement.fetch_all(db), response)
 
 @router.get("/all", response_model=List[PromotionResponse])
 async def get_all_promotions(
+    stream: bool = Query(False, description="Enviar la lista en streaming"),
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("""
-        SELECT pr.id, pr.name, pr.description, pr.discount_percent, 
-               pr.product_id, p.name as product_name,
-               pr.category_id, c.name as category_name,
-               pr.start_date, pr.end_date, pr.is_active
-        FROM promotions pr
-        LEFT JOIN products p ON pr.product_id = p.id
-        LEFT JOIN categories c ON pr.category_id = c.id
-        ORDER BY pr.created_at DESC
-    """)
-    rows = await cursor.fetchall()
-    
-    return [PromotionResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        discount_percent=row['discount_percent'],
-        product_id=row['product_id'],
-        product_name=row['product_name'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        start_date=row['start_date'],
-        end_date=row['end_date'],
-        is_active=bool(row['is_active'])
-    ) for row in rows]
+    if stream:
+        return stream_json_array(db, PROMOTION_LIST_ALL, ())
+    return json_response(await PROMOTION_LIST_ALL.fetch_all(db))
 
-@router.get("/{promotion_id}", response_model=PromotionResponse)
-async def get_promotion(promotion_id: int, db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("""
-        SELECT pr.id, pr.name, pr.description, pr.discount_percent, 
-               pr.product_id, p.name as product_name,
-               pr.category_id, c.name as category_name,
-               pr.start_date, pr.end_date, pr.is_active
-        FROM promotions pr
-        LEFT JOIN products p ON pr.product_id = p.id
-        LEFT JOIN categories c ON pr.category_id = c.id
-        WHERE pr.id = ?
-    """, (promotion_id,))
-    row = await cursor.fetchone()
+@router.get("/{promotion_id}", response_model=PromotionResponse, dependencies=[Depends(catalog_etag)])
+async def get_promotion(promotion_id: int, db: aiosqlite.Connection = Depends(get_catalog_db)):
+    row = await PROMOTION_BY_ID.fetch_one(db, (promotion_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Promocion no encontrada")
     
-    return PromotionResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        discount_percent=row['discount_percent'],
-        product_id=row['product_id'],
-        product_name=row['product_name'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        start_date=row['start_date'],
-        end_date=row['end_date'],
-        is_active=bool(row['is_active'])
-    )
+    return PromotionResponse(**row)
 
 @router.post("", response_model=PromotionResponse)
 async def create_promotion(
     promotion: PromotionCreate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    if promotion.product_id:
-        cursor = await db.execute("SELECT id FROM products WHERE id = ?", (promotion.product_id,))
-        if not await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Producto no encontrado")
-    
-    if promotion.category_id:
-        cursor = await db.execute("SELECT id FROM categories WHERE id = ?", (promotion.category_id,))
-        if not await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Categoria no encontrada")
-    
-    cursor = await db.execute("""
-        INSERT INTO promotions (name, description, discount_percent, product_id, category_id, start_date, end_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (promotion.name, promotion.description, promotion.discount_percent, 
-          promotion.product_id, promotion.category_id, promotion.start_date, promotion.end_date))
-    await db.commit()
-    promotion_id = cursor.lastrowid
-    
-    cursor = await db.execute("""
-        SELECT pr.id, pr.name, pr.description, pr.discount_percent, 
-               pr.product_id, p.name as product_name,
-               pr.category_id, c.name as category_name,
-               pr.start_date, pr.end_date, pr.is_active
-        FROM promotions pr
-        LEFT JOIN products p ON pr.product_id = p.id
-        LEFT JOIN categories c ON pr.category_id = c.id
-        WHERE pr.id = ?
-    """, (promotion_id,))
-    row = await cursor.fetchone()
-    
-    return PromotionResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        discount_percent=row['discount_percent'],
-        product_id=row['product_id'],
-        product_name=row['product_name'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        start_date=row['start_date'],
-        end_date=row['end_date'],
-        is_active=bool(row['is_active'])
-    )
+    async def write(db: aiosqlite.Connection) -> int:
+        if promotion.product_id:
+            cursor = await db.execute("SELECT id FROM products WHERE id = ?", (promotion.product_id,))
+            if not await cursor.fetchone():
+                raise HTTPException(status_code=400, detail="Producto no encontrado")
+        
+        if promotion.category_id:
+            cursor = await db.execute("SELECT id FROM categories WHERE id = ?", (promotion.category_id,))
+            if not await cursor.fetchone():
+                raise HTTPException(status_code=400, detail="Categoria no encontrada")
+        
+        cursor = await db.execute("""
+            INSERT INTO promotions (name, description, discount_percent, product_id, category_id, start_date, end_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (promotion.name, promotion.description, promotion.discount_percent, 
+              promotion.product_id, promotion.category_id, promotion.start_date, promotion.end_date))
+        return cursor.lastrowid
+    
+    promotion_id = await submit_write(write)
+    # The reader the auth dependency already holds
+    await refresh_catalog(db)
+    
+    return PromotionResponse(**await PROMOTION_BY_ID.fetch_one(db, (promotion_id,)))
 
 @router.put("/{promotion_id}", response_model=PromotionResponse)
 async def update_promotion(
     promotion_id: int,
     promotion: PromotionUpdate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM promotions WHERE id = ?", (promotion_id,))
-    if not await cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Promocion no encontrada")
-    
     updates = []
     values = []
     
@@ -231,49 +139,24 @@ async def update_promotion(
     
     if updates:
         values.append(promotion_id)
-        await db.execute(
-            f"UPDATE promotions SET {', '.join(updates)} WHERE id = ?",
-            values
-        )
-        await db.commit()
+        if not await submit_statement(f"UPDATE promotions SET {', '.join(updates)} WHERE id = ?", values):
+            raise HTTPException(status_code=404, detail="Promocion no encontrada")
+        await refresh_catalog(db)
     
-    cursor = await db.execute("""
-        SELECT pr.id, pr.name, pr.description, pr.discount_percent, 
-               pr.product_id, p.name as product_name,
-               pr.category_id, c.name as category_name,
-               pr.start_date, pr.end_date, pr.is_active
-        FROM promotions pr
-        LEFT JOIN products p ON pr.product_id = p.id
-        LEFT JOIN categories c ON pr.category_id = c.id
-        WHERE pr.id = ?
-    """, (promotion_id,))
-    row = await cursor.fetchone()
+    row = await PROMOTION_BY_ID.fetch_one(db, (promotion_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Promocion no encontrada")
     
-    return PromotionResponse(
-        id=row['id'],
-        name=row['name'],
-        description=row['description'],
-        discount_percent=row['discount_percent'],
-        product_id=row['product_id'],
-        product_name=row['product_name'],
-        category_id=row['category_id'],
-        category_name=row['category_name'],
-        start_date=row['start_date'],
-        end_date=row['end_date'],
-        is_active=bool(row['is_active'])
-    )
+    return PromotionResponse(**row)
 
 @router.delete("/{promotion_id}")
 async def delete_promotion(
     promotion_id: int,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM promotions WHERE id = ?", (promotion_id,))
-    if not await cursor.fetchone():
+    if not await submit_statement("DELETE FROM promotions WHERE id = ?", (promotion_id,)):
         raise HTTPException(status_code=404, detail="Promocion no encontrada")
-    
-    await db.execute("DELETE FROM promotions WHERE id = ?", (promotion_id,))
-    await db.commit()
+    await refresh_catalog(db)
     
     return {"message": "Promocion eliminada exitosamente"}
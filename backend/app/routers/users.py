@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import aiosqlite
-from app.database import get_db
+from app.database import get_read_db, submit_statement, submit_write
 from app.utils.auth import get_admin_user, get_password_hash
+from app.statements import USER_BY_ID, USER_SORTS, user_list
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, page_size, parse_sort, set_next_cursor
+from app.serialization import json_response
+from app.streaming import check_stream, stream_json_array
 
 router = APIRouter(prefix="/users", tags=["Usuarios"])
 
@@ -39,88 +43,70 @@ class UserUpdate(BaseModel):
 
 @router.get("", response_model=List[UserResponse])
 async def get_users(
+    response: Response,
     role: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None, description="name o created_at; '-' para descendente"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    stream: bool = Query(False, description="Enviar la lista completa en streaming, sin limit ni cursor"),
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    query = "SELECT id, email, name, phone, address, city, purchase_volume, role, is_active FROM users WHERE 1=1"
-    params = []
-    
-    if role:
-        query += " AND role = ?"
-        params.append(role)
-    
-    if search:
-        query += " AND (name LIKE ? OR email LIKE ? OR phone LIKE ?)"
-        params.extend([f"%{search}%", f"%{search}%", f"%{search}%"])
-    
-    query += " ORDER BY name"
-    
-    cursor = await db.execute(query, params)
-    rows = await cursor.fetchall()
-    
-    return [UserResponse(
-        id=row['id'],
-        email=row['email'],
-        name=row['name'],
-        phone=row['phone'],
-        address=row['address'],
-        city=row['city'],
-        purchase_volume=row['purchase_volume'],
-        role=row['role'],
-        is_active=bool(row['is_active'])
-    ) for row in rows]
+    sort_key, descending = parse_sort(sort, USER_SORTS, "name")
+    sort_label = f"{'-' if descending else ''}{sort_key}"
+    size = page_size(limit, cursor)
+    check_stream(stream, size)
+    after = decode_cursor(cursor, sort_label, len(USER_SORTS[sort_key]) + 1)
+    
+    statement, params = user_list(role, search, sort_key, descending, after, size is not None)
+    if stream:
+        return stream_json_array(db, statement, params)
+    
+    if size is None:
+        return json_response(await statement.fetch_all(db, params))
+    
+    rows, next_key = await statement.fetch_page(db, params, size)
+    set_next_cursor(response, sort_label, next_key)
+    return json_response(rows, response)
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute(
-        "SELECT id, email, name, phone, address, city, purchase_volume, role, is_active FROM users WHERE id = ?",
-        (user_id,)
-    )
-    row = await cursor.fetchone()
+    row = await USER_BY_ID.fetch_one(db, (user_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    return UserResponse(
-        id=row['id'],
-        email=row['email'],
-        name=row['name'],
-        phone=row['phone'],
-        address=row['address'],
-        city=row['city'],
-        purchase_volume=row['purchase_volume'],
-        role=row['role'],
-        is_active=bool(row['is_active'])
-    )
+    return UserResponse(**row)
 
 @router.post("", response_model=UserResponse)
 async def create_user(
     user: UserCreate,
-    admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    admin: dict = Depends(get_admin_user)
 ):
-    cursor = await db.execute("SELECT id FROM users WHERE email = ?", (user.email,))
-    if await cursor.fetchone():
-        raise HTTPException(status_code=400, detail="El email ya esta registrado")
-    
     if user.role not in ['admin', 'buyer']:
         raise HTTPException(status_code=400, detail="Rol invalido. Roles validos: admin, buyer")
     
+    # Hashed before the write, which only takes the writer for the insert
     password_hash = get_password_hash(user.password)
     
-    cursor = await db.execute(
-        """INSERT INTO users (email, password_hash, name, phone, address, city, purchase_volume, role) 
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (user.email, password_hash, user.name, user.phone, user.address, user.city, user.purchase_volume, user.role)
-    )
-    await db.commit()
-    user_id = cursor.lastrowid
+    async def write(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute("SELECT id FROM users WHERE email = ?", (user.email,))
+        if await cursor.fetchone():
+            raise HTTPException(status_code=400, detail="El email ya esta registrado")
+        
+        cursor = await db.execute(
+            """INSERT INTO users (email, password_hash, name, phone, address, city, purchase_volume, role) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (user.email, password_hash, user.name, user.phone, user.address, user.city, user.purchase_volume, user.role)
+        )
+        return cursor.lastrowid
+    
+    user_id = await submit_write(write)
     
     return UserResponse(
         id=user_id,
@@ -139,12 +125,8 @@ async def update_user(
     user_id: int,
     user: UserUpdate,
     admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ):
-    cursor = await db.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-    if not await cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
     updates = []
     values = []
     
@@ -174,46 +156,25 @@ async def update_user(
     
     if updates:
         values.append(user_id)
-        await db.execute(
-            f"UPDATE users SET {', '.join(updates)} WHERE id = ?",
-            values
-        )
-        await db.commit()
+        if not await submit_statement(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", values):
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    cursor = await db.execute(
-        "SELECT id, email, name, phone, address, city, purchase_volume, role, is_active FROM users WHERE id = ?",
-        (user_id,)
-    )
-    row = await cursor.fetchone()
+    # The reader the auth dependency already holds
+    row = await USER_BY_ID.fetch_one(db, (user_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    return UserResponse(
-        id=row['id'],
-        email=row['email'],
-        name=row['name'],
-        phone=row['phone'],
-        address=row['address'],
-        city=row['city'],
-        purchase_volume=row['purchase_volume'],
-        role=row['role'],
-        is_active=bool(row['is_active'])
-    )
+    return UserResponse(**row)
 
 @router.delete("/{user_id}")
 async def deactivate_user(
     user_id: int,
-    admin: dict = Depends(get_admin_user),
-    db: aiosqlite.Connection = Depends(get_db)
+    admin: dict = Depends(get_admin_user)
 ):
-    cursor = await db.execute("SELECT id, role FROM users WHERE id = ?", (user_id,))
-    user = await cursor.fetchone()
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
     if user_id == admin['id']:
         raise HTTPException(status_code=400, detail="No puedes desactivar tu propia cuenta")
     
-    await db.execute("UPDATE users SET is_active = 0 WHERE id = ?", (user_id,))
-    await db.commit()
+    if not await submit_statement("UPDATE users SET is_active = 0 WHERE id = ?", (user_id,)):
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     return {"message": "Usuario desactivado exitosamente"}
@@ -0,0 +1,117 @@
+"""Fast JSON encoding for list responses.
+
+The statements' mappers already turn rows into dicts with exactly the
+fields, in the same order and with the same types as the response models.
+Handlers return those dicts through ``json_response``, which encodes them
+straight to bytes, instead of building Pydantic objects that FastAPI would
+then validate again against ``response_model`` and encode with the
+standard library. The routes keep declaring ``response_model``, so the
+OpenAPI schema is unchanged. Encoding uses orjson, a declared dependency;
+an environment without it falls back to the standard library with the
+same output, and ``tests/load/serialization.py`` compares both paths per
+endpoint.
+
+Documents that are served many times per change, such as the catalog
+bootstrap, are compressed once by ``precompress`` and sent with
+``compressed_response``. gzip is always available; brotli is declared too,
+and an environment without it only offers gzip.
+"""
+import gzip
+import json
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MEDIA_TYPE = "application/json"
+# Compressed once per document, so more effort than a per-response
+# middleware could afford
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 7
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def carried_headers(response: Optional[Response]) -> Optional[dict]:
+    """Headers set on the endpoint's injected ``response``.
+
+    FastAPI drops them when the endpoint returns its own response, so they
+    are copied over (cursors, ETag, Cache-Control).
+    """
+    if response is None:
+        return None
+    return {name: value for name, value in response.headers.items() if name != "content-length"}
+
+
+def json_response(content: Any, response: Optional[Response] = None) -> Response:
+    """``content``, or already encoded bytes, as a JSON response."""
+    body = content if isinstance(content, bytes) else dumps(content)
+    return Response(body, media_type=JSON_MEDIA_TYPE, headers=carried_headers(response))
+
+
+def precompress(body: bytes) -> dict[str, bytes]:
+    """``body`` keyed by content coding, best first; "identity" is ``body``."""
+    variants = {}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the bytes stable across rebuilds of the same document
+    variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    variants["identity"] = body
+    return variants
+
+
+def _accepted_encodings(header: Optional[str]) -> dict[str, float]:
+    weights = {}
+    for part in (header or "").split(","):
+        name, *params = [piece.strip() for piece in part.split(";")]
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            if param.lower().startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+    return weights
+
+
+def choose_encoding(accept_encoding: Optional[str], available) -> str:
+    """The content coding of ``available`` (best first) the client prefers.
+
+    Falls back to "identity", which clients accept unless they refuse it
+    explicitly; that case is not worth a 406 here.
+    """
+    weights = _accepted_encodings(accept_encoding)
+    best, best_weight = "identity", 0.0
+    for encoding in available:
+        if encoding == "identity":
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressed_response(variants: dict[str, bytes], request: Request, response: Optional[Response] = None) -> Response:
+    """The variant from ``precompress`` that suits the request's Accept-Encoding."""
+    encoding = choose_encoding(request.headers.get("accept-encoding"), variants)
+    headers = carried_headers(response) or {}
+    headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(variants[encoding], media_type=JSON_MEDIA_TYPE, headers=headers)
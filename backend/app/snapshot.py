@@ -0,0 +1,158 @@
+"""Read-only in-memory snapshot of the catalog tables.
+
+Catalog reads vastly outnumber catalog writes. With ``DB_CATALOG_SNAPSHOT=1``
+the categories, products, promotions and effective price tables are copied
+into an in-memory SQLite database, serialized to bytes once, and every snapshot
+reader connection is created by deserializing that image. Catalog GETs then
+never touch the database file and never wait behind order writes.
+
+Mutations call ``CatalogSnapshot.refresh`` after committing. A new image is
+built from the committed data, gets its own reader pool and replaces the
+current one in a single assignment; requests already holding a reader from
+the old pool finish on it and its connections are closed on release.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Optional
+
+import aiosqlite
+
+from app.pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TABLES = ("categories", "products", "promotions", "product_effective_price")
+# Full-text indexes over catalog tables, recreated and rebuilt in the image
+CATALOG_SEARCH_TABLES = ("products_fts",)
+
+
+def build_catalog_image(path: str) -> bytes:
+    """Copy the catalog tables of ``path`` into memory and serialize them.
+
+    Only the catalog tables and their indexes are copied; a backup of the
+    whole file would drag the orders along. All tables are read in one
+    transaction so the image is a consistent point in time. Full-text
+    indexes are created empty and rebuilt from the copied rows.
+    """
+    mem = sqlite3.connect(":memory:", isolation_level=None)
+    try:
+        mem.execute("ATTACH DATABASE ? AS src", (path,))
+        names = CATALOG_TABLES + CATALOG_SEARCH_TABLES
+        placeholders = ", ".join("?" for _ in names)
+        mem.execute("BEGIN")
+        schema = mem.execute(
+            f"""
+            SELECT type, name, sql FROM src.sqlite_master
+            WHERE tbl_name IN ({placeholders}) AND type IN ('table', 'index') AND sql IS NOT NULL
+            ORDER BY type = 'index'
+            """,
+            names,
+        ).fetchall()
+        search_tables = []
+        for kind, name, sql in schema:
+            mem.execute(sql)
+            if name in CATALOG_SEARCH_TABLES:
+                search_tables.append(name)
+            elif kind == "table":
+                mem.execute(f"INSERT INTO main.{name} SELECT * FROM src.{name}")
+        for name in search_tables:
+            mem.execute(f"INSERT INTO main.{name} ({name}) VALUES ('rebuild')")
+        mem.execute("COMMIT")
+        mem.execute("DETACH DATABASE src")
+        return mem.serialize()
+    finally:
+        mem.close()
+
+
+def _snapshot_connector(image: bytes):
+    async def connect() -> aiosqlite.Connection:
+        def open_image() -> sqlite3.Connection:
+            conn = sqlite3.connect(":memory:")
+            conn.deserialize(image)
+            conn.execute("PRAGMA query_only = ON")
+            return conn
+
+        db = await aiosqlite.Connection(open_image, 64)
+        db.row_factory = aiosqlite.Row
+        return db
+
+    return connect
+
+
+class CatalogSnapshot:
+    def __init__(self, path: str, min_size: int = 1, max_size: int = 10, acquire_timeout: float = 10.0):
+        self.path = path
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.pool: Optional[ConnectionPool] = None
+        self._lock = asyncio.Lock()
+        self._requested = 0
+        self._built = 0
+        self._image_size = 0
+        self._built_at: Optional[float] = None
+        self._build_ms = 0.0
+        self._rebuilds = 0
+        self._failures = 0
+
+    async def refresh(self):
+        """Rebuild the snapshot from the committed state of the database.
+
+        Concurrent calls are coalesced: a caller that finds a rebuild
+        started after its own request already finished returns at once.
+        If the rebuild fails the snapshot is dropped, so catalog reads fall
+        back to the database until the next successful refresh.
+        """
+        self._requested += 1
+        wanted = self._requested
+        async with self._lock:
+            if self._built >= wanted:
+                return
+            target = self._requested
+            started = time.perf_counter()
+            try:
+                image = await asyncio.to_thread(build_catalog_image, self.path)
+                pool = ConnectionPool(
+                    _snapshot_connector(image),
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    acquire_timeout=self.acquire_timeout,
+                    name="catalog",
+                )
+                await pool.open()
+            except Exception:
+                self._failures += 1
+                logger.exception("Catalog snapshot rebuild failed; reading the catalog from disk")
+                old, self.pool = self.pool, None
+                if old is not None:
+                    await old.close()
+                return
+
+            old, self.pool = self.pool, pool
+            self._built = target
+            self._rebuilds += 1
+            self._image_size = len(image)
+            self._built_at = time.time()
+            self._build_ms = (time.perf_counter() - started) * 1000
+            if old is not None:
+                await old.close()
+        logger.debug("Catalog snapshot rebuilt (%d bytes) in %.1f ms", self._image_size, self._build_ms)
+
+    def stats(self) -> dict:
+        return {
+            "available": self.pool is not None,
+            "image_bytes": self._image_size,
+            "built_at": self._built_at,
+            "last_build_ms": round(self._build_ms, 3),
+            "rebuilds": self._rebuilds,
+            "failures": self._failures,
+            "pool": self.pool.stats() if self.pool is not None else None,
+        }
+
+    async def close(self):
+        async with self._lock:
+            if self.pool is not None:
+                await self.pool.close()
+                self.pool = None
@@ -0,0 +1,630 @@
+"""Named SQL statements shared by the routers.
+
+Each query the API runs more than once lives here exactly once, together
+with the mapper that turns its rows into response dicts. Keeping a single
+canonical SQL string per statement lets every pooled connection reuse its
+prepared statement from sqlite3's statement cache, and ``Statement``
+records call counts and timings per name (see ``statement_stats``).
+"""
+import re
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+import aiosqlite
+
+from app.migrations import CATALOG_DISCOUNTS, EFFECTIVE_PRICE_REFRESH_SQL
+
+Mapper = Callable[[aiosqlite.Row], dict]
+
+_stats: dict[str, list] = {}
+
+
+class Statement:
+    def __init__(self, name: str, sql: str, mapper: Optional[Mapper] = None, key: Sequence[str] = ()):
+        self.name = name
+        self.sql = " ".join(sql.split())
+        self.mapper = mapper
+        # Result columns of the sort key, for statements that read pages
+        self.key = tuple(key)
+
+    def __repr__(self):
+        return f"<Statement {self.name}>"
+
+    def _record(self, started: float):
+        entry = _stats.setdefault(self.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - started
+
+    async def execute(self, db: aiosqlite.Connection, params: Sequence[Any] = ()):
+        started = time.perf_counter()
+        try:
+            return await db.execute(self.sql, params)
+        finally:
+            self._record(started)
+
+    async def fetch_one(self, db: aiosqlite.Connection, params: Sequence[Any] = ()):
+        started = time.perf_counter()
+        try:
+            cursor = await db.execute(self.sql, params)
+            row = await cursor.fetchone()
+        finally:
+            self._record(started)
+        if row is None or self.mapper is None:
+            return row
+        return self.mapper(row)
+
+    async def fetch_all(self, db: aiosqlite.Connection, params: Sequence[Any] = ()) -> list:
+        started = time.perf_counter()
+        try:
+            cursor = await db.execute(self.sql, params)
+            rows = await cursor.fetchall()
+        finally:
+            self._record(started)
+        if self.mapper is None:
+            return list(rows)
+        mapper = self.mapper
+        return [mapper(row) for row in rows]
+
+    async def fetch_page(self, db: aiosqlite.Connection, params: Sequence[Any], limit: int) -> tuple[list, Optional[list]]:
+        """Fetch up to ``limit`` rows of a statement ending in ``LIMIT ?``.
+
+        Returns the mapped rows and the sort key of the last one when more
+        rows follow, None otherwise.
+        """
+        started = time.perf_counter()
+        try:
+            cursor = await db.execute(self.sql, [*params, limit + 1])
+            rows = await cursor.fetchall()
+        finally:
+            self._record(started)
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = [rows[-1][column] for column in self.key]
+        if self.mapper is None:
+            return list(rows), next_key
+        mapper = self.mapper
+        return [mapper(row) for row in rows], next_key
+
+    async def iterate(self, db: aiosqlite.Connection, params: Sequence[Any] = (), size: int = 500) -> AsyncIterator[list]:
+        """Yield the result ``size`` rows at a time instead of all at once."""
+        cursor = await self.execute(db, params)
+        try:
+            while rows := await cursor.fetchmany(size):
+                if self.mapper is None:
+                    yield list(rows)
+                else:
+                    yield [self.mapper(row) for row in rows]
+        finally:
+            await cursor.close()
+
+
+def statement_stats() -> dict:
+    return {
+        name: {"calls": calls, "total_ms": round(total * 1000, 3), "avg_ms": round(total / calls * 1000, 3)}
+        for name, (calls, total) in sorted(_stats.items())
+        if calls
+    }
+
+
+# Sorting. Each list endpoint whitelists sort keys, mapping them to the SQL
+# expressions to order by and the result columns holding their values. The
+# id is always appended so the order is total and pages never overlap.
+
+def _keyset(columns: Sequence[tuple[str, str]], descending: bool, after: bool, paged: bool) -> tuple[str, str]:
+    """WHERE fragment and ORDER BY/LIMIT clause for a keyset sort."""
+    expressions = [expression for expression, _ in columns]
+    where = ""
+    if after:
+        placeholders = ", ".join("?" for _ in expressions)
+        where = f" AND ({', '.join(expressions)}) {'<' if descending else '>'} ({placeholders})"
+    order = " ORDER BY " + ", ".join(f"{expression}{' DESC' if descending else ''}" for expression in expressions)
+    if paged:
+        order += " LIMIT ?"
+    return where, order
+
+
+def _sort_flags(sort: str, descending: bool, after: bool, paged: bool) -> list[str]:
+    flags = [f"{'-' if descending else ''}{sort}"]
+    if after:
+        flags.append("after")
+    if paged:
+        flags.append("page")
+    return flags
+
+
+# Mappers
+
+def map_category(row) -> dict:
+    return {
+        "id": row['id'],
+        "name": row['name'],
+        "description": row['description'],
+        "image_url": row['image_url'],
+    }
+
+
+def map_product(row) -> dict:
+    discount = row['discount_percent'] or 0
+    final_price = row['final_price']
+    if final_price is None:
+        # Not materialized yet; see EFFECTIVE_PRICE_REFRESH
+        final_price = row['price'] * (1 - discount / 100) if discount else row['price']
+    return {
+        "id": row['id'],
+        "name": row['name'],
+        "description": row['description'],
+        "price": row['price'],
+        "unit": row['unit'],
+        "category_id": row['category_id'],
+        "category_name": row['category_name'],
+        "image_url": row['image_url'],
+        "image_url_2": row['image_url_2'],
+        "stock": row['stock'],
+        "min_order": row['min_order'],
+        "is_active": bool(row['is_active']),
+        "discount_percent": discount if discount else None,
+        "final_price": round(final_price, 2),
+    }
+
+
+def map_promotion(row) -> dict:
+    return {
+        "id": row['id'],
+        "name": row['name'],
+        "description": row['description'],
+        "discount_percent": row['discount_percent'],
+        "product_id": row['product_id'],
+        "product_name": row['product_name'],
+        "category_id": row['category_id'],
+        "category_name": row['category_name'],
+        "start_date": row['start_date'],
+        "end_date": row['end_date'],
+        "is_active": bool(row['is_active']),
+    }
+
+
+def item_subtotal(quantity: float, price: float, discount: float) -> float:
+    return round(quantity * price * (1 - discount / 100), 2)
+
+
+def map_order_item(row) -> dict:
+    return {
+        "id": row['id'],
+        "product_id": row['product_id'],
+        "product_name": row['product_name'],
+        "quantity": row['quantity'],
+        "price": row['price'],
+        "discount": row['discount'],
+        "subtotal": item_subtotal(row['quantity'], row['price'], row['discount']),
+    }
+
+
+def map_order(row) -> dict:
+    """Order header; callers fill in ``items``."""
+    return {
+        "id": row['id'],
+        "user_id": row['user_id'],
+        "user_name": row['user_name'] if row['user_name'] else row['guest_name'] or 'Invitado',
+        "user_phone": row['user_phone'] if row['user_phone'] else row['guest_phone'],
+        "guest_name": row['guest_name'],
+        "guest_phone": row['guest_phone'],
+        "guest_address": row['guest_address'],
+        "payment_method": row['payment_method'],
+        "status": row['status'],
+        "total": row['total'],
+        "notes": row['notes'],
+        "items": [],
+        "created_at": row['created_at'],
+    }
+
+
+def map_user(row) -> dict:
+    return {
+        "id": row['id'],
+        "email": row['email'],
+        "name": row['name'],
+        "phone": row['phone'],
+        "address": row['address'],
+        "city": row['city'],
+        "purchase_volume": row['purchase_volume'],
+        "role": row['role'],
+        "is_active": bool(row['is_active']),
+    }
+
+
+# Categories
+
+CATEGORY_LIST = Statement(
+    "category_list",
+    "SELECT id, name, description, image_url FROM categories ORDER BY name",
+    map_category,
+)
+
+CATEGORY_BY_ID = Statement(
+    "category_by_id",
+    "SELECT id, name, description, image_url FROM categories WHERE id = ?",
+    map_category,
+)
+
+
+# Products
+
+# A product's discount is the best running promotion on the product itself
+# or on its category. Reads take it from product_effective_price, which
+# triggers keep in sync with products and promotions (see
+# migrations.EFFECTIVE_PRICES) and EFFECTIVE_PRICE_REFRESH brings up to date
+# when a promotion starts or ends.
+PRODUCT_PRICE_JOIN = "LEFT JOIN product_effective_price e ON e.product_id = p.id"
+
+PRODUCT_COLUMNS = """
+    SELECT p.id, p.name, p.description, p.price, p.unit, p.category_id,
+           c.name as category_name, p.image_url, p.image_url_2, p.stock, p.min_order, p.is_active,
+           p.created_at, e.discount_percent, e.final_price
+"""
+
+PRODUCT_SELECT = PRODUCT_COLUMNS + f"""
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    {PRODUCT_PRICE_JOIN}
+"""
+
+# Search results come from the full-text index; see migrations.PRODUCT_SEARCH.
+# Name matches weigh more than description matches.
+PRODUCT_RANK = "bm25(products_fts, 10.0, 1.0)"
+
+PRODUCT_SEARCH_SELECT = PRODUCT_COLUMNS + f"""
+    , {PRODUCT_RANK} as rank
+    FROM products_fts
+    JOIN products p ON p.id = products_fts.rowid
+    LEFT JOIN categories c ON p.category_id = c.id
+    {PRODUCT_PRICE_JOIN}
+"""
+
+_SEARCH_TOKEN = re.compile(r"\w+")
+
+
+def search_query(text: str) -> str:
+    """Turn user input into an FTS5 query: every word must match as a prefix.
+
+    Words are quoted so that FTS5 operators typed by the user are taken
+    literally. Input without any word becomes the empty phrase, which
+    matches nothing.
+    """
+    tokens = _SEARCH_TOKEN.findall(text)
+    if not tokens:
+        return '""'
+    return " ".join(f'"{token}"*' for token in tokens)
+
+PRODUCT_BY_ID = Statement("product_by_id", PRODUCT_SELECT + " WHERE p.id = ?", map_product)
+
+# Products whose ids are in a JSON array
+PRODUCT_BY_IDS = Statement(
+    "product_by_ids",
+    PRODUCT_SELECT + " WHERE p.id IN (SELECT value FROM json_each(?)) ORDER BY p.id",
+    map_product,
+)
+
+
+# "relevance" only applies to searches
+PRODUCT_SORTS = {
+    "name": [("p.name", "name")],
+    "price": [("p.price", "price")],
+    "created_at": [("p.created_at", "created_at")],
+    "relevance": [(PRODUCT_RANK, "rank")],
+}
+
+
+@lru_cache(maxsize=None)
+def _product_list(active_only: bool, by_category: bool, by_search: bool,
+                  sort: str, descending: bool, after: bool, paged: bool) -> Statement:
+    if by_search:
+        sql = PRODUCT_SEARCH_SELECT + " WHERE products_fts MATCH ?"
+    else:
+        sql = PRODUCT_SELECT + " WHERE 1=1"
+    if active_only:
+        sql += " AND p.is_active = 1"
+    if by_category:
+        sql += " AND p.category_id = ?"
+    columns = PRODUCT_SORTS[sort] + [("p.id", "id")]
+    where, order = _keyset(columns, descending, after, paged)
+    sql += where + order
+    flags = [name for name, on in (("active", active_only), ("category", by_category), ("search", by_search)) if on]
+    flags += _sort_flags(sort, descending, after, paged)
+    return Statement(f"product_list[{','.join(flags)}]", sql, map_product, key=[column for _, column in columns])
+
+
+def product_list(category_id: Optional[int], search: Optional[str], active_only: bool,
+                 sort: str = "name", descending: bool = False,
+                 after: Optional[list] = None, paged: bool = False) -> tuple[Statement, list]:
+    params = []
+    if search:
+        params.append(search_query(search))
+    if category_id:
+        params.append(category_id)
+    if after is not None:
+        params.extend(after)
+    statement = _product_list(active_only, bool(category_id), bool(search), sort, descending, after is not None, paged)
+    return statement, params
+
+
+# Pricing data for the products of an order (a JSON array of ids); raw rows.
+PRODUCTS_FOR_ORDER = Statement("products_for_order", f"""
+    SELECT p.id, p.name, p.price, p.stock, p.min_order, p.is_active, e.discount_percent
+    FROM products p
+    {PRODUCT_PRICE_JOIN}
+    WHERE p.id IN (SELECT value FROM json_each(?))
+""")
+
+# Columns of the bulk import and export files
+PRODUCT_FILE_COLUMNS = (
+    "id", "name", "description", "price", "unit", "category_id",
+    "image_url", "image_url_2", "stock", "min_order", "is_active",
+)
+
+PRODUCT_EXPORT = Statement(
+    "product_export",
+    f"SELECT {', '.join(PRODUCT_FILE_COLUMNS)} FROM products ORDER BY id",
+)
+
+# Which of a JSON array of ids exist
+PRODUCT_IDS_EXISTING = Statement(
+    "product_ids_existing",
+    "SELECT id FROM products WHERE id IN (SELECT value FROM json_each(?))",
+)
+
+
+# Recompute every product's effective price, writing only the rows whose
+# discount changed. Run when a promotion boundary passes; each written row
+# bumps catalog_version through its trigger. Same text as migration 7 uses.
+EFFECTIVE_PRICE_REFRESH = Statement("effective_price_refresh", EFFECTIVE_PRICE_REFRESH_SQL)
+
+# Whether a promotion started or ended without EFFECTIVE_PRICE_REFRESH
+# running since, e.g. while no worker was up. A read, so checking costs no
+# write transaction.
+EFFECTIVE_PRICE_STALE = Statement("effective_price_stale", f"""
+    SELECT EXISTS (
+        SELECT 1 FROM ({CATALOG_DISCOUNTS}) AS d
+        LEFT JOIN product_effective_price e ON e.product_id = d.id
+        WHERE e.product_id IS NULL OR e.discount_percent IS NOT d.discount_percent
+    ) AS stale
+""")
+
+
+# Promotions
+
+PROMOTION_SELECT = """
+    SELECT pr.id, pr.name, pr.description, pr.discount_percent,
+           pr.product_id, p.name as product_name,
+           pr.category_id, c.name as category_name,
+           pr.start_date, pr.end_date, pr.is_active
+    FROM promotions pr
+    LEFT JOIN products p ON pr.product_id = p.id
+    LEFT JOIN categories c ON pr.category_id = c.id
+"""
+
+PROMOTION_BY_ID = Statement("promotion_by_id", PROMOTION_SELECT + " WHERE pr.id = ?", map_promotion)
+
+PROMOTION_LIST_ALL = Statement(
+    "promotion_list_all",
+    PROMOTION_SELECT + " ORDER BY pr.created_at DESC",
+    map_promotion,
+)
+
+PROMOTION_LIST_ACTIVE = Statement(
+    "promotion_list_active",
+    PROMOTION_SELECT + """
+        WHERE pr.is_active = 1 AND datetime('now') BETWEEN pr.start_date AND pr.end_date
+        ORDER BY pr.created_at DESC
+    """,
+    map_promotion,
+)
+
+# Next moment a running promotion ends or a scheduled one starts, i.e. when
+# running discounts change on their own.
+NEXT_BOUNDARY = """
+    SELECT MIN(boundary) FROM (
+        SELECT start_date AS boundary FROM promotions
+        WHERE is_active = 1 AND start_date > datetime('now')
+        UNION ALL
+        SELECT end_date FROM promotions
+        WHERE is_active = 1 AND end_date >= datetime('now')
+    )
+"""
+
+PROMOTION_NEXT_BOUNDARY = Statement(
+    "promotion_next_boundary",
+    f"SELECT ({NEXT_BOUNDARY}) AS boundary",
+)
+
+# The version is bumped by triggers on every change to categories, products
+# or promotions; together with the next promotion boundary it identifies
+# what the catalog endpoints return.
+CATALOG_STATE = Statement("catalog_state", f"""
+    SELECT (SELECT version FROM catalog_version WHERE id = 1) AS version,
+           ({NEXT_BOUNDARY}) AS boundary
+""")
+
+
+# Orders
+
+ORDER_SELECT = """
+    SELECT o.id, o.user_id, u.name as user_name, u.phone as user_phone,
+           o.guest_name, o.guest_phone, o.guest_address, o.payment_method,
+           o.status, o.total, o.notes, o.created_at
+    FROM orders o
+    LEFT JOIN users u ON o.user_id = u.id
+"""
+
+ORDER_BY_ID = Statement("order_by_id", ORDER_SELECT + " WHERE o.id = ?", map_order)
+
+
+ORDER_SORTS = {
+    "created_at": [("o.created_at", "created_at")],
+    "status": [("o.status", "status"), ("o.created_at", "created_at")],
+}
+
+
+@lru_cache(maxsize=None)
+def _order_list(by_user: bool, by_status: bool, by_payment: bool, since: bool, before: bool,
+                sort: str, descending: bool, after: bool, paged: bool) -> Statement:
+    sql = ORDER_SELECT + " WHERE 1=1"
+    if by_user:
+        sql += " AND o.user_id = ?"
+    if by_status:
+        sql += " AND o.status = ?"
+    if by_payment:
+        sql += " AND o.payment_method = ?"
+    if since:
+        sql += " AND o.created_at >= ?"
+    if before:
+        sql += " AND o.created_at < ?"
+    columns = ORDER_SORTS[sort] + [("o.id", "id")]
+    where, order = _keyset(columns, descending, after, paged)
+    sql += where + order
+    flags = [
+        name for name, on in (
+            ("user", by_user), ("status", by_status), ("payment", by_payment), ("since", since), ("before", before)
+        ) if on
+    ]
+    flags += _sort_flags(sort, descending, after, paged)
+    return Statement(f"order_list[{','.join(flags)}]", sql, map_order, key=[column for _, column in columns])
+
+
+def order_list(user_id: Optional[int], status: Optional[str],
+               sort: str = "created_at", descending: bool = True,
+               after: Optional[list] = None, paged: bool = False,
+               payment_method: Optional[str] = None,
+               created_since: Optional[str] = None, created_before: Optional[str] = None) -> tuple[Statement, list]:
+    """``created_since`` and ``created_before`` bound ``created_at`` as
+    ``>=`` and ``<``, in SQLite's ``datetime('now')`` format."""
+    params = []
+    if user_id is not None:
+        params.append(user_id)
+    if status:
+        params.append(status)
+    if payment_method:
+        params.append(payment_method)
+    if created_since:
+        params.append(created_since)
+    if created_before:
+        params.append(created_before)
+    if after is not None:
+        params.extend(after)
+    statement = _order_list(
+        user_id is not None, bool(status), bool(payment_method), bool(created_since), bool(created_before),
+        sort, descending, after is not None, paged
+    )
+    return statement, params
+
+
+ORDER_ITEMS_BY_ORDER = Statement("order_items_by_order", """
+    SELECT oi.id, oi.product_id, p.name as product_name,
+           oi.quantity, oi.price, oi.discount
+    FROM order_items oi
+    JOIN products p ON oi.product_id = p.id
+    WHERE oi.order_id = ?
+""", map_order_item)
+
+# Items of several orders (a JSON array of ids), grouped by order
+ORDER_ITEMS_BY_ORDERS = Statement("order_items_by_orders", """
+    SELECT oi.order_id, oi.id, oi.product_id, p.name as product_name,
+           oi.quantity, oi.price, oi.discount
+    FROM order_items oi
+    JOIN products p ON oi.product_id = p.id
+    WHERE oi.order_id IN (SELECT value FROM json_each(?))
+    ORDER BY oi.order_id, oi.id
+""")
+
+# Quantity of each product over a set of orders (a JSON array of ids);
+# several lines may share a product
+_ORDER_NEEDS = """
+    SELECT product_id, SUM(quantity) AS quantity FROM order_items
+    WHERE order_id IN (SELECT value FROM json_each(?)) GROUP BY product_id
+"""
+
+# Takes the orders' quantities off every product that has enough stock, in
+# one statement. Params: the JSON array of order ids twice. Each reserved
+# product comes back with how many products the orders need; fewer rows
+# than that means some are short, and the caller must roll the statement
+# back.
+ORDER_STOCK_RESERVE = Statement("order_stock_reserve", f"""
+    UPDATE products SET stock = stock - needed.quantity, updated_at = CURRENT_TIMESTAMP
+    FROM ({_ORDER_NEEDS}) AS needed
+    WHERE products.id = needed.product_id AND products.stock >= needed.quantity
+    RETURNING id, (SELECT COUNT(DISTINCT product_id) FROM order_items
+                   WHERE order_id IN (SELECT value FROM json_each(?))) AS wanted
+""")
+
+# Products of a set of orders left out of a reservation (a JSON array of the
+# reserved ids), with the stock they have and the quantity asked for
+ORDER_STOCK_SHORTAGES = Statement("order_stock_shortages", """
+    SELECT p.id, p.name, COALESCE(p.stock, 0) AS stock, SUM(oi.quantity) AS quantity
+    FROM order_items oi
+    JOIN products p ON oi.product_id = p.id
+    WHERE oi.order_id IN (SELECT value FROM json_each(?)) AND oi.product_id NOT IN (SELECT value FROM json_each(?))
+    GROUP BY p.id
+    ORDER BY p.name
+""")
+
+# Current status of several orders (a JSON array of ids)
+ORDER_STATUSES_BY_IDS = Statement("order_statuses_by_ids", """
+    SELECT id, status FROM orders WHERE id IN (SELECT value FROM json_each(?))
+""")
+
+# Gives the quantities of a set of orders back to their products
+ORDER_STOCK_RELEASE = Statement("order_stock_release", f"""
+    UPDATE products SET stock = stock + needed.quantity, updated_at = CURRENT_TIMESTAMP
+    FROM ({_ORDER_NEEDS}) AS needed
+    WHERE products.id = needed.product_id
+""")
+
+
+# Idempotency keys
+
+IDEMPOTENCY_LOOKUP = Statement("idempotency_lookup", """
+    SELECT request_hash, response FROM idempotency_keys
+    WHERE scope = ? AND key = ? AND expires_at > datetime('now')
+""")
+
+
+# Users
+
+USER_SELECT = "SELECT id, email, name, phone, address, city, purchase_volume, role, is_active, created_at FROM users"
+
+USER_BY_ID = Statement("user_by_id", USER_SELECT + " WHERE id = ?", map_user)
+
+
+USER_SORTS = {
+    "name": [("name", "name")],
+    "created_at": [("created_at", "created_at")],
+}
+
+
+@lru_cache(maxsize=None)
+def _user_list(by_role: bool, by_search: bool, sort: str, descending: bool, after: bool, paged: bool) -> Statement:
+    sql = USER_SELECT + " WHERE 1=1"
+    if by_role:
+        sql += " AND role = ?"
+    if by_search:
+        sql += " AND (name LIKE ? OR email LIKE ? OR phone LIKE ?)"
+    columns = USER_SORTS[sort] + [("id", "id")]
+    where, order = _keyset(columns, descending, after, paged)
+    sql += where + order
+    flags = [name for name, on in (("role", by_role), ("search", by_search)) if on]
+    flags += _sort_flags(sort, descending, after, paged)
+    return Statement(f"user_list[{','.join(flags)}]", sql, map_user, key=[column for _, column in columns])
+
+
+def user_list(role: Optional[str], search: Optional[str],
+              sort: str = "name", descending: bool = False,
+              after: Optional[list] = None, paged: bool = False) -> tuple[Statement, list]:
+    params = []
+    if role:
+        params.append(role)
+    if search:
+        params.extend([f"%{search}%", f"%{search}%", f"%{search}%"])
+    if after is not None:
+        params.extend(after)
+    return _user_list(bool(role), bool(search), sort, descending, after is not None, paged), params
@@ -0,0 +1,66 @@
+"""Streaming JSON array responses for large lists.
+
+With ``stream=true`` the unpaged list endpoints send their JSON array while
+it is being read: rows are fetched from the cursor ``STREAM_CHUNK_ROWS`` at a
+time, mapped and written out. Memory stays bounded by one chunk whatever the
+size of the table, and the first bytes go out as soon as the first chunk is
+read. The document is the same array the buffered response would contain;
+chunks are encoded like any other list response (see ``app.serialization``).
+"""
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Optional, Sequence
+
+import aiosqlite
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+from app.serialization import JSON_MEDIA_TYPE, carried_headers, dumps
+from app.statements import Statement
+
+STREAM_CHUNK_ROWS = 500
+
+Attach = Callable[[aiosqlite.Connection, list], Awaitable[None]]
+
+
+def check_stream(stream: bool, size: Optional[int]):
+    """Pages are already bounded; streaming only applies to the full list."""
+    if stream and size is not None:
+        raise HTTPException(status_code=400, detail="stream no se puede combinar con limit o cursor")
+
+
+def stream_json_array(
+    connection: aiosqlite.Connection | Callable[[], AsyncContextManager[aiosqlite.Connection]],
+    statement: Statement,
+    params: Sequence[Any],
+    attach: Optional[Attach] = None,
+    response: Optional[Response] = None,
+) -> StreamingResponse:
+    """Stream the mapped rows of ``statement`` as a JSON array.
+
+    ``connection`` is either a function that checks one out, called by the
+    response body itself so the connection is held exactly while rows are
+    being sent, or the reader a request dependency already holds, which
+    FastAPI keeps until the response is sent; the two are told apart by
+    whether ``connection`` is callable, since the held reader may be
+    wrapped by ``app.instrumentation``. Endpoints behind
+    ``get_current_user`` pass the latter: checking out a second reader
+    while holding one can exhaust the pool. ``attach`` may add fields to
+    each chunk of mapped rows before it is serialized, e.g. order items.
+    Headers already set on the endpoint's ``response`` are carried over.
+    """
+    async def body():
+        if callable(connection):
+            checkout = connection()
+        else:
+            checkout = nullcontext(connection)
+        async with checkout as db:
+            separator = b"["
+            async for rows in statement.iterate(db, params, STREAM_CHUNK_ROWS):
+                if attach is not None:
+                    await attach(db, rows)
+                # Each chunk encodes as "[...]"; they are spliced into one array
+                yield separator + dumps(rows)[1:-1]
+                separator = b","
+            yield b"[]" if separator == b"[" else b"]"
+
+    return StreamingResponse(body(), media_type=JSON_MEDIA_TYPE, headers=carried_headers(response))
@@ -6,7 +6,7 @@ import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import aiosqlite
-from app.database import get_db
+from app.database import get_read_db
 
 SECRET_KEY = os.getenv("SECRET_KEY", "tutti-services-secret-key-2024")
 ALGORITHM = "HS256"
@@ -47,7 +47,7 @@ def decode_token(token: str) -> dict:
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_read_db)
 ) -> dict:
     token = credentials.credentials
     payload = decode_token(token)
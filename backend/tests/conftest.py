@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+import uuid
+
+# Read by the app at import time
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="tutti-tests-"), "app.db")
+os.environ["SECRET_KEY"] = "tutti-services-test-secret-key-of-32-bytes"
+
+import httpx
+import pytest
+
+from app.main import app
+from app.utils.auth import create_access_token
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # One event loop for the whole session: the app's pools and background
+    # tasks are module-level and stay bound to the loop that started them
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client(anyio_backend):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+def _query(sql: str, params=()) -> list:
+    conn = sqlite3.connect(os.environ["DATABASE_PATH"])
+    try:
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def query():
+    """Run a statement on the test database outside the app's pools; returns its rows."""
+    return _query
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    admin_id = _query("SELECT id FROM users WHERE role = 'admin' ORDER BY id LIMIT 1")[0][0]
+    return {"Authorization": f"Bearer {create_access_token({'user_id': admin_id, 'role': 'admin'})}"}
+
+
+@pytest.fixture
+async def category(client, admin_headers):
+    """A new, empty category, so listings filtered by it only hold the test's products."""
+    response = await client.post("/categories", headers=admin_headers, json={"name": f"Test {uuid.uuid4().hex}"})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+@pytest.fixture
+def make_product(client, admin_headers, category):
+    async def make_product(**fields) -> dict:
+        body = {"name": f"Producto {uuid.uuid4().hex[:8]}", "price": 1000, "category_id": category, "stock": 100}
+        response = await client.post("/products", headers=admin_headers, json={**body, **fields})
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make_product
+
+
+@pytest.fixture
+def guest_order(client):
+    async def guest_order(items: dict, **fields) -> dict:
+        """Place a guest order of ``{product_id: quantity}``."""
+        response = await client.post("/orders/guest", json={
+            "guest_name": "Invitado", "guest_phone": "3000000000", "guest_address": "Calle 1",
+            "payment_method": "efectivo",
+            "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in items.items()],
+            **fields,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+    return guest_order
+
+
+@pytest.fixture
+async def buyer(client):
+    """A newly registered buyer: its ``id`` and request ``headers``."""
+    response = await client.post("/auth/register", json={
+        "email": f"{uuid.uuid4().hex}@example.com", "password": "secreto123", "name": "Comprador"
+    })
+    assert response.status_code == 200, response.text
+    token = response.json()
+    return {"id": token["user"]["id"], "headers": {"Authorization": f"Bearer {token['access_token']}"}}
@@ -0,0 +1,283 @@
+"""In-process load test for the API.
+
+Seeds a throwaway SQLite database, starts the FastAPI app through its
+lifespan and drives it over an ASGI transport with a weighted mix of
+requests from concurrent workers. Latency percentiles and throughput per
+endpoint are written to a JSON report so runs can be compared.
+
+    cd backend
+    python -m tests.load.run --duration 30 --concurrency 32 --out load.json
+    python -m tests.load.run --memory --products 2000 --orders 20000 --order-items 100000
+    python -m tests.load.run --products 2000 --orders 5000 --order-items 25000 \\
+        --mix products_search=5,guest_order=3,orders_admin=1,orders_buyer=3,order_status=2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from tests.load.seed import SEARCH_TERMS, seed
+
+DEFAULT_MIX = {
+    "products_search": 40,
+    "guest_order": 20,
+    "orders_admin": 5,
+    "orders_buyer": 20,
+    "order_status": 15,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Database file. Defaults to a new temporary file.")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse an already seeded --db")
+    parser.add_argument("--memory", action="store_true", help="Run on the shared in-memory database (no disk I/O)")
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--promotions", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--order-items", type=int, default=1_000_000)
+    parser.add_argument("--buyers", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and request mix")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="Comma separated scenario=weight pairs")
+    parser.add_argument("--out", default="load_results.json")
+    return parser.parse_args(argv)
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario '{name}'. Choose from: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    if not mix or not any(mix.values()):
+        raise SystemExit("The request mix is empty")
+    return mix
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list, statuses: Counter, errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+class Scenarios:
+    """Builds one request per scenario name from the seeded ids."""
+
+    def __init__(self, rng: random.Random, admin_token: str, buyer_tokens: list, product_ids: list, order_ids: list):
+        self.rng = rng
+        self.search_terms = SEARCH_TERMS
+        self.admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        self.buyer_headers = [{"Authorization": f"Bearer {token}"} for token in buyer_tokens]
+        self.product_ids = product_ids
+        self.order_ids = order_ids
+
+    def products_search(self):
+        return "GET", "/products", {"params": {"search": self.rng.choice(self.search_terms)}}
+
+    def guest_order(self):
+        items = [
+            {"product_id": product_id, "quantity": self.rng.choice([5, 10, 20])}
+            for product_id in self.rng.sample(self.product_ids, self.rng.randint(1, 5))
+        ]
+        body = {
+            "guest_name": "Carga",
+            "guest_phone": "3000000000",
+            "guest_address": "Calle 1 # 2-3",
+            "payment_method": "efectivo",
+            "items": items,
+        }
+        return "POST", "/orders/guest", {"json": body}
+
+    def orders_admin(self):
+        return "GET", "/orders", {"headers": self.admin_headers}
+
+    def orders_buyer(self):
+        return "GET", "/orders", {"headers": self.rng.choice(self.buyer_headers)}
+
+    def order_status(self):
+        order_id = self.rng.choice(self.order_ids)
+        status = self.rng.choice(["confirmed", "preparing", "ready", "delivered"])
+        return "PUT", f"/orders/{order_id}/status", {"headers": self.admin_headers, "json": {"status": status}}
+
+
+def load_fixtures(db_path: str):
+    import sqlite3
+    from app.utils.auth import create_access_token
+
+    conn = sqlite3.connect(db_path, uri=db_path.startswith("file:"))
+    try:
+        admin_id = conn.execute("SELECT id FROM users WHERE role = 'admin' ORDER BY id LIMIT 1").fetchone()[0]
+        buyer_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM users WHERE role = 'buyer' AND id IN (SELECT DISTINCT user_id FROM orders) LIMIT 200"
+        )]
+        if not buyer_ids:
+            buyer_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'buyer' LIMIT 200")]
+        product_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM products WHERE is_active = 1 AND min_order <= 5"
+        )]
+        order_ids = [row[0] for row in conn.execute("SELECT id FROM orders")]
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("users", "categories", "products", "promotions", "orders", "order_items")
+        }
+    finally:
+        conn.close()
+
+    if not buyer_ids or not product_ids or not order_ids:
+        raise SystemExit("The database has no buyers, products or orders to exercise")
+
+    admin_token = create_access_token({"user_id": admin_id, "role": "admin"})
+    buyer_tokens = [create_access_token({"user_id": user_id, "role": "buyer"}) for user_id in buyer_ids]
+    return admin_token, buyer_tokens, product_ids, order_ids, counts
+
+
+async def drive(app, scenarios: Scenarios, mix: dict, args) -> dict:
+    import httpx
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = Counter()
+    issued = 0
+    deadline = time.perf_counter() + args.duration
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load.test", timeout=args.timeout) as client:
+        async def worker():
+            nonlocal issued
+            while time.perf_counter() < deadline and (not args.requests or issued < args.requests):
+                issued += 1
+                name = scenarios.rng.choices(names, weights)[0]
+                method, url, kwargs = getattr(scenarios, name)()
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                    await response.aread()
+                    code = response.status_code
+                except Exception as exc:
+                    code = type(exc).__name__
+                latencies[name].append(time.perf_counter() - started)
+                statuses[name][code] += 1
+                if not isinstance(code, int) or code >= 400:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "endpoints": {
+            name: summarize(latencies[name], statuses[name], errors[name], elapsed)
+            for name in names if latencies[name]
+        },
+        "total": summarize(all_latencies, sum(statuses.values(), Counter()), sum(errors.values()), elapsed),
+    }
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    if args.memory:
+        if args.db or args.skip_seed:
+            raise SystemExit("--memory cannot be combined with --db or --skip-seed")
+        os.environ["DATABASE_PATH"] = ":memory:"
+    else:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="tutti-load-"), "app.db")
+        if args.skip_seed and not os.path.exists(db_path):
+            raise SystemExit(f"--skip-seed given but {db_path} does not exist")
+        # app.database reads DATABASE_PATH at import time
+        os.environ["DATABASE_PATH"] = db_path
+
+    from app.database import DATABASE_PATH, init_db
+    from app.main import app
+
+    # In memory mode this is the memdb URI; init_db opens the anchor
+    # connection that keeps it alive while it is seeded
+    db_path = DATABASE_PATH
+
+    await init_db()
+    seed_seconds = 0.0
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(
+            db_path,
+            products=args.products,
+            promotions=args.promotions,
+            orders=args.orders,
+            order_items=args.order_items,
+            buyers=args.buyers,
+            rng_seed=args.seed,
+        )
+        seed_seconds = time.perf_counter() - started
+        print(f"Seeded {db_path} in {seed_seconds:.1f}s", file=sys.stderr)
+
+    admin_token, buyer_tokens, product_ids, order_ids, counts = load_fixtures(db_path)
+    scenarios = Scenarios(random.Random(args.seed), admin_token, buyer_tokens, product_ids, order_ids)
+
+    async with app.router.lifespan_context(app):
+        results = await drive(app, scenarios, mix, args)
+
+    report = {
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "max_requests": args.requests,
+            "mix": mix,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "database": db_path,
+        },
+        "dataset": counts,
+        "seed_s": round(seed_seconds, 3),
+        **results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:16} {stats['requests']:7d} req  {stats['rps']:9.1f} rps  "
+            f"p50 {stats['p50_ms']:9.2f}ms  p95 {stats['p95_ms']:9.2f}ms  "
+            f"p99 {stats['p99_ms']:9.2f}ms  errors {stats['errors']}",
+            file=sys.stderr,
+        )
+    print(f"Report written to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
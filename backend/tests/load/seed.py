@@ -0,0 +1,171 @@
+"""Synthetic data for load tests.
+
+Fills an already-initialized database (schema, admin and categories created by
+``init_db``) with buyers, products, promotions, orders and order items. Rows
+are generated deterministically from ``rng_seed`` and written with
+``executemany`` in large batches inside one transaction.
+"""
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import bcrypt
+
+BUYER_PASSWORD = "password"
+
+PRODUCE = [
+    "Manzana", "Pera", "Banano", "Plátano", "Mango", "Papaya", "Piña", "Fresa",
+    "Mora", "Uva", "Naranja", "Mandarina", "Limón", "Lulo", "Maracuyá", "Guayaba",
+    "Tomate", "Cebolla", "Papa", "Zanahoria", "Lechuga", "Pepino", "Pimentón",
+    "Ahuyama", "Brócoli", "Coliflor", "Espinaca", "Ajo", "Cilantro", "Aguacate",
+    "Yuca", "Arracacha", "Remolacha", "Apio", "Habichuela", "Mazorca",
+]
+VARIETIES = [
+    "criolla", "roja", "verde", "madura", "orgánica", "tipo exportación", "premium",
+    "de primera", "de segunda", "pajarita", "común", "hass", "tommy", "valencia",
+]
+UNITS = ["kg", "lb", "unidad", "caja", "bulto", "atado"]
+STATUSES = ["pending", "confirmed", "preparing", "ready", "delivered", "cancelled"]
+PAYMENT_METHODS = ["efectivo", "transferencia", "nequi", "daviplata"]
+
+SEARCH_TERMS = [p.lower() for p in PRODUCE] + ["madura", "orgánica", "premium", "criolla"]
+
+BATCH_SIZE = 10_000
+
+
+def _timestamp(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _batched(conn: sqlite3.Connection, sql: str, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def seed(
+    path: str,
+    products: int = 20_000,
+    promotions: int = 500,
+    orders: int = 200_000,
+    order_items: int = 1_000_000,
+    buyers: int = 1_000,
+    rng_seed: int = 42,
+) -> dict:
+    rng = random.Random(rng_seed)
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path, isolation_level=None, uri=path.startswith("file:"))
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    try:
+        category_ids = [row[0] for row in conn.execute("SELECT id FROM categories")]
+        if not category_ids:
+            raise RuntimeError("init_db must run before seeding")
+
+        password_hash = bcrypt.hashpw(BUYER_PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode()
+        first_buyer = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]) + 1
+        _batched(conn, """
+            INSERT INTO users (email, password_hash, name, phone, address, city, role)
+            VALUES (?, ?, ?, ?, ?, ?, 'buyer')
+        """, (
+            (f"buyer{i}@load.test", password_hash, f"Comprador {i}", f"300{i:07d}",
+             f"Calle {i % 200} # {i % 97}-{i % 50}", "Bogota")
+            for i in range(buyers)
+        ))
+        buyer_ids = list(range(first_buyer, first_buyer + buyers))
+
+        first_product = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM products").fetchone()[0]) + 1
+        prices = []
+
+        def product_rows():
+            for i in range(products):
+                name = f"{rng.choice(PRODUCE)} {rng.choice(VARIETIES)} {i}"
+                price = round(rng.uniform(500, 60_000), -1)
+                prices.append(price)
+                yield (
+                    name, f"{name} fresco, seleccionado por lote", price, rng.choice(UNITS),
+                    rng.choice(category_ids), 1_000_000, rng.choice([1, 1, 1, 2, 5]),
+                    0 if rng.random() < 0.05 else 1,
+                    _timestamp(now - timedelta(days=rng.randint(0, 720))),
+                )
+
+        _batched(conn, """
+            INSERT INTO products (name, description, price, unit, category_id, stock, min_order, is_active, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, product_rows())
+        product_ids = list(range(first_product, first_product + products))
+
+        def promotion_rows():
+            for i in range(promotions):
+                # A mix of running, finished and upcoming windows
+                start = now + timedelta(days=rng.randint(-60, 30))
+                end = start + timedelta(days=rng.randint(1, 45))
+                if rng.random() < 0.9:
+                    product_id, category_id = rng.choice(product_ids), None
+                else:
+                    product_id, category_id = None, rng.choice(category_ids)
+                yield (
+                    f"Promo {i}", "Descuento de temporada", rng.choice([5, 10, 15, 20, 30]),
+                    product_id, category_id, _timestamp(start), _timestamp(end),
+                )
+
+        _batched(conn, """
+            INSERT INTO promotions (name, description, discount_percent, product_id, category_id, start_date, end_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, promotion_rows())
+
+        first_order = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]) + 1
+        items_per_order = max(1, order_items // max(orders, 1))
+
+        def order_rows():
+            for i in range(orders):
+                created = _timestamp(now - timedelta(seconds=rng.randint(0, 365 * 86400)))
+                total = round(rng.uniform(5_000, 900_000), 2)
+                if rng.random() < 0.2:
+                    yield (None, f"Invitado {i}", f"310{i:07d}", f"Carrera {i % 120}",
+                           rng.choice(PAYMENT_METHODS), rng.choice(STATUSES), total, "", created, created)
+                else:
+                    yield (rng.choice(buyer_ids), None, None, None, rng.choice(PAYMENT_METHODS),
+                           rng.choice(STATUSES), total, "", created, created)
+
+        _batched(conn, """
+            INSERT INTO orders (user_id, guest_name, guest_phone, guest_address, payment_method,
+                                status, total, notes, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, order_rows())
+
+        def item_rows():
+            written = 0
+            for order_id in range(first_order, first_order + orders):
+                count = items_per_order if written + items_per_order <= order_items else order_items - written
+                if count <= 0:
+                    return
+                for product_id in rng.sample(product_ids, min(count, len(product_ids))):
+                    written += 1
+                    yield (order_id, product_id, rng.choice([1, 2, 3, 5, 10]),
+                           prices[product_id - first_product], rng.choice([0, 0, 0, 10]))
+
+        _batched(conn, """
+            INSERT INTO order_items (order_id, product_id, quantity, price, discount)
+            VALUES (?, ?, ?, ?, ?)
+        """, item_rows())
+
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return {
+        "buyers": buyers,
+        "products": products,
+        "promotions": promotions,
+        "orders": orders,
+        "order_items": min(order_items, orders * items_per_order),
+    }
@@ -0,0 +1,186 @@
+"""Benchmark of list response serialization, per endpoint.
+
+Seeds a throwaway SQLite database (or reuses one), reads the rows of each
+list endpoint once through the app's statements and then encodes them
+repeatedly two ways:
+
+* ``pydantic``: what the handlers did before ``app.serialization``. They built
+  a response model per row, FastAPI validated the list again against the
+  route's ``response_model`` and ``JSONResponse`` encoded it with ``json``.
+* ``direct``: ``app.serialization.json_response`` on the mapped rows.
+
+Both bodies are compared byte for byte. Timings per endpoint and the
+speedup are written to a JSON report; database time is not included.
+
+    cd backend
+    python -m tests.load.serialization --iterations 20 --out serialization.json
+    python -m tests.load.serialization --db /tmp/tutti-load/app.db --skip-seed
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from tests.load.run import percentile
+from tests.load.seed import seed
+
+PAGE_SIZE = 500
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Database file. Defaults to a new temporary file.")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse an already seeded --db")
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--promotions", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--order-items", type=int, default=100_000)
+    parser.add_argument("--buyers", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data")
+    parser.add_argument("--iterations", type=int, default=20, help="Encodings per endpoint and path")
+    parser.add_argument("--out", default="serialization_results.json")
+    return parser.parse_args(argv)
+
+
+def endpoints():
+    """(name, list route, statement, params, attach) for every benchmarked list."""
+    from app.routers import categories, orders, products, promotions, users
+    from app.statements import CATEGORY_LIST, PROMOTION_LIST_ALL, order_list, product_list, user_list
+
+    return [
+        ("products", list_route(products.router), *product_list(None, None, True, "name", False), None),
+        ("products_page", list_route(products.router),
+         *product_list(None, None, True, "name", False, None, True), None),
+        ("products_search", list_route(products.router),
+         *product_list(None, "premium", True, "relevance", False), None),
+        ("categories", list_route(categories.router), CATEGORY_LIST, (), None),
+        ("promotions", list_route(promotions.router), PROMOTION_LIST_ALL, (), None),
+        ("users", list_route(users.router), *user_list(None, None, "name", False), None),
+        ("orders_page", list_route(orders.router),
+         *order_list(None, None, "created_at", True, None, True), orders._attach_items),
+    ]
+
+
+def list_route(router):
+    """The router's ``GET ""`` route, whose response_model FastAPI validates against."""
+    from fastapi.routing import APIRoute
+
+    for route in router.routes:
+        if isinstance(route, APIRoute) and route.path == router.prefix and "GET" in route.methods:
+            return route
+    raise SystemExit(f"No list route under {router.prefix}")
+
+
+async def load_rows(statement, params, attach) -> list:
+    from app.database import read_connection
+
+    async with read_connection() as db:
+        if statement.sql.endswith("LIMIT ?"):
+            rows, _ = await statement.fetch_page(db, params, PAGE_SIZE)
+        else:
+            rows = await statement.fetch_all(db, params)
+        if attach is not None:
+            await attach(db, rows)
+    return rows
+
+
+async def pydantic_body(route, rows: list) -> bytes:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    model = route.response_model.__args__[0]
+    content = await serialize_response(field=route.response_field, response_content=[model(**row) for row in rows])
+    return JSONResponse(content).body
+
+
+async def direct_body(route, rows: list) -> bytes:
+    from app.serialization import json_response
+
+    return json_response(rows).body
+
+
+async def measure(encode, route, rows: list, iterations: int) -> tuple[dict, bytes]:
+    timings = []
+    body = b""
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = await encode(route, rows)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+    }, body
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="tutti-serialization-"), "app.db")
+    if args.skip_seed and not os.path.exists(db_path):
+        raise SystemExit(f"--skip-seed given but {db_path} does not exist")
+    # app.database reads DATABASE_PATH at import time
+    os.environ["DATABASE_PATH"] = db_path
+
+    from app.database import init_db
+    from app.main import app
+    from app.serialization import orjson
+
+    await init_db()
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(
+            db_path,
+            products=args.products,
+            promotions=args.promotions,
+            orders=args.orders,
+            order_items=args.order_items,
+            buyers=args.buyers,
+            rng_seed=args.seed,
+        )
+        print(f"Seeded {db_path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        for name, route, statement, params, attach in endpoints():
+            rows = await load_rows(statement, params, attach)
+            before, old_body = await measure(pydantic_body, route, rows, args.iterations)
+            after, new_body = await measure(direct_body, route, rows, args.iterations)
+            results[name] = {
+                "rows": len(rows),
+                "bytes": len(new_body),
+                "identical": old_body == new_body,
+                "pydantic": before,
+                "direct": after,
+                "speedup": round(before["mean_ms"] / after["mean_ms"], 2) if after["mean_ms"] else None,
+            }
+
+    report = {
+        "config": {
+            "iterations": args.iterations,
+            "encoder": "orjson" if orjson is not None else "json",
+            "python": platform.python_version(),
+            "database": db_path,
+        },
+        "endpoints": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in results.items():
+        print(
+            f"{name:16} {stats['rows']:6d} rows {stats['bytes']:9d} B  "
+            f"pydantic {stats['pydantic']['mean_ms']:8.2f}ms  direct {stats['direct']['mean_ms']:7.2f}ms  "
+            f"x{stats['speedup']}  {'identical' if stats['identical'] else 'DIFFERENT'}",
+            file=sys.stderr,
+        )
+    print(f"Report written to {args.out}", file=sys.stderr)
+    if not all(stats["identical"] for stats in results.values()):
+        raise SystemExit("Serialized bodies differ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
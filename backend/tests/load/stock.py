@@ -0,0 +1,241 @@
+"""Concurrency stress test for stock reservation on order confirmation.
+
+Creates a small set of products with little stock and many pending orders
+competing for it, then has admins in several processes confirm and cancel
+those same orders at once through the API. Each process runs the app with
+its own connections, as separate server workers would, so the processes
+only agree through SQLite's locking.
+
+Afterwards every product's stock must equal its initial stock minus the
+quantities of the orders left confirmed, and never be negative. Otherwise,
+or when a request fails with anything other than a short-stock 400, the
+run exits non-zero.
+
+    cd backend
+    python -m tests.load.stock --processes 4 --concurrency 64 --orders 2000
+    python -m tests.load.stock --db /tmp/tutti-stock/app.db --products 5 --stock 10
+    python -m tests.load.stock --bulk 100
+
+With ``--bulk`` the orders go through ``POST /orders/status/bulk`` in
+batches of that many instead of one ``PUT`` each.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Database file. Defaults to a new temporary file.")
+    parser.add_argument("--products", type=int, default=20, help="Products competed for")
+    parser.add_argument("--stock", type=float, default=50, help="Initial stock of each product")
+    parser.add_argument("--orders", type=int, default=1_000, help="Pending orders to confirm")
+    parser.add_argument("--max-items", type=int, default=4, help="Most lines per order")
+    parser.add_argument("--processes", type=int, default=4, help="App instances sharing the database")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent requests per process")
+    parser.add_argument("--bulk", type=int, default=0, help="Orders per bulk request (0 = one request per order)")
+    parser.add_argument("--cancel-ratio", type=float, default=0.2, help="Share of requests that cancel")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="stock_results.json")
+    return parser.parse_args(argv)
+
+
+def create_fixtures(db_path: str, args) -> tuple[dict, list]:
+    """Products with ``args.stock`` each and pending orders for them.
+
+    Lines of an order may repeat a product, which the reservation must add up.
+    """
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        category_id = conn.execute("SELECT id FROM categories ORDER BY id LIMIT 1").fetchone()[0]
+        product_ids = []
+        for i in range(args.products):
+            cursor = conn.execute(
+                "INSERT INTO products (name, category_id, price, stock, unit, min_order) VALUES (?, ?, ?, ?, 'kg', 1)",
+                (f"Stock {i}", category_id, 1000, args.stock)
+            )
+            product_ids.append(cursor.lastrowid)
+        order_ids = []
+        for _ in range(args.orders):
+            cursor = conn.execute(
+                """INSERT INTO orders (guest_name, guest_phone, guest_address, payment_method, total)
+                   VALUES ('Estres', '3000000000', 'Calle 1', 'efectivo', 0)"""
+            )
+            order_ids.append(cursor.lastrowid)
+            conn.executemany(
+                "INSERT INTO order_items (order_id, product_id, quantity, price, discount) VALUES (?, ?, ?, 1000, 0)",
+                [(cursor.lastrowid, rng.choice(product_ids), rng.randint(1, 5))
+                 for _ in range(rng.randint(1, args.max_items))]
+            )
+        conn.commit()
+        admin_id = conn.execute("SELECT id FROM users WHERE role = 'admin' ORDER BY id LIMIT 1").fetchone()[0]
+    finally:
+        conn.close()
+    return {"product_ids": product_ids, "admin_id": admin_id}, order_ids
+
+
+def check_stock(db_path: str, product_ids: list, initial: float) -> dict:
+    """Compare each product's stock with what its confirmed orders hold."""
+    conn = sqlite3.connect(db_path)
+    try:
+        ids = json.dumps(product_ids)
+        stock = dict(conn.execute("SELECT id, stock FROM products WHERE id IN (SELECT value FROM json_each(?))", (ids,)))
+        held = Counter()
+        for product_id, quantity in conn.execute(
+            """SELECT oi.product_id, SUM(oi.quantity) FROM order_items oi
+               JOIN orders o ON o.id = oi.order_id
+               WHERE o.status = 'confirmed' AND oi.product_id IN (SELECT value FROM json_each(?))
+               GROUP BY oi.product_id""", (ids,)
+        ):
+            held[product_id] = quantity
+        statuses = dict(conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status"))
+    finally:
+        conn.close()
+    return {
+        "oversold": sorted(product_id for product_id in product_ids if stock[product_id] < 0),
+        "mismatched": sorted(
+            product_id for product_id in product_ids if abs(stock[product_id] - (initial - held[product_id])) > 1e-9
+        ),
+        "stock_left": sum(stock.values()),
+        "stock_held": sum(held.values()),
+        "order_statuses": statuses,
+    }
+
+
+def worker_process(db_path: str, admin_id: int, order_ids: list, args, index: int) -> dict:
+    # app.database reads DATABASE_PATH at import time
+    os.environ["DATABASE_PATH"] = db_path
+    return asyncio.run(drive(admin_id, order_ids, args, index))
+
+
+async def drive(admin_id: int, order_ids: list, args, index: int) -> dict:
+    import httpx
+    from app.main import app
+    from app.utils.auth import create_access_token
+
+    # One log line per request would drown the summary
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    rng = random.Random(args.seed + index)
+    # Every process goes through all the orders, each in its own order
+    queue = [(order_id, "confirmed") for order_id in order_ids]
+    queue += [(order_id, "cancelled") for order_id in rng.sample(order_ids, int(len(order_ids) * args.cancel_ratio))]
+    rng.shuffle(queue)
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': admin_id, 'role': 'admin'})}"}
+    statuses = defaultdict(Counter)
+    failures = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://stock.test", timeout=120) as client:
+            async def worker():
+                while queue:
+                    order_id, status = queue.pop()
+                    response = await client.put(f"/orders/{order_id}/status", headers=headers, json={"status": status})
+                    statuses[status][response.status_code] += 1
+                    if response.status_code == 400 and response.json()["detail"].startswith("Stock insuficiente"):
+                        continue
+                    if response.status_code != 200 and len(failures) < 10:
+                        failures.append({"order_id": order_id, "status": response.status_code, "body": response.text})
+
+            async def bulk_worker():
+                while queue:
+                    status = queue[-1][1]
+                    batch = []
+                    while queue and queue[-1][1] == status and len(batch) < args.bulk:
+                        batch.append(queue.pop()[0])
+                    response = await client.post(
+                        "/orders/status/bulk", headers=headers, json={"order_ids": batch, "status": status}
+                    )
+                    if response.status_code != 200:
+                        statuses[status][response.status_code] += len(batch)
+                        if len(failures) < 10:
+                            failures.append({"order_ids": batch, "status": response.status_code, "body": response.text})
+                        continue
+                    for result in response.json()["results"]:
+                        # Counted like the single requests: a failed order is a 400
+                        statuses[status][200 if result["success"] else 400] += 1
+                        if not result["success"] and not result["error"].startswith("Stock insuficiente"):
+                            if len(failures) < 10:
+                                failures.append(result)
+
+            started = time.perf_counter()
+            await asyncio.gather(*((bulk_worker if args.bulk else worker)() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": {status: dict(codes) for status, codes in statuses.items()},
+        "failures": failures,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="tutti-stock-"), "app.db")
+    if os.path.exists(db_path):
+        raise SystemExit(f"{db_path} already exists; the stress test needs a new database")
+    os.environ["DATABASE_PATH"] = db_path
+
+    from app.database import init_db
+
+    asyncio.run(init_db())
+    fixtures, order_ids = create_fixtures(db_path, args)
+    print(
+        f"{args.orders} orders for {args.products} products with {args.stock:g} each, "
+        f"{args.processes} processes x {args.concurrency} requests"
+        + (f" of {args.bulk} orders" if args.bulk else ""),
+        file=sys.stderr,
+    )
+
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        runs = pool.starmap(
+            worker_process,
+            [(db_path, fixtures["admin_id"], order_ids, args, index) for index in range(args.processes)],
+        )
+    elapsed = time.perf_counter() - started
+
+    result = check_stock(db_path, fixtures["product_ids"], args.stock)
+    failures = [failure for run in runs for failure in run["failures"]]
+    requests = Counter()
+    for run in runs:
+        for status, codes in run["requests"].items():
+            for code, count in codes.items():
+                requests[f"{status} {code}"] += count
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "out"},
+        "database": db_path,
+        "elapsed_s": round(elapsed, 3),
+        "requests": dict(sorted(requests.items())),
+        "processes": runs,
+        **result,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, count in report["requests"].items():
+        print(f"{name:16} {count:7d}", file=sys.stderr)
+    print(
+        f"stock left {result['stock_left']:g}, held by confirmed orders {result['stock_held']:g}, "
+        f"orders {result['order_statuses']} in {elapsed:.1f}s",
+        file=sys.stderr,
+    )
+    print(f"Report written to {args.out}", file=sys.stderr)
+    if result["oversold"] or result["mismatched"]:
+        raise SystemExit(f"Stock out of step: oversold {result['oversold']}, mismatched {result['mismatched']}")
+    if failures:
+        raise SystemExit(f"Unexpected responses: {failures}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import gzip
+import json
+
+import brotli
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+DECOMPRESS = {"br": brotli.decompress, "gzip": gzip.decompress}
+
+
+async def bootstrap(client, accept_encoding: str) -> tuple[dict, bytes]:
+    # The raw body, as sent; httpx would otherwise decode it
+    async with client.stream("GET", "/catalog/bootstrap", headers={"Accept-Encoding": accept_encoding}) as response:
+        assert response.status_code == 200
+        return response.headers, b"".join([chunk async for chunk in response.aiter_raw()])
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+async def test_compressed_variants_hold_the_document(client, make_product, encoding):
+    product = await make_product()
+    _, plain = await bootstrap(client, "identity")
+
+    headers, body = await bootstrap(client, encoding)
+
+    assert headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in headers["vary"]
+    assert len(body) < len(plain)
+    assert DECOMPRESS[encoding](body) == plain
+    assert product["id"] in [row["id"] for row in json.loads(plain)["products"]]
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("deflate", None),
+    ("*", "br"),
+])
+async def test_client_preference_picks_the_variant(client, accept_encoding, expected):
+    headers, _ = await bootstrap(client, accept_encoding)
+
+    assert headers.get("content-encoding") == expected
+
+
+async def test_catalog_change_rebuilds_the_document(client, make_product):
+    _, before = await bootstrap(client, "br")
+    product = await make_product()
+
+    _, after = await bootstrap(client, "br")
+
+    assert after != before
+    assert product["id"] in [row["id"] for row in json.loads(brotli.decompress(after))["products"]]
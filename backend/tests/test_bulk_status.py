@@ -0,0 +1,98 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def bulk(client, headers, order_ids: list, status: str):
+    return await client.post("/orders/status/bulk", headers=headers, json={"order_ids": order_ids, "status": status})
+
+
+async def stock_of(client, product: dict) -> float:
+    return (await client.get(f"/products/{product['id']}")).json()["stock"]
+
+
+async def statuses(client, headers, orders: list) -> list[str]:
+    return [(await client.get(f"/orders/{order['id']}", headers=headers)).json()["status"] for order in orders]
+
+
+async def test_first_orders_keep_scarce_stock(client, admin_headers, make_product, guest_order):
+    scarce, plenty = await make_product(name="Escaso", stock=5), await make_product(stock=100)
+    orders = [await guest_order({scarce["id"]: 2, plenty["id"]: 1}) for _ in range(4)]
+
+    response = await bulk(client, admin_headers, [order["id"] for order in orders], "confirmed")
+
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["updated"] == 2
+    assert [row["success"] for row in result["results"]] == [True, True, False, False]
+    assert "Escaso" in result["results"][2]["error"]
+    assert await statuses(client, admin_headers, orders) == ["confirmed", "confirmed", "pending", "pending"]
+    # Short orders reserve nothing, not even what was available
+    assert (await stock_of(client, scarce), await stock_of(client, plenty)) == (1, 98)
+
+
+async def test_orders_that_fit_together_are_reserved_together(client, admin_headers, make_product, guest_order):
+    shared, other = await make_product(stock=6), await make_product(stock=1)
+    orders = [await guest_order({shared["id"]: 2}) for _ in range(2)] + [await guest_order({shared["id"]: 2, other["id"]: 1})]
+
+    result = (await bulk(client, admin_headers, [order["id"] for order in orders], "confirmed")).json()
+
+    assert result["updated"] == 3
+    assert (await stock_of(client, shared), await stock_of(client, other)) == (0, 0)
+
+
+async def test_later_order_that_fits_is_still_confirmed(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=5)
+    big, small = await guest_order({product["id"]: 4}), await guest_order({product["id"]: 1})
+    too_big = await guest_order({product["id"]: 2})
+
+    result = (await bulk(client, admin_headers, [big["id"], too_big["id"], small["id"]], "confirmed")).json()
+
+    assert [row["success"] for row in result["results"]] == [True, False, True]
+    assert await stock_of(client, product) == 0
+
+
+async def test_missing_and_repeated_orders(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=10)
+    order = await guest_order({product["id"]: 3})
+
+    result = (await bulk(client, admin_headers, [order["id"], 999999, order["id"]], "confirmed")).json()
+
+    assert [(row["order_id"], row["success"], row["error"]) for row in result["results"]] == [
+        (order["id"], True, None), (999999, False, "Pedido no encontrado")
+    ]
+    assert await stock_of(client, product) == 7
+
+
+async def test_bulk_cancel_gives_back_confirmed_stock_only(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=10)
+    confirmed, pending = await guest_order({product["id"]: 3}), await guest_order({product["id"]: 2})
+    await bulk(client, admin_headers, [confirmed["id"]], "confirmed")
+    assert await stock_of(client, product) == 7
+
+    result = (await bulk(client, admin_headers, [confirmed["id"], pending["id"]], "cancelled")).json()
+
+    assert result["updated"] == 2
+    assert await stock_of(client, product) == 10
+    assert await statuses(client, admin_headers, [confirmed, pending]) == ["cancelled", "cancelled"]
+
+
+async def test_bulk_matches_one_by_one(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=7)
+    orders = [await guest_order({product["id"]: quantity}) for quantity in (3, 5, 2, 2)]
+    single = []
+    for order in orders:
+        response = await client.put(f"/orders/{order['id']}/status", headers=admin_headers, json={"status": "confirmed"})
+        single.append(response.status_code == 200)
+    await bulk(client, admin_headers, [order["id"] for order in orders], "cancelled")
+    assert await stock_of(client, product) == 7
+
+    result = (await bulk(client, admin_headers, [order["id"] for order in orders], "confirmed")).json()
+
+    assert [row["success"] for row in result["results"]] == single == [True, False, True, True]
+
+
+async def test_invalid_requests(client, admin_headers):
+    assert (await bulk(client, admin_headers, [], "confirmed")).status_code == 400
+    assert (await bulk(client, admin_headers, [1], "perdido")).status_code == 400
+    assert (await bulk(client, {}, [1], "confirmed")).status_code in (401, 403)
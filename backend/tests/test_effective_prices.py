@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.database import refresh_stale_prices
+
+pytestmark = pytest.mark.anyio
+
+
+def sqlite_time(delta: timedelta) -> str:
+    return (datetime.now(timezone.utc) + delta).strftime("%Y-%m-%d %H:%M:%S")
+
+
+@pytest.fixture
+def make_promotion(client, admin_headers):
+    async def make_promotion(discount: float, starts=timedelta(days=-1), ends=timedelta(days=1), **target) -> dict:
+        response = await client.post("/promotions", headers=admin_headers, json={
+            "name": f"Promo {discount}", "discount_percent": discount,
+            "start_date": sqlite_time(starts), "end_date": sqlite_time(ends), **target,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make_promotion
+
+
+async def price_of(client, product_id: int) -> tuple:
+    response = await client.get(f"/products/{product_id}")
+    assert response.status_code == 200, response.text
+    product = response.json()
+    return product["discount_percent"], product["final_price"]
+
+
+async def test_best_running_promotion_sets_the_price(client, category, make_product, make_promotion):
+    product = await make_product(price=1000)
+    assert await price_of(client, product["id"]) == (None, 1000)
+
+    await make_promotion(10, product_id=product["id"])
+    assert await price_of(client, product["id"]) == (10, 900)
+
+    await make_promotion(25, category_id=category)
+    assert await price_of(client, product["id"]) == (25, 750)
+
+    listed = (await client.get("/products", params={"category_id": category})).json()
+    assert [(row["discount_percent"], row["final_price"]) for row in listed] == [(25, 750)]
+
+
+async def test_promotions_outside_their_dates_do_not_apply(client, make_product, make_promotion):
+    product = await make_product(price=1000)
+
+    await make_promotion(30, starts=timedelta(days=1), ends=timedelta(days=2), product_id=product["id"])
+    await make_promotion(40, starts=timedelta(days=-2), ends=timedelta(days=-1), product_id=product["id"])
+
+    assert await price_of(client, product["id"]) == (None, 1000)
+
+
+async def test_price_follows_promotion_and_product_changes(client, admin_headers, make_product, make_promotion):
+    product = await make_product(price=1000)
+    promotion = await make_promotion(20, product_id=product["id"])
+
+    await client.put(f"/products/{product['id']}", headers=admin_headers, json={"price": 2000})
+    assert await price_of(client, product["id"]) == (20, 1600)
+
+    await client.put(f"/promotions/{promotion['id']}", headers=admin_headers, json={"is_active": False})
+    assert await price_of(client, product["id"]) == (None, 2000)
+
+    await client.put(f"/promotions/{promotion['id']}", headers=admin_headers, json={"is_active": True})
+    await client.delete(f"/promotions/{promotion['id']}", headers=admin_headers)
+    assert await price_of(client, product["id"]) == (None, 2000)
+
+
+async def test_moving_a_product_to_another_category_changes_its_discount(client, admin_headers, category, make_product, make_promotion):
+    product = await make_product(price=1000)
+    await make_promotion(50, category_id=category)
+    other = (await client.post("/categories", headers=admin_headers, json={"name": f"Sin promo {product['id']}"})).json()
+
+    await client.put(f"/products/{product['id']}", headers=admin_headers, json={"category_id": other["id"]})
+
+    assert await price_of(client, product["id"]) == (None, 1000)
+
+
+async def test_orders_charge_the_discounted_price(make_product, make_promotion, guest_order):
+    product = await make_product(price=1000)
+    await make_promotion(10, product_id=product["id"])
+
+    order = await guest_order({product["id"]: 2})
+
+    assert order["total"] == 1800
+    assert order["items"][0]["discount"] == 10
+
+
+async def test_stale_prices_are_refreshed_once(client, make_product, make_promotion, query):
+    product = await make_product(price=1000)
+    await make_promotion(10, product_id=product["id"])
+    # As if the promotion had started while no worker was running
+    query("UPDATE product_effective_price SET discount_percent = NULL, final_price = 1000 WHERE product_id = ?",
+          (product["id"],))
+
+    assert await refresh_stale_prices() is True
+    assert await refresh_stale_prices() is False
+    assert query("SELECT discount_percent, final_price FROM product_effective_price WHERE product_id = ?",
+                 (product["id"],)) == [(10, 900)]
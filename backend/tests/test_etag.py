@@ -0,0 +1,51 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def current_etag(client, path: str) -> str:
+    # The first read after a change learns the catalog version; the ETag is
+    # known from then on
+    for _ in range(2):
+        response = await client.get(path)
+        assert response.status_code == 200, response.text
+        if "ETag" in response.headers:
+            return response.headers["ETag"]
+    raise AssertionError(f"{path} answered without an ETag")
+
+
+@pytest.mark.parametrize("path", ["/products", "/categories", "/promotions"])
+async def test_matching_etag_is_not_modified(client, path):
+    etag = await current_etag(client, path)
+
+    response = await client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    assert "Cache-Control" in response.headers
+
+
+async def test_weak_comparison_and_lists(client):
+    etag = await current_etag(client, "/products")
+    strong = etag.removeprefix("W/")
+
+    for header in (strong, f'"other", {etag}', "*"):
+        response = await client.get("/products", headers={"If-None-Match": header})
+        assert response.status_code == 304, header
+
+    response = await client.get("/products", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+async def test_mutation_changes_the_etag(client, admin_headers, make_product):
+    product = await make_product()
+    etag = await current_etag(client, "/products")
+
+    response = await client.put(f"/products/{product['id']}", headers=admin_headers, json={"price": 1234})
+    assert response.status_code == 200, response.text
+
+    stale = await client.get("/products", headers={"If-None-Match": etag})
+    assert stale.status_code == 200
+    assert any(row["id"] == product["id"] and row["price"] == 1234 for row in stale.json())
+    assert await current_etag(client, "/products") != etag
@@ -0,0 +1,80 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiosqlite
+import pytest
+
+from app.group_commit import GroupCommitter
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def writer(tmp_path):
+    async with aiosqlite.connect(tmp_path / "group_commit.db") as db:
+        await db.execute("CREATE TABLE rows (id INTEGER PRIMARY KEY, label TEXT NOT NULL)")
+        await db.commit()
+        yield db
+
+
+@pytest.fixture
+async def committer(writer):
+    @asynccontextmanager
+    async def connection():
+        yield writer
+
+    # A wide window so every unit submitted at once lands in one batch
+    committer = GroupCommitter(connection, window=0.05)
+    yield committer
+    await committer.close()
+
+
+def insert(label: str, fail: Exception | None = None):
+    async def work(db: aiosqlite.Connection) -> str:
+        await db.execute("INSERT INTO rows (label) VALUES (?)", (label,))
+        if fail is not None:
+            raise fail
+        return label
+    return work
+
+
+async def labels(db: aiosqlite.Connection) -> list[str]:
+    cursor = await db.execute("SELECT label FROM rows ORDER BY id")
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def test_failing_unit_is_rolled_back_alone(committer, writer):
+    results = await asyncio.gather(
+        committer.submit(insert("a")),
+        committer.submit(insert("b", fail=ValueError("b failed"))),
+        committer.submit(insert("c")),
+        return_exceptions=True,
+    )
+
+    assert results[0] == "a" and results[2] == "c"
+    assert isinstance(results[1], ValueError)
+    assert await labels(writer) == ["a", "c"]
+    assert committer.stats()["batches"] == 1
+
+
+async def test_failed_statement_does_not_abort_the_batch(committer, writer):
+    async def duplicate(db: aiosqlite.Connection):
+        await db.execute("INSERT INTO rows (id, label) VALUES (1, 'again')")
+
+    results = await asyncio.gather(
+        committer.submit(insert("a")),
+        committer.submit(duplicate),
+        committer.submit(insert("c")),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[1], aiosqlite.IntegrityError)
+    assert await labels(writer) == ["a", "c"]
+
+
+async def test_units_are_committed_before_callers_resume(committer, tmp_path):
+    await committer.submit(insert("a"))
+
+    # A separate connection sees only committed data
+    async with aiosqlite.connect(tmp_path / "group_commit.db") as other:
+        assert await labels(other) == ["a"]
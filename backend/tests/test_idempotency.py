@@ -0,0 +1,85 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.idempotency import REPLAYED_HEADER
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(scope="module")
+async def product_id(client, admin_headers):
+    category_id = (await client.get("/categories")).json()[0]["id"]
+    response = await client.post("/products", headers=admin_headers, json={
+        "name": "Mango idempotente", "price": 1000, "category_id": category_id, "stock": 100
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def guest_order(product_id: int) -> dict:
+    # The guest name tells the orders of each test apart
+    return {
+        "guest_name": f"Invitado {uuid.uuid4().hex}",
+        "guest_phone": "3000000000",
+        "guest_address": "Calle 1",
+        "payment_method": "efectivo",
+        "items": [{"product_id": product_id, "quantity": 1}],
+    }
+
+
+def orders_of(query, guest_name: str) -> int:
+    return query("SELECT COUNT(*) FROM orders WHERE guest_name = ?", (guest_name,))[0][0]
+
+
+async def test_retry_replays_stored_response(client, product_id, query):
+    order = guest_order(product_id)
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    first = await client.post("/orders/guest", json=order, headers=headers)
+    retry = await client.post("/orders/guest", json=order, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert REPLAYED_HEADER not in first.headers
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert orders_of(query, order["guest_name"]) == 1
+
+
+async def test_key_reused_for_another_body_is_rejected(client, product_id, query):
+    order = guest_order(product_id)
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    first = await client.post("/orders/guest", json=order, headers=headers)
+    other = await client.post("/orders/guest", json={**order, "notes": "otra"}, headers=headers)
+
+    assert first.status_code == 200
+    assert other.status_code == 422
+    assert other.json()["detail"] == "La Idempotency-Key ya se uso con otra solicitud"
+    assert orders_of(query, order["guest_name"]) == 1
+
+
+async def test_concurrent_duplicates_create_one_order(client, product_id, query):
+    order = guest_order(product_id)
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    responses = await asyncio.gather(*(
+        client.post("/orders/guest", json=order, headers=headers) for _ in range(8)
+    ))
+
+    assert [response.status_code for response in responses] == [200] * 8
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert sum(REPLAYED_HEADER in response.headers for response in responses) == 7
+    assert orders_of(query, order["guest_name"]) == 1
+
+
+async def test_requests_without_key_are_not_deduplicated(client, product_id, query):
+    order = guest_order(product_id)
+
+    first = await client.post("/orders/guest", json=order)
+    second = await client.post("/orders/guest", json=order)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["id"] != second.json()["id"]
+    assert orders_of(query, order["guest_name"]) == 2
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def upload(client, headers, filename: str, text: str):
+    return await client.post(
+        "/products/import", headers=headers, files={"file": (filename, text.encode(), "application/octet-stream")}
+    )
+
+
+async def products_in(client, category: int) -> dict:
+    response = await client.get("/products", params={"category_id": category})
+    return {product["name"]: product for product in response.json()}
+
+
+async def test_csv_import_creates_updates_and_reports_rows(client, admin_headers, category, make_product):
+    existing = await make_product(name="Melon", price=1000, description="Dulce")
+    text = (
+        "id,name,price,category_id,stock\n"
+        f",Sandia,2500,{category},10\n"
+        f"{existing['id']},,1200,,\n"
+        f",\"Uva, roja\",3000,{category},\n"
+        ",Sin precio,,,\n"
+        f",Kiwi,caro,{category},\n"
+        ",Ajeno,100,999999,\n"
+        "999999,,10,,\n"
+    )
+
+    response = await upload(client, admin_headers, "productos.csv", text)
+
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["rows"], result["created"], result["updated"]) == (7, 2, 1)
+    assert [error["line"] for error in result["errors"]] == [5, 6, 7, 8]
+    assert result["errors"][2]["error"] == "Categoria no encontrada"
+    assert result["errors"][3]["error"] == "Producto no encontrado"
+
+    products = await products_in(client, category)
+    assert sorted(products) == ["Melon", "Sandia", "Uva, roja"]
+    # Columns the row leaves empty keep their value
+    assert (products["Melon"]["price"], products["Melon"]["description"]) == (1200, "Dulce")
+    assert products["Sandia"]["stock"] == 10
+
+
+async def test_jsonl_import(client, admin_headers, category):
+    text = "\n".join([
+        json.dumps({"name": "Pitahaya", "price": 8000, "category_id": category}),
+        "{no es json",
+        json.dumps({"name": "Lulo", "price": 4000, "category_id": category, "color": "verde"}),
+        json.dumps({"name": "Curuba", "price": 3000, "category_id": category, "is_active": False}),
+    ])
+
+    response = await upload(client, admin_headers, "productos.jsonl", text)
+
+    result = response.json()
+    assert (result["rows"], result["created"], result["updated"]) == (4, 2, 0)
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+    # Inactive products are imported but not listed
+    assert sorted(await products_in(client, category)) == ["Pitahaya"]
+
+
+async def test_import_rejects_unknown_files_and_columns(client, admin_headers):
+    assert (await upload(client, admin_headers, "productos.xlsx", "")).status_code == 400
+    assert (await upload(client, admin_headers, "productos.csv", "id,color\n1,rojo\n")).status_code == 400
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+async def test_export_imports_back_unchanged(client, admin_headers, category, make_product, fmt):
+    await make_product(name="Coco, \"costeño\"", description="Linea 1\nLinea 2", price=3500)
+    before = await products_in(client, category)
+
+    exported = await client.get("/products/export", params={"format": fmt}, headers=admin_headers)
+    assert exported.status_code == 200
+    if fmt == "csv":
+        records = list(csv.DictReader(io.StringIO(exported.text)))
+    else:
+        records = [json.loads(line) for line in exported.text.splitlines()]
+    assert any(record["name"] == "Coco, \"costeño\"" for record in records)
+
+    response = await upload(client, admin_headers, f"productos.{fmt}", exported.text)
+
+    result = response.json()
+    assert result["errors"] == []
+    assert (result["created"], result["updated"]) == (0, len(records))
+    assert await products_in(client, category) == before
+
+
+async def test_import_needs_an_admin(client):
+    response = await upload(client, {}, "productos.csv", "name,price\nPera,100\n")
+
+    assert response.status_code in (401, 403)
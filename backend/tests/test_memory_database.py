@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# app.database picks memory mode at import time, so it runs in its own process
+SCRIPT = """
+import asyncio, json, sqlite3
+
+from app.database import read_connection, submit_write
+from app.main import app
+
+async def names():
+    async with read_connection() as db:
+        cursor = await db.execute("SELECT name FROM categories WHERE name LIKE 'Memoria%' ORDER BY name")
+        return [row[0] for row in await cursor.fetchall()]
+
+async def main():
+    seen = {}
+    async with app.router.lifespan_context(app):
+        async def insert(db):
+            await db.execute("INSERT INTO categories (name) VALUES ('Memoria 1')")
+            try:
+                seen["during"] = await names()
+            except sqlite3.OperationalError as error:
+                seen["during"] = str(error)
+        await submit_write(insert)
+        seen["committed"] = await names()
+
+        async def rolled_back(db):
+            await db.execute("INSERT INTO categories (name) VALUES ('Memoria 2')")
+            raise RuntimeError("rollback")
+        try:
+            await submit_write(rolled_back)
+        except RuntimeError:
+            pass
+        seen["rolled_back"] = await names()
+
+        async def write(index):
+            await submit_write(lambda db: db.execute("INSERT INTO categories (name) VALUES (?)", (f"Memoria x{index:02}",)))
+        reads = await asyncio.gather(*(names() for _ in range(20)), *(write(index) for index in range(20)))
+        seen["concurrent"] = len([result for result in reads if result is not None])
+        seen["final"] = len(await names())
+    print(json.dumps(seen))
+
+asyncio.run(main())
+"""
+
+
+def test_readers_only_see_committed_writes():
+    env = {**os.environ, "DATABASE_PATH": ":memory:", "DB_BUSY_TIMEOUT": "500"}
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT], env=env, cwd=Path(__file__).parent.parent,
+        capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+
+    seen = json.loads(result.stdout.splitlines()[-1])
+    # Never the row of the transaction still open
+    assert seen["during"] == [] or "locked" in seen["during"]
+    assert seen["committed"] == ["Memoria 1"]
+    assert seen["rolled_back"] == ["Memoria 1"]
+    assert seen["concurrent"] == 20
+    assert seen["final"] == 21
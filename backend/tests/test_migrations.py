@@ -0,0 +1,61 @@
+import asyncio
+
+import aiosqlite
+import pytest
+
+from app.migrations import LATEST_VERSION, MIGRATIONS, migrate
+
+pytestmark = pytest.mark.anyio
+
+
+async def schema(db: aiosqlite.Connection) -> list:
+    cursor = await db.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name")
+    return await cursor.fetchall()
+
+
+async def counts(db: aiosqlite.Connection) -> dict:
+    result = {}
+    for table in ("schema_version", "users", "categories"):
+        cursor = await db.execute(f"SELECT COUNT(*) FROM {table}")
+        result[table] = (await cursor.fetchone())[0]
+    return result
+
+
+async def test_migrate_twice_changes_nothing(tmp_path):
+    async with aiosqlite.connect(tmp_path / "app.db") as db:
+        assert await migrate(db) == LATEST_VERSION
+        before = await schema(db), await counts(db)
+
+        assert await migrate(db) == LATEST_VERSION
+        assert (await schema(db), await counts(db)) == before
+        assert before[1] == {"schema_version": len(MIGRATIONS), "users": 1, "categories": 4}
+
+
+async def test_steps_are_safe_to_run_again(tmp_path):
+    async with aiosqlite.connect(tmp_path / "app.db") as db:
+        await migrate(db)
+        before = await schema(db), await counts(db)
+
+        for _, _, steps in MIGRATIONS:
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+        await db.commit()
+
+        assert (await schema(db), await counts(db)) == before
+
+
+async def test_workers_booting_together_apply_each_migration_once(tmp_path):
+    async def boot() -> int:
+        async with aiosqlite.connect(tmp_path / "app.db") as db:
+            await db.execute("PRAGMA busy_timeout = 30000")
+            return await migrate(db)
+
+    assert await asyncio.gather(*(boot() for _ in range(4))) == [LATEST_VERSION] * 4
+
+    async with aiosqlite.connect(tmp_path / "app.db") as db:
+        cursor = await db.execute("SELECT version FROM schema_version ORDER BY version")
+        assert [row[0] for row in await cursor.fetchall()] == [number for number, _, _ in MIGRATIONS]
+        assert (await counts(db))["users"] == 1
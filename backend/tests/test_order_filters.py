@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def order_ids(client, headers, **params) -> list[int]:
+    response = await client.get("/orders", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return sorted(order["id"] for order in response.json())
+
+
+@pytest.fixture
+async def buyer_orders(client, buyer, make_product) -> list[dict]:
+    product = await make_product()
+    orders = []
+    for _ in range(2):
+        response = await client.post("/orders", headers=buyer["headers"], json={
+            "items": [{"product_id": product["id"], "quantity": 1}]
+        })
+        assert response.status_code == 200, response.text
+        orders.append(response.json())
+    return orders
+
+
+async def test_buyers_only_see_their_own_orders(client, admin_headers, buyer, buyer_orders):
+    mine = sorted(order["id"] for order in buyer_orders)
+
+    assert await order_ids(client, buyer["headers"]) == mine
+    assert await order_ids(client, buyer["headers"], user_id=buyer["id"]) == mine
+    assert await order_ids(client, admin_headers, user_id=buyer["id"]) == mine
+
+    response = await client.get("/orders", headers=buyer["headers"], params={"user_id": buyer["id"] + 1})
+    assert response.status_code == 403
+
+
+async def test_filter_by_status(client, admin_headers, buyer, buyer_orders):
+    confirmed = buyer_orders[0]["id"]
+    response = await client.put(f"/orders/{confirmed}/status", headers=admin_headers, json={"status": "confirmed"})
+    assert response.status_code == 200, response.text
+
+    assert await order_ids(client, buyer["headers"], status_filter="confirmed") == [confirmed]
+    assert await order_ids(client, buyer["headers"], status_filter="pending") == [buyer_orders[1]["id"]]
+
+
+async def test_filter_by_payment_method(client, admin_headers, make_product, guest_order):
+    product = await make_product()
+    method = f"nequi-{product['id']}"
+    order = await guest_order({product["id"]: 1}, payment_method=method)
+    await guest_order({product["id"]: 1})
+
+    assert await order_ids(client, admin_headers, payment_method=method) == [order["id"]]
+
+
+async def test_filter_by_creation_date(client, buyer, buyer_orders):
+    mine = sorted(order["id"] for order in buyer_orders)
+    day = date.fromisoformat(buyer_orders[0]["created_at"][:10])
+    before, after = (day - timedelta(days=1)).isoformat(), (day + timedelta(days=1)).isoformat()
+
+    # Both ends are inclusive, whole days included
+    assert await order_ids(client, buyer["headers"], created_from=day.isoformat(), created_to=day.isoformat()) == mine
+    assert await order_ids(client, buyer["headers"], created_to=before) == []
+    assert await order_ids(client, buyer["headers"], created_from=after) == []
+    assert await order_ids(client, buyer["headers"], created_from=buyer_orders[0]["created_at"].replace(" ", "T")) == mine
+
+    response = await client.get("/orders", headers=buyer["headers"], params={"created_from": "ayer"})
+    assert response.status_code == 400
@@ -0,0 +1,48 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def many_products(client, admin_headers, category) -> list[dict]:
+    # Enough lines to take more than one INSERT
+    count = 250
+    text = "name,price,category_id,stock\n" + "".join(
+        f"Item {index:03},{100 + index},{category},1000\n" for index in range(count)
+    )
+    response = await client.post(
+        "/products/import", headers=admin_headers, files={"file": ("items.csv", text.encode(), "text/csv")}
+    )
+    assert response.json()["created"] == count, response.text
+    products = (await client.get("/products", params={"category_id": category, "sort": "name"})).json()
+    assert len(products) == count
+    return products
+
+
+def lines(order: dict) -> list[tuple]:
+    return [(item["id"], item["product_id"], item["quantity"], item["subtotal"]) for item in order["items"]]
+
+
+async def test_item_ids_match_the_stored_lines(client, admin_headers, many_products, guest_order):
+    # Listed in an order unrelated to product ids
+    items = {product["id"]: index % 5 + 1 for index, product in enumerate(reversed(many_products))}
+
+    placed = await guest_order(items)
+
+    stored = (await client.get(f"/orders/{placed['id']}", headers=admin_headers)).json()
+    assert sorted(lines(placed)) == sorted(lines(stored))
+    assert len({item["id"] for item in placed["items"]}) == len(items)
+    assert [item["product_id"] for item in placed["items"]] == list(items)
+    assert placed["total"] == sum(item["subtotal"] for item in placed["items"])
+
+
+async def test_consecutive_orders_get_their_own_items(client, admin_headers, make_product, guest_order):
+    first, second = await make_product(), await make_product()
+
+    orders = [await guest_order({first["id"]: 1, second["id"]: 2}) for _ in range(3)]
+
+    ids = [item["id"] for order in orders for item in order["items"]]
+    assert len(set(ids)) == 6
+    for order in orders:
+        stored = (await client.get(f"/orders/{order['id']}", headers=admin_headers)).json()
+        assert sorted(lines(order)) == sorted(lines(stored))
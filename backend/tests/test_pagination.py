@@ -0,0 +1,78 @@
+import pytest
+
+from app.pagination import NEXT_CURSOR_HEADER
+
+pytestmark = pytest.mark.anyio
+
+
+async def walk(client, path: str, params: dict, headers=None) -> list[int]:
+    """Ids of every page of ``path``, following the cursor to the end."""
+    ids = []
+    cursor = None
+    while True:
+        response = await client.get(path, params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page) <= params["limit"]
+        ids += [row["id"] for row in page]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("sort", ["name", "-name", "price", "-price", "created_at", "-created_at"])
+async def test_pages_cover_the_list_once_in_order(client, category, make_product, sort):
+    # Repeated prices, so pages have to break ties by id
+    for index, price in enumerate([300, 100, 200, 100, 300, 100, 200]):
+        await make_product(name=f"Fruta {index}", price=price)
+    params = {"category_id": category, "sort": sort}
+
+    full = (await client.get("/products", params=params)).json()
+    pages = await walk(client, "/products", {**params, "limit": 3})
+
+    assert len(full) == 7
+    assert pages == [product["id"] for product in full]
+    field = sort.lstrip("-")
+    if field in full[0]:
+        values = [product[field] for product in full]
+        assert values == sorted(values, reverse=sort.startswith("-"))
+
+
+async def test_last_page_has_no_cursor(client, category, make_product):
+    for _ in range(3):
+        await make_product()
+
+    response = await client.get("/products", params={"category_id": category, "limit": 3})
+
+    assert len(response.json()) == 3
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+async def test_cursor_only_works_with_its_own_sort(client, category, make_product):
+    for _ in range(3):
+        await make_product()
+    first = await client.get("/products", params={"category_id": category, "sort": "price", "limit": 1})
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+
+    other_sort = await client.get("/products", params={"category_id": category, "sort": "name", "cursor": cursor})
+    garbage = await client.get("/products", params={"category_id": category, "cursor": "no-es-un-cursor"})
+
+    assert other_sort.status_code == 400
+    assert garbage.status_code == 400
+
+
+async def test_sort_is_whitelisted(client, admin_headers):
+    products = await client.get("/products", params={"sort": "stock; DROP TABLE products"})
+    users = await client.get("/users", params={"sort": "password_hash"}, headers=admin_headers)
+
+    assert products.status_code == 400
+    assert products.json()["detail"].startswith("Orden invalido")
+    assert users.status_code == 400
+
+
+async def test_users_and_orders_page_by_cursor(client, admin_headers):
+    users = await walk(client, "/users", {"limit": 1}, admin_headers)
+    orders = await walk(client, "/orders", {"limit": 2}, admin_headers)
+
+    assert users == [user["id"] for user in (await client.get("/users", headers=admin_headers)).json()]
+    assert orders == [order["id"] for order in (await client.get("/orders", headers=admin_headers)).json()]
@@ -0,0 +1,72 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def patch(client, headers, patches: list):
+    return await client.patch("/products/bulk", headers=headers, json=patches)
+
+
+async def state(client, product_id: int) -> tuple:
+    product = (await client.get(f"/products/{product_id}")).json()
+    return product["price"], product["stock"]
+
+
+async def test_values_and_deltas_apply_in_order(client, admin_headers, make_product):
+    first = await make_product(price=1000, stock=10)
+    second = await make_product(price=2000, stock=5)
+
+    response = await patch(client, admin_headers, [
+        {"id": first["id"], "price": 1500},
+        {"id": second["id"], "price_delta": -500, "stock_delta": 2.5},
+        {"id": first["id"], "stock_delta": -4, "price_delta": 100},
+    ])
+
+    assert response.status_code == 200, response.text
+    assert {product["id"]: (product["price"], product["stock"]) for product in response.json()} == {
+        first["id"]: (1600, 6), second["id"]: (1500, 7.5)
+    }
+    assert await state(client, first["id"]) == (1600, 6)
+    assert await state(client, second["id"]) == (1500, 7.5)
+
+
+async def test_negative_result_rolls_everything_back(client, admin_headers, make_product):
+    first = await make_product(price=1000, stock=10)
+    second = await make_product(price=2000, stock=5)
+
+    response = await patch(client, admin_headers, [
+        {"id": first["id"], "price": 1},
+        {"id": second["id"], "stock_delta": -6},
+    ])
+
+    assert response.status_code == 400
+    assert str(second["id"]) in response.json()["detail"]
+    assert await state(client, first["id"]) == (1000, 10)
+    assert await state(client, second["id"]) == (2000, 5)
+
+
+async def test_missing_product_rolls_everything_back(client, admin_headers, make_product):
+    product = await make_product(price=1000)
+
+    response = await patch(client, admin_headers, [{"id": product["id"], "price": 5}, {"id": 999999, "price": 5}])
+
+    assert response.status_code == 404
+    assert "999999" in response.json()["detail"]
+    assert await state(client, product["id"]) == (1000, 100)
+
+
+async def test_value_and_delta_of_one_field_are_exclusive(client, admin_headers, make_product):
+    product = await make_product()
+
+    response = await patch(client, admin_headers, [{"id": product["id"], "price": 5, "price_delta": 1}])
+
+    assert response.status_code == 422
+
+
+async def test_hiding_products(client, admin_headers, category, make_product):
+    product = await make_product()
+
+    response = await patch(client, admin_headers, [{"id": product["id"], "is_active": False}])
+
+    assert response.status_code == 200, response.text
+    assert (await client.get("/products", params={"category_id": category})).json() == []
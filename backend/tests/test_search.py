@@ -0,0 +1,50 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def search(client, category: int, text: str) -> list[str]:
+    response = await client.get("/products", params={"search": text, "category_id": category})
+    assert response.status_code == 200, response.text
+    return sorted(product["name"] for product in response.json())
+
+
+async def test_search_ignores_accents_and_case(client, category, make_product):
+    await make_product(name="Limón Tahití")
+    await make_product(name="Papaya")
+
+    assert await search(client, category, "limon") == ["Limón Tahití"]
+    assert await search(client, category, "LIMÓN tahiti") == ["Limón Tahití"]
+
+
+async def test_every_word_matches_as_prefix(client, category, make_product):
+    await make_product(name="Plátano maduro")
+    await make_product(name="Plátano verde", description="Para patacones")
+    await make_product(name="Mandarina")
+
+    assert await search(client, category, "pla") == ["Plátano maduro", "Plátano verde"]
+    assert await search(client, category, "pla mad") == ["Plátano maduro"]
+    assert await search(client, category, "patac") == ["Plátano verde"]
+    assert await search(client, category, "ma") == ["Mandarina", "Plátano maduro"]
+
+
+async def test_search_operators_are_taken_literally(client, category, make_product):
+    await make_product(name="Papaya")
+    await make_product(name="Pera")
+
+    assert await search(client, category, "papaya OR pera") == []
+    assert await search(client, category, "pap*") == ["Papaya"]
+    assert await search(client, category, '"') == []
+
+
+async def test_index_follows_product_changes(client, admin_headers, category, make_product):
+    product = await make_product(name="Guayaba")
+
+    response = await client.put(f"/products/{product['id']}", headers=admin_headers, json={"name": "Guanábana"})
+    assert response.status_code == 200, response.text
+    assert await search(client, category, "guay") == []
+    assert await search(client, category, "guanabana") == ["Guanábana"]
+
+    response = await client.delete(f"/products/{product['id']}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert await search(client, category, "guanabana") == []
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def stock_of(client, *products: dict) -> list[float]:
+    return [(await client.get(f"/products/{product['id']}")).json()["stock"] for product in products]
+
+
+async def set_status(client, headers, order: dict, status: str):
+    return await client.put(f"/orders/{order['id']}/status", headers=headers, json={"status": status})
+
+
+async def test_confirming_reserves_and_cancelling_gives_back(client, admin_headers, make_product, guest_order):
+    mango, pera = await make_product(stock=10), await make_product(stock=5)
+    order = await guest_order({mango["id"]: 3, pera["id"]: 1.5})
+
+    assert await stock_of(client, mango, pera) == [10, 5]
+
+    assert (await set_status(client, admin_headers, order, "confirmed")).status_code == 200
+    assert await stock_of(client, mango, pera) == [7, 3.5]
+
+    # Confirming again does not reserve twice
+    assert (await set_status(client, admin_headers, order, "confirmed")).status_code == 200
+    assert await stock_of(client, mango, pera) == [7, 3.5]
+
+    assert (await set_status(client, admin_headers, order, "cancelled")).status_code == 200
+    assert await stock_of(client, mango, pera) == [10, 5]
+
+
+async def test_deleting_a_confirmed_order_gives_stock_back(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=10)
+    cancelled, deleted = await guest_order({product["id"]: 4}), await guest_order({product["id"]: 2})
+    for order in (cancelled, deleted):
+        assert (await set_status(client, admin_headers, order, "confirmed")).status_code == 200
+    assert await stock_of(client, product) == [4]
+
+    assert (await client.delete(f"/orders/{cancelled['id']}", headers=admin_headers)).status_code == 200
+    assert await stock_of(client, product) == [8]
+
+    assert (await client.delete(f"/orders/{deleted['id']}/permanent", headers=admin_headers)).status_code == 200
+    assert await stock_of(client, product) == [10]
+
+
+async def test_cancelling_an_unconfirmed_order_leaves_stock(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=10)
+    order = await guest_order({product["id"]: 4})
+
+    assert (await set_status(client, admin_headers, order, "cancelled")).status_code == 200
+    assert await stock_of(client, product) == [10]
+
+
+async def test_shortage_reserves_nothing(client, admin_headers, make_product, guest_order):
+    plenty, scarce = await make_product(name="Abundante", stock=10), await make_product(name="Escaso", stock=2)
+    order = await guest_order({plenty["id"]: 1, scarce["id"]: 3})
+
+    response = await set_status(client, admin_headers, order, "confirmed")
+
+    assert response.status_code == 400
+    assert "Escaso" in response.json()["detail"]
+    assert "Abundante" not in response.json()["detail"]
+    assert await stock_of(client, plenty, scarce) == [10, 2]
+    assert (await client.get(f"/orders/{order['id']}", headers=admin_headers)).json()["status"] == "pending"
+
+
+async def test_lines_of_one_product_are_reserved_together(client, admin_headers, make_product):
+    product = await make_product(stock=5)
+    response = await client.post("/orders/guest", json={
+        "guest_name": "Invitado", "guest_phone": "3000000000", "guest_address": "Calle 1",
+        "payment_method": "efectivo",
+        "items": [{"product_id": product["id"], "quantity": 3}, {"product_id": product["id"], "quantity": 3}],
+    })
+    order = response.json()
+
+    assert (await set_status(client, admin_headers, order, "confirmed")).status_code == 400
+    assert await stock_of(client, product) == [5]
+
+
+async def test_concurrent_confirmations_never_oversell(client, admin_headers, make_product, guest_order):
+    product = await make_product(stock=5)
+    orders = [await guest_order({product["id"]: 2}) for _ in range(4)]
+
+    responses = await asyncio.gather(*(set_status(client, admin_headers, order, "confirmed") for order in orders))
+
+    assert sorted(response.status_code for response in responses) == [200, 200, 400, 400]
+    assert await stock_of(client, product) == [1]
@@ -0,0 +1,29 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "instrumented"])
+def instrumentation(request, monkeypatch):
+    monkeypatch.setattr("app.instrumentation.DB_INSTRUMENT", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("path", ["/products", "/orders", "/users", "/promotions/all"])
+async def test_stream_sends_the_buffered_list(client, admin_headers, make_product, guest_order, instrumentation, path):
+    product = await make_product()
+    await guest_order({product["id"]: 1})
+
+    buffered = await client.get(path, headers=admin_headers)
+    streamed = await client.get(path, headers=admin_headers, params={"stream": "true"})
+
+    assert streamed.status_code == 200, streamed.text
+    assert streamed.headers["content-type"].startswith("application/json")
+    assert streamed.json() == buffered.json()
+    assert ("server-timing" in streamed.headers) == instrumentation
+
+
+async def test_stream_cannot_be_paged(client):
+    response = await client.get("/products", params={"stream": "true", "limit": 10})
+
+    assert response.status_code == 400
@@ -0,0 +1,55 @@
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+MISSING = 999999
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/products", {"price": 10}),
+    ("/categories", {"name": "Nada"}),
+    ("/promotions", {"name": "Nada"}),
+    ("/users", {"name": "Nadie"}),
+])
+async def test_missing_rows_are_not_found(client, admin_headers, path, body):
+    updated = await client.put(f"{path}/{MISSING}", headers=admin_headers, json=body)
+    unchanged = await client.put(f"{path}/{MISSING}", headers=admin_headers, json={})
+    deleted = await client.delete(f"{path}/{MISSING}", headers=admin_headers)
+
+    assert (updated.status_code, unchanged.status_code, deleted.status_code) == (404, 404, 404)
+
+
+async def test_taken_email_is_refused(client, admin_headers):
+    body = {"email": f"{uuid.uuid4().hex}@example.com", "password": "secreto123", "name": "Repetido"}
+    assert (await client.post("/auth/register", json=body)).status_code == 200
+
+    again = await client.post("/auth/register", json=body)
+    by_admin = await client.post("/users", headers=admin_headers, json=body)
+
+    assert again.status_code == by_admin.status_code == 400
+    assert again.json()["detail"] == by_admin.json()["detail"] == "El email ya esta registrado"
+
+
+async def test_profile_and_password_changes_are_kept(client, buyer):
+    profile = await client.put("/auth/profile", headers=buyer["headers"], json={"name": "Otro nombre"})
+    changed = await client.put("/auth/change-password", headers=buyer["headers"], json={
+        "current_password": "secreto123", "new_password": "nuevo456"
+    })
+
+    assert profile.json()["name"] == "Otro nombre"
+    assert changed.status_code == 200
+    me = (await client.get("/auth/me", headers=buyer["headers"])).json()
+    assert me["name"] == "Otro nombre"
+    login = await client.post("/auth/login", json={"email": me["email"], "password": "nuevo456"})
+    assert login.status_code == 200
+
+
+async def test_deleting_a_category_keeps_its_products(client, admin_headers, category, make_product):
+    product = await make_product()
+
+    assert (await client.delete(f"/categories/{category}", headers=admin_headers)).status_code == 200
+
+    assert (await client.get(f"/categories/{category}")).status_code == 404
+    assert (await client.get(f"/products/{product['id']}")).json()["category_id"] is None
@@ -336,6 +336,22 @@ export const AdminPage: React.FC = () => {
     }
   };
 
+  const handleBulkOrderStatus = async (status: string) => {
+    if (selectedOrderIds.length === 0) return;
+    try {
+      const result = await api.bulkUpdateOrderStatus(selectedOrderIds, status);
+      const failed = result.results.filter(r => !r.success);
+      if (failed.length > 0) {
+        alert(`${result.updated} pedido(s) actualizados. No se pudieron actualizar:\n` +
+          failed.map(r => `#${r.order_id}: ${r.error}`).join('\n'));
+      }
+      setSelectedOrderIds(failed.map(r => r.order_id));
+      await loadData();
+    } catch (error) {
+      console.error('Error updating orders:', error);
+    }
+  };
+
   const toggleOrderSelection = (orderId: number) => {
     setSelectedOrderIds(prev => 
       prev.includes(orderId) 
@@ -810,6 +826,16 @@ export const AdminPage: React.FC = () => {
                         <CardHeader className="flex flex-row items-center justify-between flex-wrap gap-2">
                           <CardTitle>Pedidos ({orders.length})</CardTitle>
                           <div className="flex items-center gap-2 flex-wrap">
+                            {selectedOrderIds.length > 0 && (
+                              <>
+                                <Button variant="outline" onClick={() => handleBulkOrderStatus('confirmed')}>
+                                  <CheckCircle className="w-4 h-4 mr-2" /> Confirmar ({selectedOrderIds.length})
+                                </Button>
+                                <Button variant="outline" onClick={() => handleBulkOrderStatus('preparing')}>
+                                  <Package className="w-4 h-4 mr-2" /> En Proceso ({selectedOrderIds.length})
+                                </Button>
+                              </>
+                            )}
                             {selectedOrderIds.length > 0 && (
                               <Button 
                                 variant="destructive" 
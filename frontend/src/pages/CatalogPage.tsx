@@ -55,15 +55,18 @@ export const CatalogPage: React.FC = () => {
 
   const loadData = async () => {
     try {
-      const [productsData, categoriesData] = await Promise.all([
-        api.getProducts({ 
+      if (!selectedCategory && !debouncedSearch) {
+        // Unfiltered view, including first paint: one precomputed document
+        const catalog = await api.getCatalogBootstrap();
+        setProducts(catalog.products);
+        setCategories(catalog.categories);
+      } else {
+        const productsData = await api.getProducts({ 
           category_id: selectedCategory || undefined, 
           search: debouncedSearch || undefined 
-        }),
-        api.getCategories(),
-      ]);
-      setProducts(productsData);
-      setCategories(categoriesData);
+        });
+        setProducts(productsData);
+      }
     } catch (error) {
       console.error('Error loading data:', error);
     } finally {
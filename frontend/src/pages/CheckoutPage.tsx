@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { useCart } from '../context/CartContext';
@@ -42,6 +42,17 @@ export const CheckoutPage: React.FC = () => {
     notes: string;
   } | null>(null);
 
+  // The same order submitted again, e.g. after a network error, reuses its
+  // key so the server does not create it twice
+  const attemptRef = useRef<{ body: string; key: string } | null>(null);
+  const idempotencyKeyFor = (data: object) => {
+    const body = JSON.stringify(data);
+    if (attemptRef.current?.body !== body) {
+      attemptRef.current = { body, key: crypto.randomUUID() };
+    }
+    return attemptRef.current.key;
+  };
+
   const formatPrice = (price: number) => {
     return new Intl.NumberFormat('es-CO', {
       style: 'currency',
@@ -73,7 +84,7 @@ export const CheckoutPage: React.FC = () => {
           notes: notes,
         };
         
-        await api.createOrder(orderData);
+        await api.createOrder(orderData, idempotencyKeyFor(orderData));
       } else {
         const guestOrderData = {
           guest_name: guestName,
@@ -87,7 +98,7 @@ export const CheckoutPage: React.FC = () => {
           notes: notes,
         };
         
-        await api.guestCreateOrder(guestOrderData);
+        await api.guestCreateOrder(guestOrderData, idempotencyKeyFor(guestOrderData));
       }
       
       // Save order data for WhatsApp message before clearing cart
@@ -106,6 +117,7 @@ export const CheckoutPage: React.FC = () => {
         notes: notes
       });
       
+      attemptRef.current = null;
       setSuccess(true);
       clearCart();
     } catch (err) {
@@ -1,4 +1,4 @@
-import { User, Category, Product, Promotion, Order, LoginResponse } from '../types';
+import { User, Category, Product, Promotion, Order, LoginResponse, CatalogBootstrap, BulkOrderStatusResult } from '../types';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
@@ -17,6 +17,10 @@ const getHeaders = (includeAuth = false): HeadersInit => {
   return headers;
 };
 
+// Retries of a request carrying the same key get the first response back
+const withIdempotencyKey = (headers: HeadersInit, key?: string): HeadersInit =>
+  key ? { ...headers, 'Idempotency-Key': key } : headers;
+
 export const api = {
   async login(email: string, password: string): Promise<LoginResponse> {
     const response = await fetch(`${API_URL}/auth/login`, {
@@ -141,6 +145,12 @@ export const api = {
     return response.json();
   },
 
+  async getCatalogBootstrap(): Promise<CatalogBootstrap> {
+    const response = await fetch(`${API_URL}/catalog/bootstrap`);
+    if (!response.ok) throw new Error('Error al obtener catalogo');
+    return response.json();
+  },
+
   async createPromotion(data: Partial<Promotion>): Promise<Promotion> {
     const response = await fetch(`${API_URL}/promotions`, {
       method: 'POST',
@@ -169,8 +179,18 @@ export const api = {
     if (!response.ok) throw new Error('Error al eliminar promocion');
   },
 
-  async getOrders(status?: string): Promise<Order[]> {
-    const url = status ? `${API_URL}/orders?status_filter=${status}` : `${API_URL}/orders`;
+  async getOrders(
+    status?: string,
+    filters?: { user_id?: number; payment_method?: string; created_from?: string; created_to?: string }
+  ): Promise<Order[]> {
+    const searchParams = new URLSearchParams();
+    if (status) searchParams.append('status_filter', status);
+    if (filters?.user_id) searchParams.append('user_id', filters.user_id.toString());
+    if (filters?.payment_method) searchParams.append('payment_method', filters.payment_method);
+    if (filters?.created_from) searchParams.append('created_from', filters.created_from);
+    if (filters?.created_to) searchParams.append('created_to', filters.created_to);
+    
+    const url = `${API_URL}/orders${searchParams.toString() ? '?' + searchParams.toString() : ''}`;
     const response = await fetch(url, {
       headers: getHeaders(true),
     });
@@ -178,10 +198,13 @@ export const api = {
     return response.json();
   },
 
-  async createOrder(data: { items: { product_id: number; quantity: number }[]; notes?: string }): Promise<Order> {
+  async createOrder(
+    data: { items: { product_id: number; quantity: number }[]; notes?: string },
+    idempotencyKey?: string
+  ): Promise<Order> {
     const response = await fetch(`${API_URL}/orders`, {
       method: 'POST',
-      headers: getHeaders(true),
+      headers: withIdempotencyKey(getHeaders(true), idempotencyKey),
       body: JSON.stringify(data),
     });
     if (!response.ok) {
@@ -201,6 +224,19 @@ export const api = {
     return response.json();
   },
 
+  async bulkUpdateOrderStatus(orderIds: number[], status: string): Promise<BulkOrderStatusResult> {
+    const response = await fetch(`${API_URL}/orders/status/bulk`, {
+      method: 'POST',
+      headers: getHeaders(true),
+      body: JSON.stringify({ order_ids: orderIds, status }),
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Error al actualizar estado de los pedidos');
+    }
+    return response.json();
+  },
+
     async cancelOrder(id: number): Promise<void> {
       const response = await fetch(`${API_URL}/orders/${id}`, {
         method: 'DELETE',
@@ -237,10 +273,10 @@ export const api = {
           payment_method: string; 
           items: { product_id: number; quantity: number }[]; 
           notes?: string 
-        }): Promise<Order> {
+        }, idempotencyKey?: string): Promise<Order> {
           const response = await fetch(`${API_URL}/orders/guest`, {
             method: 'POST',
-            headers: getHeaders(),
+            headers: withIdempotencyKey(getHeaders(), idempotencyKey),
             body: JSON.stringify(data),
           });
           if (!response.ok) {
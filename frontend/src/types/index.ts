@@ -47,6 +47,12 @@ export interface Promotion {
   is_active: boolean;
 }
 
+export interface CatalogBootstrap {
+  categories: Category[];
+  products: Product[];
+  promotions: Promotion[];
+}
+
 export interface OrderItem {
   id: number;
   product_id: number;
@@ -74,6 +80,18 @@ export interface Order {
   created_at: string;
 }
 
+export interface OrderStatusResult {
+  order_id: number;
+  success: boolean;
+  error: string | null;
+}
+
+export interface BulkOrderStatusResult {
+  status: string;
+  updated: number;
+  results: OrderStatusResult[];
+}
+
 export interface CartItem {
   product: Product;
   quantity: number;